@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+""" Compares two benchmark result files and exits with 1 if a benchmark got
+    slower than the threshold allows """
+from argparse import ArgumentParser
+from json import loads
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return loads(f.read())
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("base")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio of the minimum counted as regression")
+    args = parser.parse_args()
+
+    base = load(args.base)
+    current = load(args.current)
+    print("base %s, current %s" % (base['meta']['commit'], current['meta']['commit']))
+
+    regressions = 0
+    for name in sorted(set(base['results']) | set(current['results'])):
+        if name not in base['results'] or name not in current['results']:
+            print("%-45s only in %s" % (name, "base" if name in base['results'] else "current"))
+            continue
+        before = base['results'][name]['min']
+        after = current['results'][name]['min']
+        ratio = after / before if before else float("inf")
+        mark = ""
+        if ratio > args.threshold:
+            mark = "  REGRESSION"
+            regressions += 1
+        print("%-45s %9.2fms -> %9.2fms  x%.2f%s" % (name, before * 1000, after * 1000,
+                                                      ratio, mark))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+""" A stand-in for the pynvim vim object, it records the requests instead of
+    sending them to neovim """
+import re
+
+BUFNAME_REGEX = re.compile(r"bufname\((\d+)\)")
+
+
+class MockBuffer():
+
+    def __init__(self, number, name):
+        self.number = number
+        self.name = name
+        self.vars = {}
+        self.valid = True
+        self.lines = [""]
+
+    def __getitem__(self, index):
+        return self.lines[index]
+
+    def __setitem__(self, index, value):
+        self.lines[index] = value
+
+    def __len__(self):
+        return len(self.lines)
+
+
+class MockCurrent():
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+
+class MockApi():
+
+    def __init__(self, vim):
+        self.vim = vim
+
+    def call_atomic(self, requests):
+        self.vim.requests['call_atomic'] = self.vim.requests.get('call_atomic', 0) + 1
+        return [[0 for _ in requests], None]
+
+
+class MockVim():
+    """ Answers every request with an empty result and counts them per
+        method. Expressions asking for a buffer name are answered from the
+        mocked buffers """
+
+    def __init__(self):
+        self.buffers = {}
+        self.current = MockCurrent(self.add_buffer(""))
+        self.requests = {}
+        self.api = MockApi(self)
+
+    def add_buffer(self, name):
+        buffer = MockBuffer(len(self.buffers) + 1, name)
+        self.buffers[buffer.number] = buffer
+        return buffer
+
+    def __request(self, method):
+        self.requests[method] = self.requests.get(method, 0) + 1
+
+    def command(self, cmd):
+        self.__request("command")
+
+    def command_output(self, cmd):
+        self.__request("command_output")
+        return ""
+
+    def eval(self, expr):
+        self.__request("eval")
+        match = BUFNAME_REGEX.search(expr)
+        if match:
+            buffer = self.buffers.get(int(match.group(1)))
+            return buffer.name if buffer else ""
+        return "0"
+
+    def call(self, name, *args):
+        self.__request("call")
+        return 0
+
+    def request(self, method, *args):
+        self.__request("request")
+        return None
+
+    def async_call(self, func, *args):
+        self.__request("async_call")
+        func(*args)
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+""" Benchmarks the workspace handling of javim on synthetic maven workspaces.
+    Everything runs offline against a fake mvn and a mocked nvim, the home
+    directory is redirected to a temporary directory so the real workspace
+    and settings stay untouched.
+
+        python3 benchmarks/run.py --modules 10,100,500 --output results.json
+        python3 benchmarks/compare.py base.json results.json
+"""
+from argparse import ArgumentParser
+from json import dumps
+from os import environ, makedirs, chmod
+from os.path import join, dirname, abspath
+from statistics import median
+from subprocess import run
+from tempfile import mkdtemp
+from importlib.util import spec_from_file_location, module_from_spec
+import platform
+import random
+import shutil
+import sys
+import time
+
+BENCH_DIR = dirname(abspath(__file__))
+PLUGIN_DIR = join(dirname(BENCH_DIR), "plugin")
+sys.path.insert(0, BENCH_DIR)
+
+from mock_nvim import MockVim
+from workspace import generate_workspace, java_source
+
+
+def load_javim(home):
+    """ Points the home directory to home and registers the javim package
+        without running its __init__, the editor-only modules it imports
+        (tree-sitter, the buffer change dispatcher) are not benchmarked """
+    environ['HOME'] = home
+    environ['XDG_CONFIG_HOME'] = join(home, ".config")
+    environ.pop('APPDATA', None)
+    makedirs(environ['XDG_CONFIG_HOME'], exist_ok=True)
+
+    spec = spec_from_file_location("javim", join(PLUGIN_DIR, "javim", "__init__.py"),
+                                   submodule_search_locations=[join(PLUGIN_DIR, "javim")])
+    sys.modules['javim'] = module_from_spec(spec)
+
+    from javim.maven import Maven
+    from javim.settings import Workspace
+    return Maven, Workspace
+
+
+def measure(func, repeat, setup=None):
+    """ Runs func repeat times and returns the timings in seconds, setup
+        runs before every repetition and its result is passed to func """
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': median(timings), 'repeat': repeat}
+
+
+class Benchmarks():
+    """ Benchmarks on one synthetic workspace with a fixed module count """
+
+    def __init__(self, Maven, Workspace, root, modules, args):
+        self.Maven = Maven
+        self.Workspace = Workspace
+        self.root = root
+        self.modules = modules
+        self.args = args
+        self.source_dir = join(root, "sources-%i" % modules)
+        self.paths = generate_workspace(self.source_dir,
+                                        Maven.SETTINGS.repo_path(),
+                                        modules,
+                                        args.fanout,
+                                        args.libraries,
+                                        args.files,
+                                        args.file_lines,
+                                        args.seed)
+        self.workspaces = 0
+
+    def new_maven(self):
+        self.workspaces += 1
+        name = "bench %i %i" % (self.modules, self.workspaces)
+        workspace = self.Workspace(name, join(self.root, name.replace(" ", "-")))
+        maven = self.Maven(MockVim(), workspace)
+        return maven
+
+    def import_all(self, maven):
+        for path in self.paths:
+            maven.import_project(path)
+        return maven
+
+    def import_project(self, maven):
+        self.import_all(maven)
+
+    def run(self):
+        results = {}
+
+        def add(name, result):
+            if not result:
+                return
+            results["%s[modules=%i]" % (name, self.modules)] = result
+            print("%-45s min %9.2fms  median %9.2fms" % ("%s[modules=%i]" % (name, self.modules),
+                                                          result['min'] * 1000,
+                                                          result['median'] * 1000))
+
+        repeat = self.args.repeat
+        add("import_project", measure(self.import_project, repeat, self.new_maven))
+
+        maven = self.import_all(self.new_maven())
+        projects = list(maven.workspace.projects().values())
+
+        poms = [(project, maven.resolve_effective_pom(project)) for project in projects]
+        add("process_pom", measure(lambda _: [maven.process_pom(project, pom)
+                                              for project, pom in poms], repeat))
+
+        add("generate_classpath", measure(lambda _: [maven.generate_classpath(project)
+                                                     for project in projects],
+                                          repeat, lambda: self.clear_classpath(maven)))
+        add("generate_classpath_cached", measure(lambda _: [maven.generate_classpath(project)
+                                                            for project in projects],
+                                                 repeat))
+
+        add("workspace_load", measure(lambda _: self.load_workspace(maven), repeat,
+                                      lambda: self.save_workspace(maven)))
+
+        add("build_order", measure(lambda handler: maven.build_project_and_dependencies(projects[-1]),
+                                   repeat, lambda: self.prepare_build(maven)))
+
+        add("buf_enter", self.buf_enter(maven, repeat))
+
+        maven.job_handler.shutdown()
+        return results
+
+    def save_workspace(self, maven):
+        maven.workspace._save()
+        maven.graph._save()
+
+    def load_workspace(self, maven):
+        """ Reads the saved workspace and dependency graph like at startup """
+        from javim.graph import DependencyGraph
+        workspace = self.Workspace(maven.workspace.name(), maven.workspace.dir())
+        DependencyGraph(workspace)
+
+    def clear_classpath(self, maven):
+        for cache in maven.classpath_caches.values():
+            cache.set_key(None)
+
+    def prepare_build(self, maven):
+        """ Marks every project for a rebuild and swaps in a job handler
+            that only records the started jobs """
+        for project in maven.workspace.projects().values():
+            project['maven_config']['rebuild'] = True
+        maven.job_handler.shutdown()
+        maven.job_handler = RecordingJobHandler()
+        return maven.job_handler
+
+    def buf_enter(self, maven, repeat):
+        """ Looks up the project of a buffer for every source file """
+        package = sys.modules['javim']
+        try:
+            package.__spec__.loader.exec_module(package)
+        except Exception as e:
+            print("Skipping buf_enter, the plugin can't be loaded: %s" % e)
+            return None
+        Javim = package.Javim
+
+        javim = Javim.__new__(Javim)
+        javim.vim = maven.vim
+        javim.workspace = maven.workspace
+        javim._Javim__maven = maven
+        javim.buffers = {}
+        names = [join(path, "src", "main", "java", "Class%i.java" % index)
+                 for path in self.paths for index in range(self.args.files)]
+
+        def setup():
+            maven.vim.buffers.clear()
+            return [maven.vim.add_buffer(name).number for name in names]
+
+        return measure(lambda numbers: [javim.buf_enter(number) for number in numbers],
+                       repeat, setup)
+
+
+class RecordingJobHandler():
+
+    def __init__(self):
+        self.jobs = []
+
+    def start(self, job, visible=True, foreground=False):
+        self.jobs.append(job)
+
+    def shutdown(self):
+        pass
+
+
+def offset_chain_benchmark(args):
+    """ Applies random line edits to an offset chain of a large file """
+    from javim.util_classes import (OffsetChain, ReplaceRangeOffsetChainUpdate,
+                                    DeleteOffsetChainUpdate)
+    lines = java_source("bench", "Large", args.file_lines).split("\n")
+    rng = random.Random(args.seed)
+
+    def setup():
+        chain = OffsetChain()
+        for line in lines:
+            chain.append(len(line) + 1)
+        return chain
+
+    def edit(chain):
+        for _ in range(args.edits):
+            size = len(chain)
+            start = rng.randrange(size - 2)
+            end = start + rng.randint(1, 2)
+            if rng.random() < 0.8:
+                chain.mass_update(ReplaceRangeOffsetChainUpdate(start, end, [40, 20]))
+            else:
+                chain.mass_update(DeleteOffsetChainUpdate([start]))
+
+    results = {"offset_chain_build[lines=%i]" % args.file_lines:
+               measure(lambda _: setup(), args.repeat),
+               "offset_chain_edits[lines=%i,edits=%i]" % (args.file_lines, args.edits):
+               measure(edit, args.repeat, setup)}
+    for name, result in results.items():
+        print("%-45s min %9.2fms  median %9.2fms" % (name, result['min'] * 1000,
+                                                      result['median'] * 1000))
+    return results
+
+
+# pynvim is loaded by the python host before the plugin
+STARTUP_SCRIPT = """
+import sys, time
+import pynvim
+start = time.perf_counter()
+sys.path[:0] = [%(bench)r, %(plugin)r]
+from mock_nvim import MockVim
+from javim import Javim
+javim = Javim(MockVim())
+javim.buf_enter(javim.vim.add_buffer(%(file)r).number)
+print(time.perf_counter() - start)
+print(" ".join(name for name in %(heavy)r if name in sys.modules))
+"""
+
+# modules a quick edit outside of the workspace projects must not load
+STARTUP_HEAVY_MODULES = ("lxml", "tree_sitter", "javim.maven", "javim.jobs", "javim.java",
+                         "javim.buffer_change")
+
+
+def startup_benchmark(root, args):
+    """ Loads the plugin in a fresh interpreter and enters a buffer that
+        doesn't belong to a project, like opening nvim for a quick edit """
+    script = STARTUP_SCRIPT % {'bench': BENCH_DIR,
+                               'plugin': PLUGIN_DIR,
+                               'file': join(root, "notes.txt"),
+                               'heavy': STARTUP_HEAVY_MODULES}
+    timings = []
+    heavy = ""
+    for _ in range(args.repeat):
+        res = run([sys.executable, "-c", script], capture_output=True, encoding="utf-8",
+                  env=dict(environ))
+        if res.returncode:
+            print("Skipping startup, the plugin can't be loaded: %s"
+                  % res.stderr.strip().split("\n")[-1])
+            return {}, True
+        timing, heavy = (res.stdout.strip().split("\n") + [""])[:2]
+        timings.append(float(timing))
+
+    result = {'min': min(timings), 'median': median(timings), 'repeat': args.repeat}
+    within = result['min'] <= args.startup_budget / 1000 and not heavy
+    print("%-45s min %9.2fms  median %9.2fms  budget %.0fms%s"
+          % ("startup", result['min'] * 1000, result['median'] * 1000, args.startup_budget,
+             "" if within else "  EXCEEDED"))
+    if heavy:
+        print("Startup loaded %s" % heavy)
+    return {"startup": result}, within
+
+
+def document_benchmark(args):
+    """ Applies the random line edits of the offset chain benchmark to a
+        document and reads its source in chunks like tree-sitter does """
+    from javim.document import Document
+    lines = java_source("bench", "Large", args.file_lines).split("\n")
+    rng = random.Random(args.seed)
+
+    def edit(document):
+        for _ in range(args.edits):
+            start = rng.randrange(len(document) - 2)
+            end = start + rng.randint(1, 2)
+            if rng.random() < 0.8:
+                document.replace_lines(start, end, ["x" * 39, "y" * 19])
+            else:
+                document.replace_lines(start, start + 1, [])
+
+    def read(document):
+        byte = 0
+        chunk = document.read(byte)
+        while chunk:
+            byte += len(chunk)
+            chunk = document.read(byte)
+
+    results = {"document_build[lines=%i]" % args.file_lines:
+               measure(lambda _: Document(lines), args.repeat),
+               "document_edits[lines=%i,edits=%i]" % (args.file_lines, args.edits):
+               measure(edit, args.repeat, lambda: Document(lines)),
+               "document_read[lines=%i]" % args.file_lines:
+               measure(read, args.repeat, lambda: Document(lines))}
+    for name, result in results.items():
+        print("%-45s min %9.2fms  median %9.2fms" % (name, result['min'] * 1000,
+                                                      result['median'] * 1000))
+    return results
+
+
+def daemon_benchmark(root, fake_mvn, args):
+    """ Runs the lifecycle of the maven daemon against the fake mvnd: the
+        cold start, the health check of a warm daemon and the fallback to
+        mvn once the daemon died. Returns the timings and whether the builds
+        were submitted to the expected executable """
+    from javim.daemon import MavenDaemon
+    client = join(root, "mvnd")
+    shutil.copyfile(fake_mvn, client)
+    chmod(client, 0o755)
+    daemon = MavenDaemon(client, fake_mvn)
+
+    results = {"daemon_start": measure(lambda _: daemon.ensure(), args.repeat, daemon.stop),
+               "daemon_check": measure(lambda _: daemon.ensure(), args.repeat)}
+    healthy = daemon.executable() == client
+
+    # the daemon dies behind the plugin's back, the next build fails
+    run([client, "--stop"], capture_output=True)
+    died = run([daemon.executable(), "compile"], capture_output=True, cwd=root).returncode != 0
+    daemon.alive = daemon.status()
+    fallback = died and daemon.executable() == fake_mvn
+    restarted = daemon.ensure() and daemon.executable() == client
+
+    for name, result in results.items():
+        print("%-45s min %9.2fms  median %9.2fms" % (name, result['min'] * 1000,
+                                                      result['median'] * 1000))
+    working = healthy and fallback and restarted
+    if not working:
+        print("Daemon lifecycle FAILED: healthy %s, fallback %s, restarted %s"
+              % (healthy, fallback, restarted))
+    return results, working
+
+
+def git_commit():
+    res = run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+              encoding="utf-8", cwd=BENCH_DIR)
+    return res.stdout.strip() if res.returncode == 0 else None
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--modules", default="10,100",
+                        help="comma separated module counts")
+    parser.add_argument("--fanout", type=int, default=3,
+                        help="dependencies per module")
+    parser.add_argument("--libraries", type=int, default=20,
+                        help="library artifacts in the local repository")
+    parser.add_argument("--files", type=int, default=2,
+                        help="java files per module")
+    parser.add_argument("--file-lines", type=int, default=5000,
+                        help="lines per java file")
+    parser.add_argument("--edits", type=int, default=200,
+                        help="edits applied to the offset chain")
+    parser.add_argument("--startup-budget", type=float, default=100,
+                        help="milliseconds loading the plugin may take, exits with 1 "
+                             "if exceeded")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--maven", action="store_true",
+                        help="resolve poms and classpaths through the fake mvn "
+                             "instead of natively")
+    parser.add_argument("--output", help="write the results as json to this file")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the generated workspaces")
+    args = parser.parse_args()
+
+    root = mkdtemp(prefix="javim-bench-")
+    fake_mvn = join(root, "mvn")
+    shutil.copyfile(join(BENCH_DIR, "fake_mvn"), fake_mvn)
+    chmod(fake_mvn, 0o755)
+
+    try:
+        Maven, Workspace = load_javim(root)
+        Maven.SETTINGS.set_executable(fake_mvn)
+        Maven.SETTINGS.set_repo_path(join(root, ".m2", "repository"))
+        Maven.SETTINGS.set_native_pom_resolver(not args.maven)
+        Maven.SETTINGS.set_offline_classpath(not args.maven)
+        Maven.SETTINGS.set_daemon(False)
+        Maven.SETTINGS.set_reactor_build(False)
+        Maven.SETTINGS.set_incremental_compile(False)
+
+        results, within_budget = startup_benchmark(root, args)
+        for modules in map(int, args.modules.split(",")):
+            results.update(Benchmarks(Maven, Workspace, root, modules, args).run())
+        results.update(offset_chain_benchmark(args))
+        results.update(document_benchmark(args))
+        daemon_results, daemon_working = daemon_benchmark(root, fake_mvn, args)
+        results.update(daemon_results)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {'meta': {'commit': git_commit(),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'time': time.time(),
+                       'args': vars(args)},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(dumps(report, indent=4))
+    return 0 if within_budget and daemon_working else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+""" Loads javim like the benchmarks do, with the home directory pointed to
+    a temporary directory so the real settings stay untouched """
+from os.path import join, dirname, abspath
+from tempfile import mkdtemp
+import sys
+
+import pytest
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from run import load_javim
+
+load_javim(mkdtemp(prefix="javim-tests-"))
+
+
+POM_TEMPLATE = ("<project xmlns=\"http://maven.apache.org/POM/4.0.0\">"
+                "<modelVersion>4.0.0</modelVersion>%s</project>")
+
+
+@pytest.fixture
+def write_pom(tmp_path):
+    """ Writes a pom with the provided body below tmp_path, returns its
+        path """
+    def write(directory, body):
+        path = tmp_path / directory / "pom.xml"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(POM_TEMPLATE % body)
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def repo_pom(tmp_path):
+    """ Installs a pom into the local repository below tmp_path """
+    def install(group_id, artifact_id, version, body=""):
+        path = (tmp_path / "repo" / join(*group_id.split(".")) / artifact_id / version
+                / ("%s-%s.pom" % (artifact_id, version)))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(POM_TEMPLATE % ("<groupId>%s</groupId><artifactId>%s</artifactId>"
+                                        "<version>%s</version>%s"
+                                        % (group_id, artifact_id, version, body)))
+        return str(path)
+    return install
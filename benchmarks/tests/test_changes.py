@@ -0,0 +1,109 @@
+from os import utime, remove
+from os.path import realpath
+import time
+
+import pytest
+
+from javim.changes import SourceManifest
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    for directory in ["src/main/java/a", "src/main/resources", "target/classes/a",
+                      ".settings"]:
+        (root / directory).mkdir(parents=True)
+    (root / "pom.xml").write_text("<project/>")
+    (root / "src/main/java/a/A.java").write_text("class A {}")
+    (root / "src/main/resources/app.properties").write_text("a=1")
+    path = realpath(str(root))
+    return {'name': "project",
+            'path': path,
+            'settings_dir': path + "/.settings",
+            'maven_config': {'source_dirs': [path + "/src/main/java"],
+                             'test_source_dirs': [],
+                             'resource_dirs': [path + "/src/main/resources"],
+                             'test_resource_dirs': [],
+                             'output_dir': path + "/target/classes",
+                             'test_output_dir': path + "/target/test-classes"}}
+
+
+def build(project, *classes):
+    """ Writes the outputs of a build, newer than every source """
+    for name in classes:
+        path = "%s/target/classes/a/%s" % (project['path'], name)
+        with open(path, 'w') as f:
+            f.write("")
+        later = time.time() + 10
+        utime(path, (later, later))
+
+
+def test_output_path(project):
+    manifest = SourceManifest(project)
+    path = project['path']
+
+    assert manifest.output_path(path + "/src/main/java/a/A.java") == \
+        path + "/target/classes/a/A.class"
+    assert manifest.output_path(path + "/src/main/resources/app.properties") == \
+        path + "/target/classes/app.properties"
+    assert manifest.output_path(path + "/src/main/java/a/notes.txt") is None
+    assert manifest.is_input(path + "/pom.xml")
+    assert not manifest.is_input(path + "/README.md")
+
+
+def test_update_tracks_content_changes(project):
+    manifest = SourceManifest(project)
+    source = project['path'] + "/src/main/java/a/A.java"
+
+    assert manifest.update(source)
+    assert manifest.dirty() == [source]
+
+    build(project, "A.class")
+    manifest.record()
+    assert manifest.dirty() == []
+    assert not manifest.update(source)
+
+    with open(source, 'w') as f:
+        f.write("class A { int a; }")
+    assert manifest.update(source)
+    assert manifest.dirty() == [source]
+
+    # saving the built content again isn't a change
+    with open(source, 'w') as f:
+        f.write("class A {}")
+    assert not manifest.update(source)
+    assert manifest.dirty() == []
+
+
+def test_update_ignores_other_files(project):
+    manifest = SourceManifest(project)
+    with open(project['path'] + "/README.md", 'w') as f:
+        f.write("readme")
+
+    assert not manifest.update(project['path'] + "/README.md")
+    assert manifest.dirty() == []
+
+
+def test_files_saved_while_building_stay_dirty(project):
+    manifest = SourceManifest(project)
+    source = project['path'] + "/src/main/java/a/A.java"
+    with open(project['path'] + "/target/classes/a/A.class", 'w') as f:
+        f.write("")
+    earlier = time.time() - 10
+    utime(project['path'] + "/target/classes/a/A.class", (earlier, earlier))
+
+    manifest.record()
+
+    assert manifest.dirty() == [source]
+
+
+def test_orphans_of_deleted_sources(project):
+    manifest = SourceManifest(project)
+    build(project, "A.class", "A$1.class", "A$Inner.class", "AB.class")
+    manifest.record()
+    source = project['path'] + "/src/main/java/a/A.java"
+    remove(source)
+
+    assert manifest.deleted() == [source]
+    assert sorted(path.rsplit("/", 1)[1] for path in manifest.orphans()) == \
+        ["A$1.class", "A$Inner.class", "A.class"]
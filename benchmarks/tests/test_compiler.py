@@ -0,0 +1,63 @@
+from os.path import realpath
+
+import pytest
+
+from javim.compiler import IncrementalCompiler
+
+
+def java_project(root, name, sources):
+    path = root / name
+    (path / "src/main/java/pkg").mkdir(parents=True)
+    (path / "pom.xml").write_text("<project/>")
+    for file_name, source in sources.items():
+        (path / "src/main/java/pkg" / file_name).write_text(source)
+    path = realpath(str(path))
+    return {'name': name,
+            'path': path,
+            'java_config': {'source': "11", 'target': "11"},
+            'maven_config': {'source_dirs': [path + "/src/main/java"],
+                             'test_source_dirs': [],
+                             'output_dir': path + "/target/classes",
+                             'test_output_dir': path + "/target/test-classes",
+                             'properties': {},
+                             'classpath': path + "/target/classes",
+                             'last_built': 1}}
+
+
+@pytest.fixture
+def projects(tmp_path):
+    lib = java_project(tmp_path, "lib", {'Lib.java': "package pkg;\npublic class Lib {}\n"})
+    app = java_project(tmp_path, "app", {'Uses.java': "package pkg;\nclass Uses { Lib lib; }\n",
+                                         'Other.java': "package pkg;\nclass Other {}\n"})
+    return lib, app
+
+
+def test_dependent_without_dirty_files(projects):
+    lib, app = projects
+    compiler = IncrementalCompiler()
+    changed = [lib['path'] + "/src/main/java/pkg/Lib.java"]
+
+    assert not compiler.can_compile(app, [])
+    assert compiler.can_compile(app, [], changed)
+
+    commands = compiler.commands(app, [], changed)
+    assert len(commands) == 1
+    assert "Uses.java" in commands[0]
+    assert "Other.java" not in commands[0]
+    assert "Lib.java" not in commands[0]
+
+
+def test_dependent_not_referencing_upstream_types(projects):
+    lib, app = projects
+    changed = [app['path'] + "/src/main/java/pkg/Other.java"]
+
+    assert IncrementalCompiler().commands(lib, [], changed) == []
+
+
+def test_dirty_sources_and_their_dependents(projects):
+    _, app = projects
+    dirty = [app['path'] + "/src/main/java/pkg/Other.java"]
+
+    commands = IncrementalCompiler().commands(app, dirty)
+    assert "Other.java" in commands[0]
+    assert "Uses.java" not in commands[0]
@@ -0,0 +1,82 @@
+import random
+
+from javim.document import Document
+
+
+def source(lines):
+    return "".join(line + "\n" for line in lines).encode("utf-8")
+
+
+def test_lines_and_offsets():
+    document = Document(["class A {", "  // ä", "}"])
+
+    assert len(document) == 3
+    assert document.lines() == ["class A {", "  // ä", "}"]
+    assert document.line(1) == "  // ä"
+    assert document.text() == source(["class A {", "  // ä", "}"])
+    assert document.byte_size() == 20
+    assert [document.line_offset(i) for i in range(4)] == [0, 10, 18, 20]
+    assert document.byte_to_point(14) == (1, 4)
+    assert document.byte_to_point(20) == (3, 0)
+
+
+def test_replace_lines():
+    document = Document(["a", "b", "c", "d"])
+
+    document.replace_lines(1, 3, ["x", "y", "z"])
+    assert document.lines() == ["a", "x", "y", "z", "d"]
+
+    document.replace_lines(0, 2, [])
+    assert document.lines() == ["y", "z", "d"]
+
+    document.replace_lines(3, 3, ["e"])
+    assert document.lines() == ["y", "z", "d", "e"]
+
+
+def test_replace_bytes():
+    document = Document(["int a;", "int b;"])
+
+    document.replace(4, 5, "x = 1")
+    assert document.lines() == ["int x = 1;", "int b;"]
+
+    # joins the lines
+    document.replace(10, 11, " ")
+    assert document.lines() == ["int x = 1; int b;"]
+
+    document.replace(10, 11, "\n\n")
+    assert document.lines() == ["int x = 1;", "", "int b;"]
+
+
+def test_read_chunks():
+    lines = ["line %i" % i for i in range(2000)]
+    document = Document(lines)
+
+    chunks = []
+    byte = 0
+    chunk = document.read(byte)
+    while chunk:
+        assert len(chunk) >= Document.CHUNK_SIZE or byte + len(chunk) == document.byte_size()
+        chunks.append(chunk)
+        byte += len(chunk)
+        chunk = document.read(byte)
+
+    assert b"".join(chunks) == source(lines)
+    assert document.read(5) == source(lines)[5:5 + len(document.read(5))]
+
+
+def test_random_edits_match_a_list():
+    rng = random.Random(1)
+    lines = ["line %i" % i for i in range(50)]
+    document = Document(lines)
+
+    for _ in range(500):
+        start = rng.randrange(len(lines) + 1)
+        end = min(len(lines), start + rng.randrange(3))
+        new = ["edit %i" % rng.randrange(100) for _ in range(rng.randrange(3))]
+        lines[start:end] = new
+        document.replace_lines(start, end, new)
+
+    assert document.lines() == lines
+    assert document.text() == source(lines)
+    for index in range(len(lines)):
+        assert document.line_offset(index) == len(source(lines[:index]))
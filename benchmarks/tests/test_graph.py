@@ -0,0 +1,82 @@
+import pytest
+
+from javim.graph import DependencyGraph, DependencyCycleError
+
+
+class FakeWorkspace():
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.project_configs = {}
+
+    def settings_dir(self):
+        return self.directory
+
+    def projects(self):
+        return self.project_configs
+
+    def add(self, name, *requires):
+        self.project_configs[name] = {
+            'name': name,
+            'maven_info': {'groupId': "g", 'artifactId': name, 'version': "1"},
+            'maven_config': {'dependencies': {"g:%s:1" % dep: {} for dep in requires},
+                             'dep_projects': []}}
+        return self.project_configs[name]
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    return FakeWorkspace(str(tmp_path))
+
+
+def test_links_projects_by_coordinates(workspace):
+    workspace.add("app", "core", "util", "guava")
+    workspace.add("core", "util")
+    workspace.add("util")
+    graph = DependencyGraph(workspace)
+
+    assert graph.dependencies("app") == ["core", "util"]
+    assert graph.dependents("util") == {"app", "core"}
+    assert workspace.projects()['app']['maven_config']['dep_projects'] == ["core", "util"]
+    assert graph.build_order("app") == ["util", "core", "app"]
+    assert graph.build_order("core") == ["util", "core"]
+
+
+def test_update_and_remove_relink_dependents(workspace):
+    workspace.add("app", "core")
+    graph = DependencyGraph(workspace)
+    assert graph.dependencies("app") == []
+
+    graph.update_projects([workspace.add("core")])
+    assert graph.dependencies("app") == ["core"]
+
+    graph.remove_project("core")
+    del workspace.projects()['core']
+    assert graph.dependencies("app") == []
+    assert graph.build_order("app") == ["app"]
+
+
+def test_cycle_is_named(workspace):
+    workspace.add("a", "b")
+    workspace.add("b", "c")
+    workspace.add("c", "a")
+    workspace.add("d", "a")
+    graph = DependencyGraph(workspace)
+
+    with pytest.raises(DependencyCycleError) as error:
+        graph.order()
+
+    assert error.value.cycle == ["a", "b", "c", "a"]
+    assert str(error.value) == "Dependency cycle: a -> b -> c -> a"
+
+
+def test_cycle_elsewhere_doesnt_block_builds(workspace):
+    workspace.add("a", "b")
+    workspace.add("b", "a")
+    workspace.add("app", "lib")
+    workspace.add("lib")
+    graph = DependencyGraph(workspace)
+
+    assert graph.build_order("app") == ["lib", "app"]
+    with pytest.raises(DependencyCycleError):
+        graph.build_order("a")
@@ -0,0 +1,119 @@
+from javim.jobs import Job, JobGraph, JobResult
+import pytest
+
+
+class FakeHandler():
+    """ Records the started jobs, the test finishes them """
+
+    def __init__(self):
+        self.started = []
+
+    def start(self, job, visible=True, foreground=False):
+        self.started.append(job)
+
+    def finish(self, job, return_code=0):
+        job.on_exit(JobResult(return_code, "", ""))
+
+
+def names(jobs, handler):
+    return [name for job in handler.started for name, job_ in jobs.items() if job is job_]
+
+
+def test_deferred_job_blocks_dependents_until_complete():
+    handler = FakeHandler()
+    done = []
+    deferred = []
+
+    def on_exit(result):
+        jobs['lib'].defer()
+        deferred.append(jobs['lib'].complete)
+
+    jobs = {'lib': Job("build", ".", "true", on_exit), 'app': Job("build", ".", "true")}
+    graph = JobGraph(done.append)
+    graph.add("lib", jobs['lib'])
+    graph.add("app", jobs['app'], ["lib"])
+    graph.start(handler, 2)
+
+    handler.finish(jobs['lib'])
+    assert names(jobs, handler) == ["lib"]
+
+    deferred.pop()()
+    assert names(jobs, handler) == ["lib", "app"]
+    handler.finish(jobs['app'])
+    assert done == [True]
+
+
+def test_failing_prerequisite_drops_only_its_dependents():
+    handler = FakeHandler()
+    done = []
+    jobs = {'lib': Job("build", ".", "true", fail_clear=True),
+            'app': Job("build", ".", "true"),
+            'tool': Job("build", ".", "true"),
+            'tool-app': Job("build", ".", "true")}
+    graph = JobGraph(done.append)
+    graph.add("lib", jobs['lib'])
+    graph.add("app", jobs['app'], ["lib"])
+    graph.add("tool", jobs['tool'])
+    graph.add("tool-app", jobs['tool-app'], ["tool"])
+    graph.start(handler, 2)
+
+    handler.finish(jobs['lib'], 1)
+    assert graph.dropped == {"app"}
+    assert done == []
+
+    handler.finish(jobs['tool'])
+    handler.finish(jobs['tool-app'])
+    assert names(jobs, handler) == ["lib", "tool", "tool-app"]
+    assert done == [False]
+
+
+def test_failure_without_fail_clear_keeps_dependents():
+    handler = FakeHandler()
+    done = []
+    jobs = {'lib': Job("build", ".", "true"), 'app': Job("build", ".", "true")}
+    graph = JobGraph(done.append)
+    graph.add("lib", jobs['lib'])
+    graph.add("app", jobs['app'], ["lib"])
+    graph.start(handler, 1)
+
+    handler.finish(jobs['lib'], 1)
+    handler.finish(jobs['app'])
+    assert names(jobs, handler) == ["lib", "app"]
+    assert done == [False]
+
+
+def test_worker_cap():
+    handler = FakeHandler()
+    done = []
+    jobs = {name: Job("build", ".", "true") for name in ["a", "b", "c"]}
+    graph = JobGraph(done.append)
+    for name, job in jobs.items():
+        graph.add(name, job)
+    graph.start(handler, 2)
+
+    assert names(jobs, handler) == ["a", "b"]
+    handler.finish(jobs['b'])
+    assert names(jobs, handler) == ["a", "b", "c"]
+    handler.finish(jobs['a'])
+    handler.finish(jobs['c'])
+    assert done == [True]
+
+
+def test_on_exit_error_drops_dependents():
+    handler = FakeHandler()
+    done = []
+
+    def on_exit(result):
+        raise RuntimeError("classpath")
+
+    jobs = {'lib': Job("build", ".", "true", on_exit), 'app': Job("build", ".", "true")}
+    graph = JobGraph(done.append)
+    graph.add("lib", jobs['lib'])
+    graph.add("app", jobs['app'], ["lib"])
+    graph.start(handler, 2)
+
+    with pytest.raises(RuntimeError):
+        handler.finish(jobs['lib'])
+    assert names(jobs, handler) == ["lib"]
+    assert graph.dropped == {"app"}
+    assert done == [False]
@@ -0,0 +1,38 @@
+import pytest
+
+from javim.maven import Maven
+from javim.settings import Workspace
+from mock_nvim import MockVim
+
+from test_pom import dependency
+
+
+PROFILE = "<profile><id>%s</id><dependencies>%s</dependencies></profile>"
+
+
+@pytest.fixture
+def maven(tmp_path):
+    Maven.SETTINGS.set_native_pom_resolver(True)
+    Maven.SETTINGS.set_daemon(False)
+    Maven.SETTINGS.set_repo_path(str(tmp_path / "repo"))
+    maven = Maven(MockVim(), Workspace("tests", str(tmp_path / "workspace")))
+    yield maven
+    maven.job_handler.shutdown()
+
+
+def test_only_selected_profiles_are_resolved(tmp_path, maven, write_pom):
+    write_pom("app", "<groupId>g</groupId><artifactId>app</artifactId><version>1</version>"
+                     "<profiles>%s%s</profiles>"
+                     % (PROFILE % ("a", dependency("g", "only-a", "1")),
+                        PROFILE % ("b", dependency("g", "only-b", "1"))))
+    project = maven.analyze_project(str(tmp_path / "app"))
+    assert sorted(project['maven_config']['profiles']) == ["a", "b"]
+    assert project['maven_config']['dependencies'] == {}
+
+    # the pom is resolved again like after saving it
+    maven.process_pom(project, maven.resolve_effective_pom(project))
+    assert project['maven_config']['dependencies'] == {}
+
+    project['maven_config']['selected_profiles'] = ["b"]
+    maven.process_pom(project, maven.resolve_effective_pom(project))
+    assert list(project['maven_config']['dependencies']) == ["g:only-b:1"]
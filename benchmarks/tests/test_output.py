@@ -0,0 +1,77 @@
+from collections import deque
+from javim.output import compiler_messages, coroutine, output_pipeline
+from mock_nvim import MockVim
+
+
+@coroutine
+def collect(entries):
+    while True:
+        entries.append((yield))
+
+
+def parse(lines):
+    entries = []
+    parser = compiler_messages(collect(entries))
+    for line in lines:
+        parser.send(line)
+    return entries
+
+
+def test_maven_message():
+    entries = parse(["[INFO] Compiling 2 source files",
+                     "[ERROR] /src/App.java:[12,8] cannot find symbol",
+                     "[WARNING] /src/Lib.java:[3,1] deprecated",
+                     None])
+
+    assert entries == [{'filename': "/src/App.java", 'lnum': 12, 'col': 8,
+                        'type': "E", 'text': "cannot find symbol"},
+                       {'filename': "/src/Lib.java", 'lnum': 3, 'col': 1,
+                        'type': "W", 'text': "deprecated"}]
+
+
+def test_javac_message():
+    entries = parse(["/src/App.java:7: error: ';' expected",
+                     "/src/Lib.java:9: warning: [unchecked] unchecked call",
+                     None])
+
+    assert entries == [{'filename': "/src/App.java", 'lnum': 7, 'col': 0,
+                        'type': "E", 'text': "';' expected"},
+                       {'filename': "/src/Lib.java", 'lnum': 9, 'col': 0,
+                        'type': "W", 'text': "[unchecked] unchecked call"}]
+
+
+def test_details_are_folded_into_the_message():
+    entries = parse(["[ERROR] /src/App.java:[12,8] cannot find symbol",
+                     "[ERROR]   symbol:   class Lib",
+                     "[ERROR]   location: class App",
+                     "/src/Other.java:3: error: cannot find symbol",
+                     "  symbol:   variable x",
+                     "[INFO] BUILD FAILURE",
+                     "  symbol:   ignored without a message"])
+
+    assert [e['text'] for e in entries] == [
+        "cannot find symbol (symbol: class Lib) (location: class App)",
+        "cannot find symbol (symbol: variable x)"]
+
+
+def test_pending_message_is_flushed_on_none():
+    entries = []
+    parser = compiler_messages(collect(entries))
+    parser.send("[ERROR] /src/App.java:[1,1] broken")
+    assert entries == []
+
+    parser.send(None)
+    assert [e['text'] for e in entries] == ["broken"]
+
+    parser.send(None)
+    parser.send("[ERROR]   symbol: class Lib")
+    parser.send(None)
+    assert len(entries) == 1
+
+
+def test_output_pipeline_keeps_the_last_lines():
+    pipeline, lines = output_pipeline(MockVim(), 2, True)
+    for line in ["a", "[ERROR] /src/App.java:[1,1] broken", "b", None]:
+        pipeline.send(line)
+
+    assert lines == deque(["[ERROR] /src/App.java:[1,1] broken", "b"])
@@ -0,0 +1,118 @@
+from javim.pom import PomResolver, PomResolutionError
+import pytest
+
+
+def dependency(group_id, artifact_id, version=None, scope=None, dep_type=None):
+    return ("<dependency><groupId>%s</groupId><artifactId>%s</artifactId>%s%s%s</dependency>"
+            % (group_id, artifact_id,
+               "<version>%s</version>" % version if version else "",
+               "<type>%s</type>" % dep_type if dep_type else "",
+               "<scope>%s</scope>" % scope if scope else ""))
+
+
+def test_interpolation(tmp_path, write_pom):
+    path = write_pom("app", "<groupId>org.example</groupId><artifactId>app</artifactId>"
+                            "<version>${revision}</version>"
+                            "<name>${project.artifactId}-${lib.version}</name>"
+                            "<properties><revision>1.2</revision>"
+                            "<lib.version>${project.version}.0</lib.version></properties>"
+                            "<dependencies>%s</dependencies>"
+                            % dependency("org.example", "lib", "${lib.version}"))
+
+    model = PomResolver(str(tmp_path / "repo")).resolve(path)
+
+    assert model['version'] == "1.2"
+    assert model['name'] == "app-1.2.0"
+    assert model['dependencies'][0]['version'] == "1.2.0"
+    assert model['build']['directory'] == str(tmp_path / "app" / "target")
+
+
+def test_interpolation_inherits_parent_properties(tmp_path, write_pom):
+    write_pom("parent", "<groupId>org.example</groupId><artifactId>parent</artifactId>"
+                        "<version>2</version><packaging>pom</packaging>"
+                        "<properties><lib.version>3.1</lib.version></properties>")
+    path = write_pom("parent/child",
+                     "<parent><groupId>org.example</groupId><artifactId>parent</artifactId>"
+                     "<version>2</version></parent><artifactId>child</artifactId>"
+                     "<dependencies>%s</dependencies>"
+                     % dependency("org.example", "lib", "${lib.version}"))
+
+    model = PomResolver(str(tmp_path / "repo")).resolve(path)
+
+    assert model['groupId'] == "org.example"
+    assert model['version'] == "2"
+    assert model['dependencies'][0]['version'] == "3.1"
+
+
+def test_recursive_expression(tmp_path, write_pom):
+    path = write_pom("app", "<groupId>g</groupId><artifactId>app</artifactId>"
+                            "<version>${a}</version>"
+                            "<properties><a>${b}</a><b>${a}</b></properties>")
+
+    with pytest.raises(PomResolutionError):
+        PomResolver(str(tmp_path / "repo")).resolve(path)
+
+
+def test_bom_import(tmp_path, write_pom, repo_pom):
+    repo_pom("org.example", "bom", "1",
+             "<packaging>pom</packaging><dependencyManagement><dependencies>%s%s"
+             "</dependencies></dependencyManagement>"
+             % (dependency("org.example", "lib", "4.0", "test"),
+                dependency("org.example", "other", "5.0")))
+    path = write_pom("app", "<groupId>g</groupId><artifactId>app</artifactId><version>1</version>"
+                            "<dependencyManagement><dependencies>%s%s</dependencies>"
+                            "</dependencyManagement><dependencies>%s%s</dependencies>"
+                            % (dependency("org.example", "bom", "1", "import", "pom"),
+                               dependency("org.example", "other", "6.0"),
+                               dependency("org.example", "lib"),
+                               dependency("org.example", "other")))
+
+    model = PomResolver(str(tmp_path / "repo")).resolve(path)
+    versions = {dep['artifactId']: (dep['version'], dep['scope'])
+                for dep in model['dependencies']}
+
+    assert versions == {'lib': ("4.0", "test"), 'other': ("6.0", "compile")}
+    assert not any(dep['artifactId'] == "bom" for dep in model['dependencyManagement'])
+
+
+def test_missing_bom(tmp_path, write_pom):
+    path = write_pom("app", "<groupId>g</groupId><artifactId>app</artifactId><version>1</version>"
+                            "<dependencyManagement><dependencies>%s</dependencies>"
+                            "</dependencyManagement>"
+                            % dependency("org.example", "bom", "1", "import", "pom"))
+
+    with pytest.raises(PomResolutionError):
+        PomResolver(str(tmp_path / "repo")).resolve(path)
+
+
+def test_settings_profiles(tmp_path, write_pom):
+    settings = tmp_path / "settings.xml"
+    settings.write_text("<settings xmlns=\"http://maven.apache.org/SETTINGS/1.0.0\">"
+                        "<profiles><profile><id>env</id>"
+                        "<activation><activeByDefault>true</activeByDefault></activation>"
+                        "<properties><env>ci</env><lib.version>2.0</lib.version></properties>"
+                        "</profile></profiles>"
+                        "<activeProfiles><activeProfile>extra</activeProfile></activeProfiles>"
+                        "</settings>")
+    path = write_pom("app", "<groupId>g</groupId><artifactId>app</artifactId><version>1</version>"
+                            "<properties><lib.version>1.0</lib.version></properties>"
+                            "<dependencies>%s</dependencies><profiles>"
+                            "<profile><id>ci</id><activation><property><name>env</name>"
+                            "<value>ci</value></property></activation>"
+                            "<dependencies>%s</dependencies></profile>"
+                            "<profile><id>extra</id><dependencies>%s</dependencies></profile>"
+                            "</profiles>"
+                            % (dependency("org.example", "lib", "${lib.version}"),
+                               dependency("org.example", "ci-only", "1"),
+                               dependency("org.example", "extra", "1")))
+
+    model = PomResolver(str(tmp_path / "repo"), settings_path=str(settings)).resolve(path)
+    versions = {dep['artifactId']: dep['version'] for dep in model['dependencies']}
+
+    assert versions == {'lib': "2.0", 'ci-only': "1", 'extra': "1"}
+
+    model = PomResolver(str(tmp_path / "repo"), settings_path=str(tmp_path / "none.xml"),
+                        user_properties={'lib.version': "3.0"}).resolve(path, ["!extra"])
+    versions = {dep['artifactId']: dep['version'] for dep in model['dependencies']}
+
+    assert versions == {'lib': "3.0"}
@@ -0,0 +1,57 @@
+from javim.pom import PomResolver
+from javim.repository import LocalRepository
+
+from test_pom import dependency
+
+
+def resolve(tmp_path, write_pom, dependencies):
+    repo_path = str(tmp_path / "repo")
+    resolver = PomResolver(repo_path)
+    path = write_pom("app", "<groupId>g</groupId><artifactId>app</artifactId><version>1</version>"
+                            "<dependencies>%s</dependencies>" % "".join(dependencies))
+    deps = LocalRepository(repo_path, resolver).dependencies(resolver.resolve(path))
+    return {dep['artifactId']: (dep['version'], dep['scope']) for dep in deps}
+
+
+def test_nearest_wins(tmp_path, write_pom, repo_pom):
+    repo_pom("g", "a", "1", "<dependencies>%s</dependencies>" % dependency("g", "c", "1"))
+    repo_pom("g", "b", "1", "<dependencies>%s</dependencies>" % dependency("g", "d", "1"))
+    repo_pom("g", "d", "1", "<dependencies>%s</dependencies>" % dependency("g", "c", "2"))
+    repo_pom("g", "c", "1")
+    repo_pom("g", "c", "2")
+
+    deps = resolve(tmp_path, write_pom, [dependency("g", "b", "1"), dependency("g", "a", "1")])
+
+    assert deps['c'] == ("1", "compile")
+    assert deps['d'] == ("1", "compile")
+
+
+def test_first_declaration_wins_on_equal_depth(tmp_path, write_pom, repo_pom):
+    repo_pom("g", "a", "1", "<dependencies>%s</dependencies>" % dependency("g", "c", "1"))
+    repo_pom("g", "b", "1", "<dependencies>%s</dependencies>" % dependency("g", "c", "2"))
+    repo_pom("g", "c", "1")
+    repo_pom("g", "c", "2")
+
+    deps = resolve(tmp_path, write_pom, [dependency("g", "b", "1"), dependency("g", "a", "1")])
+
+    assert deps['c'] == ("2", "compile")
+
+
+def test_direct_dependency_wins(tmp_path, write_pom, repo_pom):
+    repo_pom("g", "a", "1", "<dependencies>%s</dependencies>" % dependency("g", "c", "2"))
+    repo_pom("g", "c", "1")
+    repo_pom("g", "c", "2")
+
+    deps = resolve(tmp_path, write_pom, [dependency("g", "a", "1"), dependency("g", "c", "1")])
+
+    assert deps['c'] == ("1", "compile")
+
+
+def test_transitive_scopes(tmp_path, write_pom, repo_pom):
+    repo_pom("g", "a", "1", "<dependencies>%s%s</dependencies>"
+             % (dependency("g", "t", "1", "test"), dependency("g", "r", "1", "runtime")))
+    repo_pom("g", "r", "1")
+
+    deps = resolve(tmp_path, write_pom, [dependency("g", "a", "1", "provided")])
+
+    assert deps == {'a': ("1", "provided"), 'r': ("1", "provided")}
@@ -0,0 +1,46 @@
+from javim.util_classes import PathTrie
+
+
+def test_find_deepest_directory():
+    trie = PathTrie()
+    trie.insert("/ws/parent", "parent")
+    trie.insert("/ws/parent/module", "module")
+
+    assert trie.find("/ws/parent/pom.xml") == "parent"
+    assert trie.find("/ws/parent/module/src/A.java") == "module"
+    assert trie.find("/ws/parent/module") == "module"
+    assert trie.find("/ws/parent/module-b/A.java") == "parent"
+    assert trie.find("/ws/other/A.java") is None
+    assert trie.find("/ws") is None
+
+
+def test_remove():
+    trie = PathTrie()
+    trie.insert("/ws/parent", "parent")
+    trie.insert("/ws/parent/module", "module")
+
+    trie.remove("/ws/parent/module")
+    assert trie.find("/ws/parent/module/src/A.java") == "parent"
+
+    trie.remove("/ws/parent")
+    assert trie.find("/ws/parent/module/src/A.java") is None
+    assert trie.root == {}
+
+
+def test_remove_keeps_nested_directories():
+    trie = PathTrie()
+    trie.insert("/ws/parent", "parent")
+    trie.insert("/ws/parent/module", "module")
+
+    trie.remove("/ws/parent")
+    trie.remove("/ws/unknown/path")
+
+    assert trie.find("/ws/parent/pom.xml") is None
+    assert trie.find("/ws/parent/module/pom.xml") == "module"
+
+
+def test_trailing_and_repeated_slashes():
+    trie = PathTrie()
+    trie.insert("/ws//project/", "project")
+
+    assert trie.find("/ws/project//src/A.java") == "project"
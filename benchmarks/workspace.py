@@ -0,0 +1,121 @@
+""" Generates synthetic multi-module maven workspaces and a local repository
+    for the benchmarks """
+from os import makedirs
+from os.path import join
+import random
+
+
+POM_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<project xmlns="http://maven.apache.org/POM/4.0.0">
+  <modelVersion>4.0.0</modelVersion>
+  <groupId>%(group)s</groupId>
+  <artifactId>%(artifact)s</artifactId>
+  <version>%(version)s</version>
+  <packaging>jar</packaging>
+  <name>%(artifact)s</name>
+  <properties>
+    <project.build.sourceEncoding>UTF-8</project.build.sourceEncoding>
+  </properties>
+  <dependencies>
+%(dependencies)s
+  </dependencies>
+  <build>
+    <directory>%(path)s/target</directory>
+    <sourceDirectory>%(path)s/src/main/java</sourceDirectory>
+    <testSourceDirectory>%(path)s/src/test/java</testSourceDirectory>
+    <outputDirectory>%(path)s/target/classes</outputDirectory>
+    <testOutputDirectory>%(path)s/target/test-classes</testOutputDirectory>
+  </build>
+</project>
+"""
+
+DEPENDENCY_TEMPLATE = """    <dependency>
+      <groupId>%s</groupId>
+      <artifactId>%s</artifactId>
+      <version>%s</version>
+      <scope>compile</scope>
+    </dependency>"""
+
+GROUP_ID = "bench"
+LIBRARY_GROUP_ID = "bench.lib"
+VERSION = "1.0"
+
+
+def module_name(index):
+    return "module-%03i" % index
+
+
+def library_name(index):
+    return "lib-%03i" % index
+
+
+def write_pom(path, group, artifact, dependencies, file_name="pom.xml"):
+    with open(join(path, file_name), 'w') as f:
+        f.write(POM_TEMPLATE % {'group': group,
+                                'artifact': artifact,
+                                'version': VERSION,
+                                'path': path,
+                                'dependencies': "\n".join(DEPENDENCY_TEMPLATE % dep
+                                                          for dep in dependencies)})
+
+
+def java_source(package, class_name, lines):
+    """ A compilable java class with roughly the requested amount of lines """
+    body = ["package %s;" % package, "", "public class %s {" % class_name]
+    method = 0
+    while len(body) < lines - 1:
+        body += ["",
+                 "    public int method%i(int value) {" % method,
+                 "        int result = value * %i;" % (method + 1),
+                 "        for (int i = 0; i < value; i++) {",
+                 "            result += i %% %i;" % (method + 2),
+                 "        }",
+                 "        return result;",
+                 "    }"]
+        method += 1
+    body.append("}")
+    return "\n".join(body) + "\n"
+
+
+def generate_repository(repo_path, libraries, fanout, rng):
+    """ Creates library artifacts in the local repository, each library
+        depends on up to fanout libraries with a lower index """
+    for index in range(libraries):
+        name = library_name(index)
+        path = join(repo_path, *LIBRARY_GROUP_ID.split("."), name, VERSION)
+        makedirs(path, exist_ok=True)
+        deps = [(LIBRARY_GROUP_ID, library_name(dep), VERSION)
+                for dep in rng.sample(range(index), min(index, fanout))]
+        write_pom(path, LIBRARY_GROUP_ID, name, deps, "%s-%s.pom" % (name, VERSION))
+        open(join(path, "%s-%s.jar" % (name, VERSION)), 'w').close()
+
+
+def generate_workspace(directory, repo_path, modules, fanout=3, libraries=20,
+                       files=2, file_lines=2000, seed=0):
+    """ Creates modules in the directory, module i depends on up to fanout
+        modules below it and on up to fanout libraries. Returns the module
+        paths in dependency order """
+    rng = random.Random(seed)
+    generate_repository(repo_path, libraries, fanout, rng)
+
+    paths = []
+    for index in range(modules):
+        name = module_name(index)
+        path = join(directory, name)
+        package = "bench.m%03i" % index
+        source_dir = join(path, "src", "main", "java", *package.split("."))
+        makedirs(source_dir, exist_ok=True)
+        makedirs(join(path, "src", "test", "java"), exist_ok=True)
+
+        deps = [(GROUP_ID, module_name(dep), VERSION)
+                for dep in rng.sample(range(index), min(index, fanout))]
+        deps += [(LIBRARY_GROUP_ID, library_name(lib), VERSION)
+                 for lib in rng.sample(range(libraries), min(libraries, fanout))]
+        write_pom(path, GROUP_ID, name, deps)
+
+        for file_index in range(files):
+            class_name = "Class%i" % file_index
+            with open(join(source_dir, class_name + ".java"), 'w') as f:
+                f.write(java_source(package, class_name, file_lines))
+        paths.append(path)
+    return paths
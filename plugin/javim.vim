@@ -11,7 +11,6 @@ python3 import vim
 python3 sys.path.append(vim.eval('expand("<sfile>:h")'))
 python3 import os
 python3 from javim import Javim
-python3 from javim.jobs import JobHandler
 
 
 function! javim#init()
@@ -32,6 +31,23 @@ javim.project_import(vim.eval("a:path"))
 EOF
 endfunction
 
+function! javim#projectImportModules(path)
+python3 << EOF
+javim.project_import_modules(vim.eval("a:path"))
+EOF
+endfunction
+
+function! javim#projectImportTree(path)
+python3 << EOF
+javim.project_import_tree(vim.eval("a:path"))
+EOF
+endfunction
+
+" Progress of background tasks, e.g. for the statusline
+function! javim#status()
+    return get(g:, 'javim_status', '')
+endfunction
+
 function! javim#bufEnter(buffer)
 python3 << EOF
 javim.buf_enter(int(vim.eval("a:buffer")))
@@ -114,6 +130,7 @@ endfunction
 
 function! javim#handleTermClose(job_id, data, event)
 python3 << EOF
+from javim.jobs import JobHandler
 job_id = int(vim.eval("a:job_id"))
 data = vim.eval("a:data")
 for handler in JobHandler.INSTANCES:
@@ -128,11 +145,17 @@ EOF
 endfunction
 
 :command! -nargs=1 -complete=dir ProjectImport call javim#projectImport(<f-args>)
+:command! -nargs=1 -complete=dir ProjectImportModules call javim#projectImportModules(<f-args>)
+:command! -nargs=1 -complete=dir ProjectImportTree call javim#projectImportTree(<f-args>)
 :command! -nargs=0 EditRunConfiguration python3 javim.edit_run_configurations()
 :command! -nargs=1 SetProfiles call javim#setProfiles(<f-args>)
 :command! -nargs=0 ProjectOpen python3 javim.project_open()
 :command! -nargs=0 ProjectClose python3 javim.project_close()
 :command! -nargs=0 ProjectConfig python3 javim.edit_project_configuration()
+:command! -nargs=0 JobStats python3 javim.job_stats()
+:command! -nargs=? -complete=dir InstrumentStart python3 javim.instrument(True, vim.eval("<q-args>"))
+:command! -nargs=0 InstrumentStop python3 javim.instrument(False)
+:command! -nargs=0 InstrumentSummary python3 javim.instrument_summary()
 
 augroup javim
     autocmd!
@@ -4,10 +4,10 @@ import os
 import tempfile
 
 
-from .maven import Maven
-from .settings import RunConfiguration, PersistentSetting
-from .buffer_change import BufferChangeDispatcher
-from .java import JavaAstBufferChangeListener
+from .settings import RunConfiguration, PersistentSetting, Workspace
+from .instrument import Instrumentation, instrument_class, instrument_rpc
+from .rpc import RpcBatch
+from .changes import is_below
 
 __all__ = ["maven", "settings"]
 
@@ -21,110 +21,156 @@ class Javim():
 
     NERDTREE_REFRESH_ROOT = "::NERDTreeRefreshRoot"
 
+    IMPORT_SKIP_DIRS = {"target", "node_modules", "src"}
+
 
     def __init__(self, vim):
         self.vim = vim
-        self.maven = Maven(vim)
+        self.workspace = Workspace()
+        self.__maven = None
         self.buffers = {}
-        cmd = Javim.FZF_FIND.replace("{dir}", self.maven.workspace.dir())
+        for event in ['project_open', 'project_close', 'project_remove']:
+            self.workspace.listeners[event].append(self.__invalidate_buffers)
+        cmd = Javim.FZF_FIND.replace("{dir}", self.workspace.dir())
         class_cmd = cmd.replace("{cmd}", Javim.FIND_CLASSES).replace("{map}", "<leader>oc")
         resource_cmd = cmd.replace("{cmd}", Javim.FIND_RESOURCES).replace("{map}", "<leader>or")
-        vim.command(class_cmd)
-        vim.command(resource_cmd)
+        self.listen_path = RpcBatch(vim).command("cd " + self.workspace.dir()) \
+                                        .command(class_cmd) \
+                                        .command(resource_cmd) \
+                                        .eval("v:servername") \
+                                        .send()[3]
         self.last_config = None
 
         self.debug_port = 8100
         self.event_listeners = {}
-        self.listen_path = vim.command_output(":let a = systemlist('echo $NVIM_LISTEN_ADDRESS')|echo a[0]")
         #self.change_dispatcher = BufferChangeDispatcher(self.vim, True)
         #self.java_ast = JavaAstBufferChangeListener(self.vim)
         #self.change_dispatcher.register_filetype_listener(self.java_ast, [".java"])
 
 
+    @property
+    def maven(self):
+        """ The maven integration is created on first use, editing files
+            outside of the workspace projects doesn't load it """
+        if self.__maven is None:
+            from .maven import Maven
+            if Maven.SETTINGS.instrumentation():
+                self.instrument(True, Maven.SETTINGS.profile_dir())
+            self.__maven = Maven(self.vim, self.workspace)
+        return self.__maven
+
     def __handle_event(self, name, event):
         if name in self.event_listeners:
             for listener in self.event_listeners:
                 listener(*event)
 
 
+    @staticmethod
+    def echom(msg):
+        return "echom \"" + str(msg).replace("\"", "\\\"") + "\""
+
     def print(self, msg):
-        self.vim.command("echom \"" + str(msg).replace("\"", "\\\"") + "\"")
+        self.vim.command(Javim.echom(msg))
 
     def input(self, message):
-        self.vim.command('call inputsave()')
-        self.vim.command("let user_input = input('" + message + ": ')")
-        self.vim.command('call inputrestore()')
-
-        return self.vim.eval('user_input')
+        return RpcBatch(self.vim).call("inputsave") \
+                                 .call("input", message + ": ") \
+                                 .call("inputrestore") \
+                                 .send()[1]
 
     def choice(self, choices):
-        self.vim.command("call inputsave()")
-        self.vim.command("let user_input = inputlist([" + ", ".join(map(lambda c: "'" + c + "'", choices)) + "])")
-        self.vim.command("call inputrestore()")
-        
-        return int(self.vim.eval("user_input"))
+        return int(RpcBatch(self.vim).call("inputsave")
+                                     .call("inputlist", choices)
+                                     .call("inputrestore")
+                                     .send()[1])
 
     def get_choice(self, choices):
         result = self.choice(choices)
         return choices[result]
 
     def buf_enter(self, buf_num):
-        buff = self.vim.buffers[buf_num]
-
-        if "project_name" not in buff.vars:
-            if buff.valid and buff.name:
-                file_name = buff.name
-                for project_name, project in self.maven.workspace.projects().items():
-                    if file_name.startswith(project['path']):
-                        buff.vars['project_name'] = project_name
-                        self.buffers[buf_num] = {'project_name': project_name}
-                        return
+        if buf_num not in self.buffers:
+            self.find_project_by_buffer(buf_num)
 
     def find_project_by_buffer(self, buf_num):
-        buff = self.vim.buffers[buf_num]
-
-        if "project_name" not in buff.vars:
-            if buff.valid and buff.name:
-                file_name = buff.name
-                for project_name, project in self.maven.workspace.projects().items():
-                    if file_name.startswith(project['path']):
-                        buff.vars['project_name'] = project_name
-                        self.buffers[buf_num] = {'project_name': project_name}
-                        return project
-        else:
-            return self.maven.workspace.projects()[buff.vars["project_name"]]
+        if buf_num in self.buffers:
+            name = self.buffers[buf_num]['project_name']
+            return self.workspace.projects()[name] if name else None
+
+        name = self.__buffer_name(buf_num)
+        if not name:
+            return None
 
+        return self.__map_buffer(buf_num, name)
+
+    def __map_buffer(self, buf_num, path, old_name=None):
+        """ Looks up the project of the buffer's file and keeps b:project_name
+            in sync with it """
+        project = self.workspace.find_project(path)
+        self.buffers[buf_num] = {'project_name': project['name'] if project else None,
+                                 'path': path}
+        if project:
+            self.vim.request("nvim_buf_set_var", buf_num, "project_name", project['name'])
+        elif old_name:
+            self.vim.request("nvim_buf_del_var", buf_num, "project_name")
+        return project
+
+    def __buffer_name(self, buf_num):
+        """ Full path of the buffer, empty for unnamed or wiped buffers """
+        return self.vim.eval('bufname(%i) == "" ? "" : fnamemodify(bufname(%i), ":p")'
+                             % (buf_num, buf_num))
+
+    def __current_project_name(self):
+        return self.vim.eval("get(b:, 'project_name', '')")
+
+    def __invalidate_buffers(self, project):
+        """ Looks up the project of the buffers mapped to the project or
+            located below its root again, once it was imported, opened,
+            closed or removed. Buffers of a parent project are taken over by
+            a newly imported module and vice versa """
+        root = os.path.realpath(project['path'])
+        for buf_num, buf in list(self.buffers.items()):
+            if (buf['project_name'] == project['name']
+                    or is_below(os.path.realpath(buf['path']), root)):
+                self.__map_buffer(buf_num, buf['path'], buf['project_name'])
 
     def buf_delete(self, buf_num):
         if buf_num in self.buffers:
             del self.buffers[buf_num]
 
     def buf_save(self, buf_num):
-        buff = self.vim.buffers[buf_num]
-        if "project_name" in buff.vars:
-            project = self.maven.workspace.projects()[buff.vars['project_name']]
-            project['maven_config']['rebuild'] = True
+        project = self.find_project_by_buffer(buf_num)
+        if project:
+            self.maven.file_saved(project, self.__buffer_name(buf_num))
 
     def __run_config(self, config, is_debug=False):
-        buf_nr = int(self.vim.eval('bufnr("Console")'))
-        if buf_nr != -1:
-            self.vim.command("b %i | bw!" % buf_nr)
         command = config.command() if not is_debug else config.debug_command()
         if is_debug:
             command = command.replace("{port}", str(self.debug_port))
-        self.print("Running command: " + command)
-        self.vim.command("bot 10sp | enew | call termopen('" + command.replace("'", "''") + "')")
-        self.vim.command("file Console")
-        self.vim.command("normal G")
+
+        batch = RpcBatch(self.vim)
+        batch.command(RpcBatch.CLOSE_CONSOLE)
+        batch.command(Javim.echom("Running command: " + command))
+        batch.command("bot 10sp | enew | call termopen('" + command.replace("'", "''") + "')")
+        batch.command("file Console")
+        batch.command("normal G")
 
         if is_debug:
-            self.vim.command("call vebugger#jdb#attach('" + str(self.debug_port) + "', {'srcpath':" + str(config.src()) + "})")
+            batch.command("call vebugger#jdb#attach('" + str(self.debug_port) + "', {'srcpath':" + str(config.src()) + "})")
             self.debug_port += 1
+        batch.send()
 
         self.last_config = config
 
     def runAs(self, line_num, row_num, is_debug=False):
-        line = self.vim.eval('getline(' + str(line_num) + ')')
+        line, source_file, project_name = RpcBatch(self.vim).call("getline", int(line_num)) \
+                                                            .request("nvim_buf_get_name", 0) \
+                                                            .eval("get(b:, 'project_name', '')") \
+                                                            .send()
+        if not project_name:
+            self.print("Not a managed project file!")
+            return
+
         names = []
         configs = []
         for i, (name, configProvider) in enumerate(RunConfiguration.PROVIDER.items()):
@@ -140,13 +186,8 @@ class Javim():
             self.print("Invalid choice!")
             return
 
-        buff = self.vim.current.buffer
-        source_file = buff.name
-        project = self.maven.workspace.projects()[buff.vars['project_name']]
+        project = self.maven.workspace.projects()[project_name]
         def run_config():
-            buf_nr = int(self.vim.eval('bufnr("Console")'))
-            if buf_nr != -1:
-                self.vim.command("b %i | bw!" % buf_nr)
             config = configs[choosen].create_config(line,
                                                     row_num,
                                                     source_file,
@@ -185,12 +226,12 @@ class Javim():
             config['select_profiles'].remove(profile)
 
     def set_profiles(self, profiles):
-        buf = self.vim.current.buffer
-        if 'project_name' not in buf.vars:
+        project_name = self.__current_project_name()
+        if not project_name:
             self.print("This file doesn't belong to a managed project!")
             return
 
-        project = self.maven.workspace.projects()[buf.vars['project_name']]
+        project = self.maven.workspace.projects()[project_name]
         maven_config = project['maven_config']
         maven_config['select_profiles'] = []
         for profile in profiles.split(","):
@@ -212,14 +253,64 @@ class Javim():
 
     def project_import(self, project_path):
         self.print("Importing maven project at '" + project_path + "'...")
-        project = self.maven.import_project(project_path)
-        if project:
-            self.print("Successfully import project '" + project['name'] + "'!")
+        self.maven.import_projects_async([project_path],
+                                         self.__projects_imported,
+                                         self.__import_progress)
+
+    def project_import_modules(self, project_path):
+        """ Imports the project and all modules it aggregates """
+        self.print("Importing maven project at '" + project_path + "' with its modules...")
+        self.maven.import_projects_async([project_path],
+                                         self.__projects_imported,
+                                         self.__import_progress,
+                                         modules=True)
+
+    def project_import_tree(self, root):
+        """ Imports every maven project found below the root directory """
+        directories = []
+        for path, dirs, files in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if d not in Javim.IMPORT_SKIP_DIRS
+                             and not d.startswith("."))
+            if "pom.xml" in files:
+                directories.append(path)
+
+        if not directories:
+            self.print("No maven projects found below '" + root + "'!")
+            return
+
+        self.print("Importing %i maven projects below '%s'..." % (len(directories), root))
+        self.maven.import_projects_async(directories,
+                                         self.__projects_imported,
+                                         self.__import_progress)
+
+    def __import_progress(self, done, total, directory):
+        self.status("Importing %i/%i: %s" % (done, total, os.path.basename(directory)))
+
+    def __projects_imported(self, projects, errors):
+        self.status("")
+        for project in projects:
+            self.__invalidate_buffers(project)
+
+        batch = RpcBatch(self.vim)
+        for error in errors:
+            batch.command(Javim.echom(error))
+        if len(projects) == 1:
+            batch.command(Javim.echom("Successfully import project '" + projects[0]['name'] + "'!"))
+        elif projects:
+            batch.command(Javim.echom("Successfully imported %i projects!" % len(projects)))
         else:
-            self.print("Project couldn't be imported!")
+            batch.command(Javim.echom("Project couldn't be imported!"))
+        batch.send()
+
+    def status(self, msg):
+        """ Shows the message in g:javim_status, see javim#status() """
+        RpcBatch(self.vim).command("let g:javim_status = \"%s\"" % msg.replace("\"", "\\\"")) \
+                          .command("redrawstatus!") \
+                          .command("echo g:javim_status") \
+                          .send()
 
     def select_project(self):
-        projects = [project['name'] for project in self.maven.workspace.projects()]
+        projects = list(self.maven.workspace.projects())
         return self.maven.workspace.projects()[self.get_choice(projects)]
 
     def project_close(self):
@@ -245,12 +336,11 @@ class Javim():
 
 
     def edit_run_configurations(self):
-        buff = self.vim.current.buffer
-        if not 'project_name' in buff.vars:
+        project_name = self.__current_project_name()
+        if not project_name:
             self.print("Not a managed project file!")
             return
 
-        project_name = buff.vars['project_name']
         project = self.maven.workspace.projects()[project_name]
 
         if not len(project['run_configs']):
@@ -260,57 +350,92 @@ class Javim():
         config_name = self.get_choice(list(project['run_configs'].keys()))
         config = project['run_configs'][config_name]
         config._save()
-        self.vim.command("e " + config.path.replace("$", "\\$"))
-        edit_buf = self.vim.current.buffer
-        autocmd = "au! BufWritePost <buffer=%i> python3 javim.load_config(\"%s\", \"%s\")" % (edit_buf.number,
-                                                                                              project_name,
-                                                                                              config_name)
-        self.vim.command(autocmd)
+        autocmd = "au! BufWritePost <buffer> python3 javim.load_config(\"%s\", \"%s\")" % (project_name,
+                                                                                        config_name)
+        RpcBatch(self.vim).command("e " + config.path.replace("$", "\\$")) \
+                          .command(autocmd) \
+                          .send()
 
 
 
     def edit_project_configuration(self):
-        buff = self.vim.current.buffer
-        if not 'project_name' in buff.vars:
+        project_name = self.__current_project_name()
+        if not project_name:
             self.print("Not a managed project file!")
             return
 
-        project_name = buff.vars['project_name']
         project = self.maven.workspace.projects()[project_name]
 
         _, tmp_name = tempfile.mkstemp(suffix=".json")
 
-        self.vim.command("enew")
-        self.vim.command("e %s" % tmp_name)
-        buffer = self.vim.current.buffer
-
         run_configs = project['run_configs']
         project['run_configs'] = {}
         project_config = dumps(project, indent=4)
         project['run_configs'] = run_configs
-        buffer[::] = project_config.split("\n")
 
-        bufnr = buffer.number
+        bufnr = RpcBatch(self.vim).command("enew") \
+                                  .command("e %s" % tmp_name) \
+                                  .call("bufnr", "%") \
+                                  .send()[2]
+
         autocmd = "au! BufWriteCmd <buffer=%i> python3 javim.save_project_config(%i, '%s')" % (bufnr, bufnr, project_name)
-        self.vim.command(autocmd)
-        self.vim.command("au! BufDelete <buffer=%i> python3 os.remove('%s')" % (bufnr, tmp_name))
+        RpcBatch(self.vim).call("setline", 1, project_config.split("\n")) \
+                          .command(autocmd) \
+                          .command("au! BufDelete <buffer=%i> python3 os.remove('%s')" % (bufnr, tmp_name)) \
+                          .send()
 
     def save_project_config(self, bufnr, project_name):
         workspace = self.maven.workspace
-        old_project = workspace.projects()[project_name]
         buff = self.vim.buffers[bufnr]
 
         try:
-            project = loads("\n".join(buff))
-            project['run_configs'] = old_project['run_configs']
-            workspace.projects()[project_name] = project
-            workspace._save()
+            workspace.replace_project(project_name, loads("\n".join(buff)))
+            workspace.save_later()
             self.vim.command("echom 'Project configuration saved successfully!'")
         except Exception as e:
-            workspace.projects()[project_name] = old_project
-            workspace._save()
             self.vim.command("echom 'Error saving project config: %s'" % str(e))
 
+    def __show_table(self, name, rows):
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = [" | ".join(col.ljust(w) for col, w in zip(row, widths)).rstrip()
+                 for row in rows]
+        RpcBatch(self.vim).command("bot 10sp | enew | setlocal buftype=nofile bufhidden=wipe | file " + name) \
+                          .call("setline", 1, lines) \
+                          .send()
+
+    def job_stats(self):
+        stats = self.maven.history.statistics()
+        if not stats:
+            self.print("No jobs recorded yet!")
+            return
+
+        def fmt(value):
+            return "-" if value is None else "%.2fs" % value
+
+        rows = [["project", "goal", "runs", "failures", "p50", "p95"]]
+        rows += [[s['project'], s['goal'], str(s['runs']), str(s['failures']),
+                  fmt(s['p50']), fmt(s['p95'])] for s in stats]
+        self.__show_table("JobStats", rows)
+
+    def instrument(self, enable, profile_dir=None):
+        if enable:
+            Instrumentation.enable(profile_dir)
+            instrument_rpc(self.vim)
+        else:
+            Instrumentation.disable()
+
+    def instrument_summary(self):
+        rows = Instrumentation.summary()
+        if len(rows) == 1:
+            self.print("Nothing recorded, enable instrumentation with :InstrumentStart")
+            return
+        self.__show_table("Instrumentation", rows)
+
     def vim_quit(self):
         self.print("Saving javim settings...")
+        if self.__maven:
+            self.__maven.job_handler.shutdown()
         PersistentSetting.save_all()
+
+
+instrument_class(Javim, "javim")
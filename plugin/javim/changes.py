@@ -0,0 +1,142 @@
+""" Tracks the compiled inputs of projects, so only real changes trigger
+    a rebuild """
+from hashlib import sha1
+from os import walk, stat, listdir
+from os.path import join, exists, relpath, getmtime, splitext, realpath, split, isdir
+from .settings import ProjectSetting
+
+
+def file_hash(path):
+    """ Computes the content hash of a file """
+    digest = sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_below(path, directory):
+    """ Checks whether path is located below directory """
+    return path.startswith(directory.rstrip("/") + "/")
+
+
+class SourceManifest(ProjectSetting):
+    """ Content hashes of a project's sources, resources and pom.xml as of
+        its last successful build. Files saved since then are kept in the
+        dirty list until the next build compiled them """
+
+    def __init__(self, project):
+        super(SourceManifest, self).__init__("source_manifest",
+                                             project,
+                                             {'files': {}, 'dirty': []})
+        self.project = project
+
+    def input_dirs(self):
+        """ Returns tuples of input directories, their output directory and
+            whether java sources are compiled from them """
+        config = self.project['maven_config']
+        dirs = []
+        for source_dir in config['source_dirs']:
+            dirs.append((realpath(source_dir), config['output_dir'], True))
+        for source_dir in config['test_source_dirs']:
+            dirs.append((realpath(source_dir), config['test_output_dir'], True))
+        for resource_dir in config['resource_dirs']:
+            dirs.append((realpath(resource_dir), config['output_dir'], False))
+        for resource_dir in config['test_resource_dirs']:
+            dirs.append((realpath(resource_dir), config['test_output_dir'], False))
+        return dirs
+
+    def pom_path(self):
+        return realpath(join(self.project['path'], "pom.xml"))
+
+    def output_path(self, path):
+        """ Returns the path a compiled input ends up at, None if the file is
+            no input of the project """
+        for directory, output_dir, compiled in self.input_dirs():
+            if is_below(path, directory):
+                rel = relpath(path, directory)
+                if compiled:
+                    base, ext = splitext(rel)
+                    if ext != ".java":
+                        return None
+                    rel = base + ".class"
+                return join(output_dir, rel)
+        return None
+
+    def is_input(self, path):
+        """ Checks whether the file is compiled into the project """
+        return path == self.pom_path() or self.output_path(path) is not None
+
+    def update(self, path):
+        """ Compares a saved file against the manifest. Returns True if its
+            content differs from the last build """
+        path = realpath(path)
+        if not self.is_input(path) or not exists(path):
+            return False
+
+        entry = self.files().get(path)
+        changed = not entry or entry[2] != file_hash(path)
+        dirty = self.dirty()
+        if changed and path not in dirty:
+            dirty.append(path)
+        elif not changed and path in dirty:
+            dirty.remove(path)
+        return changed
+
+    def deleted(self):
+        """ Returns the java sources of the last build that don't exist
+            anymore """
+        return sorted(path for path in self.files()
+                      if path.endswith(".java") and not exists(path))
+
+    def orphans(self):
+        """ Yields the classes compiled from deleted sources, including the
+            classes nested in them """
+        for path in self.deleted():
+            output = self.output_path(path)
+            if not output:
+                continue
+            directory, file_name = split(output)
+            if not isdir(directory):
+                continue
+            nested = splitext(file_name)[0] + "$"
+            for name in listdir(directory):
+                if name == file_name or (name.startswith(nested) and name.endswith(".class")):
+                    yield join(directory, name)
+
+    def inputs(self):
+        """ Yields every input file of the project and its output path """
+        yield (self.pom_path(), None)
+        for directory, _, _ in self.input_dirs():
+            for root, _, file_names in walk(directory):
+                for file_name in file_names:
+                    path = join(root, file_name)
+                    output = self.output_path(path)
+                    if output:
+                        yield (path, output)
+
+    def record(self):
+        """ Records the state of all inputs after a successful build. Files
+            whose compiled output is older than the source were changed while
+            building and stay dirty """
+        files = self.files()
+        recorded = {}
+        dirty = []
+        for path, output in self.inputs():
+            if not exists(path):
+                continue
+            stat_ = stat(path)
+            entry = files.get(path)
+            if output and exists(output) and getmtime(output) < stat_.st_mtime:
+                dirty.append(path)
+                if entry:
+                    recorded[path] = entry
+                continue
+
+            if not entry or entry[0] != stat_.st_mtime_ns or entry[1] != stat_.st_size:
+                entry = [stat_.st_mtime_ns, stat_.st_size, file_hash(path)]
+            recorded[path] = entry
+
+        self.set_files(recorded)
+        self.set_dirty(dirty)
+        self.save_later()
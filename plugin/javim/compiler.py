@@ -0,0 +1,152 @@
+""" Compiles changed java sources directly with javac, bypassing maven for
+    small edits """
+from os import walk, stat
+from os.path import join, exists, basename, splitext, realpath
+from shlex import quote
+from zipfile import ZipFile, BadZipFile
+import re
+from .changes import is_below
+
+
+PACKAGE_REGEX = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.M)
+IMPORT_REGEX = re.compile(r"^\s*import\s+(?:static\s+)?([\w.]+(?:\.\*)?)\s*;", re.M)
+TYPE_NAME_REGEX = re.compile(r"\b[A-Z][\w$]*\b")
+PROCESSOR_SERVICE = "META-INF/services/javax.annotation.processing.Processor"
+
+
+class ReferenceIndex():
+    """ Index of the packages, imports and type names referenced by java
+        sources. Entries are refreshed when a file's mtime changes """
+
+    def __init__(self):
+        self.entries = {}
+
+    def entry(self, path):
+        """ Returns a tuple of package, imports and referenced type names """
+        mtime = stat(path).st_mtime_ns
+        cached = self.entries.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1:]
+
+        with open(path, 'r', errors="replace") as f:
+            source = f.read()
+        package = PACKAGE_REGEX.search(source)
+        entry = (mtime,
+                 package.group(1) if package else "",
+                 set(IMPORT_REGEX.findall(source)),
+                 set(TYPE_NAME_REGEX.findall(source)))
+        self.entries[path] = entry
+        return entry[1:]
+
+    def dependents(self, source_dirs, changed):
+        """ Returns the changed sources and all sources in source_dirs
+            referencing one of the classes declared by them """
+        changed_types = []
+        for path in changed:
+            package, _, _ = self.entry(path)
+            changed_types.append((package, splitext(basename(path))[0]))
+
+        result = set(changed)
+        for source_dir in source_dirs:
+            for root, _, file_names in walk(source_dir):
+                for file_name in file_names:
+                    path = join(root, file_name)
+                    if not file_name.endswith(".java") or path in result:
+                        continue
+                    package, imports, names = self.entry(path)
+                    for type_package, type_name in changed_types:
+                        if type_name in names and (package == type_package or
+                                                   type_package + "." + type_name in imports or
+                                                   type_package + ".*" in imports):
+                            result.add(path)
+                            break
+        return sorted(result)
+
+
+class IncrementalCompiler():
+    """ Compiles the dirty sources of a project and their dependents with
+        javac against the cached classpath. Projects using annotation
+        processors or with changed resources or poms must be built by maven """
+
+    def __init__(self, javac="javac"):
+        self.javac = javac
+        self.index = ReferenceIndex()
+        self.processor_jars = {}
+
+    def has_processor(self, jar_path):
+        """ Checks whether a jar registers an annotation processor """
+        mtime = stat(jar_path).st_mtime_ns
+        cached = self.processor_jars.get(jar_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            with ZipFile(jar_path) as jar:
+                found = PROCESSOR_SERVICE in jar.namelist()
+        except (BadZipFile, OSError):
+            found = False
+        self.processor_jars[jar_path] = (mtime, found)
+        return found
+
+    def uses_annotation_processors(self, project):
+        """ Checks the pom and classpath of a project for annotation
+            processors """
+        with open(join(project['path'], "pom.xml"), 'r', errors="replace") as f:
+            if "annotationProcessor" in f.read():
+                return True
+
+        for entry in (project['maven_config'].get('classpath') or "").split(":"):
+            if entry.endswith(".jar") and exists(entry) and self.has_processor(entry):
+                return True
+        return False
+
+    def can_compile(self, project, dirty, upstream=()):
+        """ Checks whether the dirty files of a project can be compiled
+            without maven. A project without dirty files can be compiled if
+            sources changed upstream, the java files changed in the projects
+            it depends on """
+        config = project['maven_config']
+        if not (dirty or upstream) or not config.get('classpath') or not config['last_built']:
+            return False
+
+        source_dirs = [realpath(d) for d in config['source_dirs'] + config['test_source_dirs']]
+        for path in dirty:
+            if not path.endswith(".java") or not any(is_below(path, d) for d in source_dirs):
+                return False
+
+        return not self.uses_annotation_processors(project)
+
+    def commands(self, project, dirty, upstream=()):
+        """ Creates the javac commands compiling the dirty sources and their
+            dependents, main sources first. Sources referencing the types
+            declared by the upstream sources are recompiled as well """
+        config = project['maven_config']
+        java_config = project['java_config']
+        properties = config['properties']
+        main_dirs = [realpath(d) for d in config['source_dirs']]
+        test_dirs = [realpath(d) for d in config['test_source_dirs']]
+
+        options = ["-encoding", properties.get('project.build.sourceEncoding') or "UTF-8",
+                   "-cp", config['classpath']]
+        if properties.get('maven.compiler.release'):
+            options += ["--release", properties['maven.compiler.release']]
+        else:
+            options += ["-source", properties.get('maven.compiler.source') or java_config['source'],
+                        "-target", properties.get('maven.compiler.target') or java_config['target']]
+
+        commands = []
+        for source_dirs, sourcepath, output_dir in [(main_dirs, main_dirs, config['output_dir']),
+                                                    (test_dirs, main_dirs + test_dirs,
+                                                     config['test_output_dir'])]:
+            changed = [p for p in dirty if any(is_below(p, d) for d in source_dirs)]
+            if not changed and not upstream:
+                continue
+            sources = [path for path in self.index.dependents(source_dirs,
+                                                               changed + list(upstream))
+                       if path not in upstream]
+            if not sources:
+                continue
+            args = ([self.javac, "-d", output_dir, "-sourcepath", ":".join(sourcepath)]
+                    + options + sources)
+            commands.append(" ".join(map(quote, args)))
+        return commands
@@ -0,0 +1,78 @@
+""" Keeps a maven daemon warm for the builds """
+from shutil import which
+from subprocess import run, DEVNULL, TimeoutExpired
+from threading import Thread, Lock
+import re
+
+STATUS_REGEX = re.compile(r"\b(Idle|Busy)\b")
+
+
+class MavenDaemon():
+    """ Lifecycle of the mvnd daemon the builds are submitted to. The daemon
+        is started in the background, until it answers the health check the
+        builds use the fallback executable. Failed builds trigger another
+        check, a daemon that died is started again meanwhile builds fall back
+        to plain maven """
+
+    START_ARGS = ["-B", "-v"]
+    TIMEOUT = 120
+
+    def __init__(self, client, fallback):
+        self.client = which(client)
+        self.fallback = fallback
+        self.alive = False
+        self.checking = False
+        self.lock = Lock()
+
+    def executable(self):
+        """ The daemon client if the daemon is healthy, the fallback
+            otherwise """
+        return self.client if self.alive else self.fallback
+
+    def __run(self, args):
+        """ Runs the client detached from the standard streams of the nvim
+            host, returns None if it can't be run or doesn't finish in time """
+        try:
+            return run([self.client] + args, stdin=DEVNULL, capture_output=True,
+                       encoding="utf-8", errors="replace", timeout=MavenDaemon.TIMEOUT)
+        except (OSError, TimeoutExpired):
+            return None
+
+    def status(self):
+        """ Checks whether a daemon of the client is running """
+        result = self.__run(["--status"])
+        return bool(result and result.returncode == 0 and STATUS_REGEX.search(result.stdout))
+
+    def ensure(self):
+        """ Checks the health of the daemon and starts one if none is
+            running. Blocks until the daemon is up, returns whether it is """
+        if not self.client:
+            return False
+        alive = self.status()
+        if not alive:
+            self.__run(MavenDaemon.START_ARGS)
+            alive = self.status()
+        self.alive = alive
+        return alive
+
+    def check_later(self):
+        """ Runs ensure on a background thread unless a check is running """
+        with self.lock:
+            if self.checking or not self.client:
+                return
+            self.checking = True
+
+        def check():
+            try:
+                self.ensure()
+            finally:
+                with self.lock:
+                    self.checking = False
+        Thread(target=check, daemon=True).start()
+
+    def stop(self):
+        """ Stops the daemons of the client, builds fall back to plain
+            maven """
+        self.alive = False
+        if self.client:
+            self.__run(["--stop"])
@@ -0,0 +1,207 @@
+""" Line based document model of the buffers parsed with tree-sitter """
+from random import random
+
+
+class DocumentNode():
+    """ Node of the implicit treap holding one line including its line
+        break, with the line count and byte size of its subtree """
+
+    __slots__ = ["line", "left", "right", "count", "size"]
+
+    def __init__(self, line, left=None, right=None):
+        self.line = line
+        self.left = left
+        self.right = right
+        self.update()
+
+    def update(self):
+        self.count = 1 + count(self.left) + count(self.right)
+        self.size = len(self.line) + size(self.left) + size(self.right)
+        return self
+
+
+def count(node):
+    return node.count if node else 0
+
+
+def size(node):
+    return node.size if node else 0
+
+
+def build(lines, start=0, end=None):
+    """ Builds a balanced tree of the encoded lines """
+    if end is None:
+        end = len(lines)
+    if start >= end:
+        return None
+    middle = (start + end) // 2
+    return DocumentNode(lines[middle],
+                        build(lines, start, middle),
+                        build(lines, middle + 1, end))
+
+
+def merge(left, right):
+    """ Concatenates two trees. The root is drawn with a probability
+        proportional to the subtree sizes, which keeps the tree a random
+        binary search tree without storing priorities """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if random() * (left.count + right.count) < left.count:
+        left.right = merge(left.right, right)
+        return left.update()
+    right.left = merge(left, right.left)
+    return right.update()
+
+
+def split(node, index):
+    """ Splits a tree into the first index lines and the rest """
+    if node is None:
+        return None, None
+    if index <= count(node.left):
+        left, node.left = split(node.left, index)
+        return left, node.update()
+    node.right, right = split(node.right, index - count(node.left) - 1)
+    return node.update(), right
+
+
+def encode(line):
+    return line.encode("utf-8") + b"\n"
+
+
+class Document():
+    """ The lines of a buffer in an implicit treap ordered by line number.
+        Replacing lines and mapping between lines and byte offsets take
+        O(log n) expected time. read serves the source in chunks to
+        tree-sitter without joining the whole document. Every line ends
+        with a line break in the source """
+
+    CHUNK_SIZE = 4096
+
+    def __init__(self, lines=()):
+        self.root = build([encode(line) for line in lines])
+
+    def __len__(self):
+        return count(self.root)
+
+    def byte_size(self):
+        return size(self.root)
+
+    def __node(self, index):
+        node = self.root
+        while node:
+            left = count(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node
+            else:
+                index -= left + 1
+                node = node.right
+        raise IndexError("line %i out of range" % index)
+
+    def line(self, index):
+        return self.__node(index).line[:-1].decode("utf-8")
+
+    def lines(self):
+        return [line[:-1].decode("utf-8") for line in self.iter_lines()]
+
+    def text(self):
+        return b"".join(self.iter_lines())
+
+    def iter_lines(self, start=0):
+        """ The encoded lines from start on """
+        stack = []
+        node = self.root
+        index = start
+        while node:
+            left = count(node.left)
+            if index <= left:
+                stack.append(node)
+                if index == left:
+                    break
+                node = node.left
+            else:
+                index -= left + 1
+                node = node.right
+
+        while stack:
+            node = stack.pop()
+            yield node.line
+            child = node.right
+            while child:
+                stack.append(child)
+                child = child.left
+
+    def replace_lines(self, start, end, lines):
+        """ Replaces the lines from start to end (exclusive) """
+        self.__replace(start, end, [encode(line) for line in lines])
+
+    def __replace(self, start, end, lines):
+        left, rest = split(self.root, start)
+        _, right = split(rest, end - start)
+        self.root = merge(merge(left, build(lines)), right)
+
+    def replace(self, start_byte, end_byte, text):
+        """ Replaces the bytes from start_byte to end_byte by text, only the
+            lines touched by the range are rebuilt """
+        start_row, start_column = self.byte_to_point(start_byte)
+        end_row, end_column = self.byte_to_point(end_byte)
+        line_count = len(self)
+        prefix = self.__node(start_row).line[:start_column] if start_row < line_count else b""
+        suffix = self.__node(end_row).line[end_column:] if end_row < line_count else b""
+
+        parts = (prefix + text.encode("utf-8") + suffix).split(b"\n")
+        lines = [part + b"\n" for part in parts[:-1]]
+        if parts[-1]:
+            lines.append(parts[-1] + b"\n")
+        self.__replace(start_row, min(end_row + 1, line_count), lines)
+
+    def line_offset(self, index):
+        """ Byte offset of the line, the size of the document for the index
+            after the last line """
+        offset = 0
+        node = self.root
+        while node:
+            left = count(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return offset + size(node.left)
+            else:
+                offset += size(node.left) + len(node.line)
+                index -= left + 1
+                node = node.right
+        return offset
+
+    def byte_to_point(self, byte):
+        """ Row and byte column of the byte offset """
+        row = 0
+        node = self.root
+        while node:
+            left_size = size(node.left)
+            if byte < left_size:
+                node = node.left
+            elif byte < left_size + len(node.line):
+                return row + count(node.left), byte - left_size
+            else:
+                byte -= left_size + len(node.line)
+                row += count(node.left) + 1
+                node = node.right
+        return row, byte
+
+    def read(self, byte, point=None):
+        """ tree-sitter read callback, returns at least CHUNK_SIZE bytes of
+            the source from byte on unless the document ends before. The
+            chunk is empty at the end of the document """
+        row, column = self.byte_to_point(byte)
+        chunks = []
+        length = 0
+        for line in self.iter_lines(row):
+            chunks.append(line[column:] if column else line)
+            column = 0
+            length += len(chunks[-1])
+            if length >= Document.CHUNK_SIZE:
+                break
+        return b"".join(chunks)
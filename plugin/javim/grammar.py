@@ -0,0 +1,163 @@
+""" Locates, builds and loads the tree-sitter grammars. Grammars built from
+    source are cached by the hash of their sources in the user's cache
+    directory and shared by all nvim instances """
+from hashlib import sha1
+from importlib import import_module
+from os import environ, makedirs, replace, getpid, remove
+from os.path import join, exists, expanduser
+from threading import Lock
+import platform
+import sys
+
+try:
+    from fcntl import flock, LOCK_EX, LOCK_UN
+except ImportError:
+    flock = None
+
+from tree_sitter import Language, Parser
+
+from .settings import GlobalSetting
+from .instrument import timed
+
+
+class GrammarError(Exception):
+    """ Raised if a grammar can neither be loaded nor built """
+
+
+def tree_sitter_version():
+    try:
+        from importlib.metadata import version
+        return version("tree_sitter")
+    except Exception:
+        return ""
+
+
+class GrammarManager():
+    """ Loads the tree-sitter language of a grammar on first use. A grammar
+        installed as python package, e.g. tree_sitter_java, is used as is.
+        Otherwise the grammar is compiled from its source checkout once into
+        a cache directory named after the hash of the grammar sources, the
+        tree-sitter version and the platform. Builds are written to a
+        temporary file and renamed, a lock file serializes concurrent builds
+        of nvim instances """
+
+    SETTINGS = GlobalSetting("grammars", {'sources': {'java': "~/git/tree-sitter-java"},
+                                          'cache_dir': ''})
+
+    SOURCE_FILES = ["parser.c", "scanner.c", "scanner.cc", join("tree_sitter", "parser.h")]
+
+    INSTANCE = None
+
+    @staticmethod
+    def instance():
+        if GrammarManager.INSTANCE is None:
+            GrammarManager.INSTANCE = GrammarManager()
+        return GrammarManager.INSTANCE
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = (cache_dir or GrammarManager.SETTINGS.cache_dir()
+                          or GrammarManager.default_cache_dir())
+        self.languages = {}
+        self.lock = Lock()
+
+    @staticmethod
+    def default_cache_dir():
+        cache_home = environ.get('XDG_CACHE_HOME') or join(expanduser("~"), ".cache")
+        return join(cache_home, "javim", "grammars")
+
+    def language(self, name):
+        """ Returns the tree-sitter language of the grammar """
+        with self.lock:
+            if name not in self.languages:
+                self.languages[name] = self.__load(name)
+            return self.languages[name]
+
+    def parser(self, name):
+        """ Returns a new parser for the grammar """
+        language = self.language(name)
+        try:
+            return Parser(language)
+        except TypeError:
+            # tree-sitter before 0.22 only sets the language after construction
+            parser = Parser()
+            parser.set_language(language)
+            return parser
+
+    @timed("grammar.load")
+    def __load(self, name):
+        language = GrammarManager.__load_package(name)
+        if language is None:
+            language = Language(self.library(name), name)
+        return language
+
+    @staticmethod
+    def __load_package(name):
+        """ Loads a grammar shipped prebuilt as python package """
+        try:
+            module = import_module("tree_sitter_" + name)
+            pointer = module.language()
+        except (ImportError, AttributeError):
+            return None
+        try:
+            return Language(pointer)
+        except TypeError:
+            # tree-sitter before 0.22 also takes the language name
+            return Language(pointer, name)
+
+    def source(self, name):
+        """ Directory of the grammar's source checkout """
+        source = (environ.get("JAVIM_TREE_SITTER_" + name.upper())
+                  or GrammarManager.SETTINGS.sources().get(name))
+        if not source or not exists(join(expanduser(source), "src", "parser.c")):
+            raise GrammarError(("No sources of the tree-sitter %s grammar found, install "
+                                "tree_sitter_%s or set its source directory in the "
+                                "grammars settings") % (name, name))
+        return expanduser(source)
+
+    @staticmethod
+    def source_hash(source):
+        """ Hash of the grammar sources and everything the compiled library
+            depends on """
+        digest = sha1()
+        for key in [tree_sitter_version(), sys.implementation.cache_tag,
+                    platform.system(), platform.machine()]:
+            digest.update(key.encode("utf-8") + b"\0")
+        for file_name in GrammarManager.SOURCE_FILES:
+            path = join(source, "src", file_name)
+            if exists(path):
+                digest.update(file_name.encode("utf-8") + b"\0")
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    @timed("grammar.library")
+    def library(self, name):
+        """ Path of the compiled grammar, it's built if not yet cached """
+        source = self.source(name)
+        directory = join(self.cache_dir, "%s-%s" % (name, GrammarManager.source_hash(source)))
+        library = join(directory, name + ".so")
+        if exists(library):
+            return library
+
+        if not hasattr(Language, "build_library"):
+            raise GrammarError(("This tree-sitter version can't build grammars, install "
+                                "tree_sitter_%s") % name)
+
+        makedirs(directory, exist_ok=True)
+        with open(join(directory, "build.lock"), 'w') as lock_file:
+            if flock:
+                flock(lock_file, LOCK_EX)
+            try:
+                # another instance may have built it while waiting for the lock
+                if not exists(library):
+                    tmp_library = "%s.%i.tmp" % (library, getpid())
+                    try:
+                        Language.build_library(tmp_library, [source])
+                        replace(tmp_library, library)
+                    finally:
+                        if exists(tmp_library):
+                            remove(tmp_library)
+            finally:
+                if flock:
+                    flock(lock_file, LOCK_UN)
+        return library
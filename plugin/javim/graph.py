@@ -0,0 +1,203 @@
+""" Index of the dependencies between the maven projects of a workspace """
+from .settings import PersistentSetting
+
+
+class DependencyCycleError(Exception):
+    """ Raised if projects depend on each other in a cycle """
+
+    def __init__(self, cycle):
+        super(DependencyCycleError, self).__init__("Dependency cycle: " + " -> ".join(cycle))
+        self.cycle = cycle
+
+
+class DependencyGraph(PersistentSetting):
+    """ Maps maven coordinates to the workspace projects providing them and
+        keeps the projects each project requires. The dependency coordinates
+        a project declares are stored as well, so the graph is restored
+        without loading the project configs. The reverse adjacency is
+        indexed in memory, the topological order is cached until a project's
+        dependencies change. The dep_projects of the project configs are
+        kept in sync """
+
+    COORDS_TEMPLATE = "%(groupId)s:%(artifactId)s:%(version)s"
+
+    def __init__(self, workspace):
+        super(DependencyGraph, self).__init__(workspace.settings_dir(),
+                                              "dependency_graph",
+                                              {'coords': {},
+                                               'requires': {},
+                                               'declares': {},
+                                               'cached_order': None})
+        self.workspace = workspace
+        self.provides = {}
+        self.declared = {}
+        self.wanted = {}
+        self.required_by = {}
+
+        names = {name for name, project in workspace.projects().items()
+                 if 'maven_info' in project}
+        if set(self.requires()) != names or set(self.declares()) != names:
+            self.rebuild()
+        else:
+            self.__index()
+
+    @staticmethod
+    def project_coords(project):
+        return DependencyGraph.COORDS_TEMPLATE % project['maven_info']
+
+    def __index(self):
+        self.provides = {name: coords for coords, name in self.coords().items()}
+        self.required_by = {name: set() for name in self.requires()}
+        for name, deps in self.requires().items():
+            for dep in deps:
+                self.required_by.setdefault(dep, set()).add(name)
+
+        self.declared = {}
+        self.wanted = {}
+        for name, declared in self.declares().items():
+            self.__declare(name, declared)
+
+    def __declare(self, name, declared):
+        for coords in self.declared.get(name, ()):
+            self.wanted[coords].discard(name)
+        self.declared[name] = set(declared)
+        self.declares()[name] = sorted(declared)
+        for coords in self.declared[name]:
+            self.wanted.setdefault(coords, set()).add(name)
+
+    def __link(self, name):
+        """ Resolves the declared dependencies of a project against the
+            index, returns whether its requirements changed """
+        coords = self.coords()
+        requires = sorted({coords[c] for c in self.declared[name]
+                           if c in coords and coords[c] != name})
+        old = self.requires().get(name)
+        if old == requires:
+            return False
+
+        for dep in old or ():
+            if dep in self.required_by:
+                self.required_by[dep].discard(name)
+        for dep in requires:
+            self.required_by.setdefault(dep, set()).add(name)
+        self.requires()[name] = requires
+        self.workspace.projects()[name]['maven_config']['dep_projects'] = list(requires)
+        return True
+
+    def rebuild(self):
+        """ Rebuilds the index from the project configs """
+        self.data.update({'coords': {}, 'requires': {}, 'declares': {},
+                          'cached_order': None})
+        self.__index()
+        self.update_projects([project for project in self.workspace.projects().values()
+                              if 'maven_info' in project])
+
+    def update_projects(self, projects):
+        """ Indexes new projects or projects whose pom changed. Only the
+            projects depending on their coordinates are relinked """
+        affected = set()
+        for project in projects:
+            name = project['name']
+            coords = DependencyGraph.project_coords(project)
+            old_coords = self.provides.get(name)
+            if old_coords != coords:
+                if old_coords is not None:
+                    del self.coords()[old_coords]
+                    affected |= self.wanted.get(old_coords, set())
+                self.coords()[coords] = name
+                self.provides[name] = coords
+                affected |= self.wanted.get(coords, set())
+            self.required_by.setdefault(name, set())
+            self.__declare(name, project['maven_config']['dependencies'])
+            affected.add(name)
+
+        changed = False
+        for name in affected:
+            changed = self.__link(name) or changed
+        if changed:
+            self.set_cached_order(None)
+
+    def remove_project(self, name):
+        """ Removes a project, projects depending on it are relinked """
+        coords = self.provides.pop(name, None)
+        if coords is not None:
+            del self.coords()[coords]
+        for dep in self.requires().pop(name, ()):
+            self.required_by[dep].discard(name)
+        for coords_ in self.declared.pop(name, ()):
+            self.wanted[coords_].discard(name)
+        self.declares().pop(name, None)
+        for dependent in self.required_by.pop(name, set()):
+            self.__link(dependent)
+        self.set_cached_order(None)
+
+    def dependencies(self, name):
+        return self.requires().get(name, [])
+
+    def dependents(self, name):
+        return self.required_by.get(name, set())
+
+    def closure(self, name):
+        """ The project and every project it transitively requires """
+        closure = {name}
+        names = [name]
+        while names:
+            for dep in self.dependencies(names.pop()):
+                if dep not in closure:
+                    closure.add(dep)
+                    names.append(dep)
+        return closure
+
+    def __sort(self, names):
+        """ Orders the projects so requirements come first, raises a
+            DependencyCycleError naming a cycle if there is none """
+        in_degree = {name: 0 for name in names}
+        for name in names:
+            for dep in self.dependencies(name):
+                if dep in in_degree:
+                    in_degree[name] += 1
+
+        ready = sorted(name for name, degree in in_degree.items() if not degree)
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(name)
+            for dependent in self.dependents(name):
+                if dependent in in_degree:
+                    in_degree[dependent] -= 1
+                    if not in_degree[dependent]:
+                        ready.append(dependent)
+
+        if len(order) != len(in_degree):
+            raise DependencyCycleError(self.find_cycle({name for name, degree in in_degree.items()
+                                                        if degree}))
+        return order
+
+    def find_cycle(self, names):
+        """ Finds a cycle among the projects, every project in names must
+            have a requirement in names """
+        path = [min(names)]
+        positions = {path[0]: 0}
+        while True:
+            name = next(dep for dep in self.dependencies(path[-1]) if dep in names)
+            if name in positions:
+                return path[positions[name]:] + [name]
+            positions[name] = len(path)
+            path.append(name)
+
+    def order(self):
+        """ Topological order of all projects, cached until the dependencies
+            change """
+        if self.cached_order() is None:
+            self.set_cached_order(self.__sort(set(self.requires())))
+        return self.cached_order()
+
+    def build_order(self, name):
+        """ The projects that have to be built for the named one in build
+            order. A cycle elsewhere in the workspace doesn't prevent it """
+        closure = self.closure(name)
+        try:
+            order = self.order()
+        except DependencyCycleError:
+            order = self.__sort(closure)
+        return [name_ for name_ in order if name_ in closure]
@@ -0,0 +1,96 @@
+""" Persistent history of finished jobs with timing statistics """
+from json import dumps, loads
+from math import ceil
+from os import replace, makedirs
+from os.path import join, exists, getsize
+from threading import Lock
+import time
+
+
+def percentile(values, pct):
+    """ Nearest-rank percentile of a list of values """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, int(ceil(pct / 100.0 * len(ordered))) - 1)]
+
+
+class JobHistory():
+    """ Append-only log of finished jobs in a workspace. Each job is one
+        compact json line, the log is rotated once it exceeds max_size """
+
+    FILE_NAME = "job_history.jsonl"
+
+    def __init__(self, directory, max_size=1024 * 1024):
+        if not exists(directory):
+            makedirs(directory)
+        self.path = join(directory, JobHistory.FILE_NAME)
+        self.max_size = max_size
+        self.lock = Lock()
+
+    def record(self, project, goal, command, duration, return_code, phases=None):
+        """ Appends a finished job to the history """
+        entry = {'t': round(time.time(), 3),
+                 'p': project,
+                 'g': goal,
+                 'c': command,
+                 'd': round(duration, 3),
+                 'rc': return_code}
+        if phases:
+            entry['ph'] = {k: round(v, 3) for k, v in phases.items()}
+
+        with self.lock:
+            if exists(self.path) and getsize(self.path) > self.max_size:
+                replace(self.path, self.path + ".1")
+
+            with open(self.path, 'a') as f:
+                f.write(dumps(entry, separators=(",", ":")) + "\n")
+
+    def record_job(self, job):
+        """ Appends a job finished by the job handler to the history """
+        times = job.times
+        phases = {}
+        if 'queued' in times and 'started' in times:
+            phases['queue'] = times['started'] - times['queued']
+        if 'started' in times and 'finished' in times:
+            phases['run'] = times['finished'] - times['started']
+        if 'finished' in times and 'handled' in times:
+            phases['exit'] = times['handled'] - times['finished']
+
+        project = getattr(job, 'project', None)
+        self.record(project['name'] if project else None,
+                    job.goal or job.type,
+                    job.cmd if isinstance(job.cmd, str) else " ".join(job.cmd),
+                    times.get('handled', time.time()) - times.get('started', times.get('queued', 0)),
+                    job.return_code,
+                    phases)
+
+    def entries(self):
+        """ Yields all recorded entries, oldest first """
+        for path in [self.path + ".1", self.path]:
+            if not exists(path):
+                continue
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        yield loads(line)
+                    except ValueError:
+                        continue
+
+    def statistics(self):
+        """ Computes run count, failures and duration percentiles per project
+            and goal """
+        durations = {}
+        failures = {}
+        for entry in self.entries():
+            key = (entry['p'] or "-", entry['g'])
+            durations.setdefault(key, []).append(entry['d'])
+            failures[key] = failures.get(key, 0) + (1 if entry['rc'] else 0)
+
+        return [{'project': project,
+                 'goal': goal,
+                 'runs': len(values),
+                 'failures': failures[(project, goal)],
+                 'p50': percentile(values, 50),
+                 'p95': percentile(values, 95)}
+                for (project, goal), values in sorted(durations.items())]
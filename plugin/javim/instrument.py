@@ -0,0 +1,123 @@
+""" Opt-in timers and counters for the hot paths of the plugin """
+from cProfile import Profile
+from functools import wraps
+from inspect import isfunction
+from os import makedirs
+from os.path import join, exists
+from threading import local
+import time
+
+
+class Instrumentation():
+    """ Collects call counts and durations of instrumented functions while
+        enabled. Outermost calls can optionally be profiled with cProfile,
+        one dump per call is written to the profile directory """
+
+    ENABLED = False
+    PROFILE_DIR = None
+    TIMERS = {}
+    COUNTERS = {}
+    RPC_METHODS = ["command", "eval", "call", "command_output"]
+
+    _state = local()
+    _profiles = 0
+
+    @staticmethod
+    def enable(profile_dir=None):
+        Instrumentation.ENABLED = True
+        Instrumentation.PROFILE_DIR = profile_dir or None
+        if profile_dir and not exists(profile_dir):
+            makedirs(profile_dir)
+
+    @staticmethod
+    def disable():
+        Instrumentation.ENABLED = False
+        Instrumentation.PROFILE_DIR = None
+
+    @staticmethod
+    def reset():
+        Instrumentation.TIMERS.clear()
+        Instrumentation.COUNTERS.clear()
+
+    @staticmethod
+    def count(name, amount=1):
+        """ Increments the named counter """
+        if Instrumentation.ENABLED:
+            Instrumentation.COUNTERS[name] = Instrumentation.COUNTERS.get(name, 0) + amount
+
+    @staticmethod
+    def add_time(name, duration):
+        timer = Instrumentation.TIMERS.get(name)
+        if timer is None:
+            timer = Instrumentation.TIMERS[name] = [0, 0.0, 0.0]
+        timer[0] += 1
+        timer[1] += duration
+        timer[2] = max(timer[2], duration)
+
+    @staticmethod
+    def call(name, func, args, kwargs):
+        """ Calls func and records its duration under name """
+        state = Instrumentation._state
+        depth = getattr(state, 'depth', 0)
+        profile = None
+        if depth == 0 and Instrumentation.PROFILE_DIR:
+            profile = Profile()
+
+        state.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            if profile:
+                return profile.runcall(func, *args, **kwargs)
+            return func(*args, **kwargs)
+        finally:
+            Instrumentation.add_time(name, time.perf_counter() - start)
+            state.depth = depth
+            if profile:
+                Instrumentation._profiles += 1
+                profile.dump_stats(join(Instrumentation.PROFILE_DIR, "%s-%i.prof"
+                                        % (name, Instrumentation._profiles)))
+
+    @staticmethod
+    def summary():
+        """ Returns the collected timers and counters as table rows, the
+            slowest timers first """
+        rows = [["name", "calls", "total", "mean", "max"]]
+        for name, (calls, total, longest) in sorted(Instrumentation.TIMERS.items(),
+                                                    key=lambda t: -t[1][1]):
+            rows.append([name, str(calls), "%.1fms" % (total * 1000),
+                         "%.2fms" % (total * 1000 / calls), "%.2fms" % (longest * 1000)])
+        for name, value in sorted(Instrumentation.COUNTERS.items()):
+            rows.append([name, str(value), "", "", ""])
+        return rows
+
+
+def timed(name):
+    """ Decorator recording the duration of each call while instrumentation
+        is enabled """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not Instrumentation.ENABLED:
+                return func(*args, **kwargs)
+            return Instrumentation.call(name, func, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_class(cls, prefix):
+    """ Wraps all public methods of a class with timers """
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("_") or not isfunction(value):
+            continue
+        setattr(cls, attr, timed(prefix + "." + attr)(value))
+    return cls
+
+
+def instrument_rpc(vim):
+    """ Wraps the request methods of a vim object with timers so round
+        trips to neovim are measured """
+    for method in Instrumentation.RPC_METHODS:
+        func = getattr(vim, method, None)
+        if func is not None and not hasattr(func, '__wrapped__'):
+            setattr(vim, method, timed("rpc." + method)(func))
+    return vim
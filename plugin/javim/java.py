@@ -1,5 +1,7 @@
 from javim.buffer_change import BufferChangeListener, BufferChangeDispatcher
-from javim.util_classes import OffsetChain, ReplaceRangeOffsetChainUpdate, DeleteOffsetChainUpdate, DelayedAction
+from javim.util_classes import DelayedAction
+from javim.grammar import GrammarManager
+from javim.document import Document
 import javim
 import treelib as tl
 from tempfile import mkstemp
@@ -8,12 +10,7 @@ from os.path import exists
 from threading import Lock
 
 
-from tree_sitter import Language, Parser, Tree
-
-Language.build_library("build/langs.so", ["/home/friese/git/tree-sitter-java"])
-JAVA_LANG = Language("build/langs.so", "java")
-parser = Parser()
-parser.set_language(JAVA_LANG)
+from tree_sitter import Tree
 
 _, tree_file = mkstemp(suffix="tree")
 
@@ -68,98 +65,53 @@ class JavaAstBufferChangeListener(BufferChangeListener):
     def __init__(self, nvim):
         self.nvim = nvim
         self.buffers = dict()
+        self.__parser = None
 
-    def parse_buffer(self, bufnr):
-        buffer = self.nvim.buffers[bufnr]
-        chain = OffsetChain()
-        for line in buffer:
-            chain.append(len(line) + 1)
-
-        for index, elem in enumerate(chain.elements):
-            line = index + 1
-            byte = int(self.nvim.eval("line2byte(%i)" % line))
-            self.nvim.command("echom 'Line %i\tByte: %i\tOffset: %i'" % (line, byte, elem.offset))
+    def parser(self):
+        """ The java grammar is loaded or built with the first parse """
+        if self.__parser is None:
+            self.__parser = GrammarManager.instance().parser("java")
+        return self.__parser
 
-        tree = parser.parse(bytes("\n".join(buffer), "utf-8"))
-        action = DelayedAction(0.1, lambda: self.nvim.async_call(lambda: show_tree(tree, self.nvim)))
+    def parse_buffer(self, bufnr):
+        document = Document(self.nvim.buffers[bufnr][:])
+        tree = self.parser().parse(document.read)
+        action = DelayedAction(0.1, lambda: self.nvim.async_call(lambda: show_tree(self.buffers[bufnr]['tree'], self.nvim)))
 
         self.buffers[bufnr] = {
-            'chain': chain,
+            'document': document,
             'tree': tree,
-            'lines': list(buffer[::]),
             'action': action
         }
 
         action.reset()
 
     def update_buffer(self, bufnr, start, end, replacement):
-        self.nvim.command("echom 'replacement: %s'" % str(replacement).replace("'", "''"))
-        chain: OffsetChain = self.buffers[bufnr]['chain']
+        """ Applies a lines event replacing the lines from start to end
+            (exclusive). The edit is translated to byte offsets through the
+            document and the tree is reparsed with the edited old tree, so
+            tree-sitter reuses the subtrees outside of the edit. The source
+            is read from the document in chunks """
+        document: Document = self.buffers[bufnr]['document']
         tree: Tree = self.buffers[bufnr]['tree']
-        lines: list = self.buffers[bufnr]['lines']
-
-
-        start_byte = None
-        start_point = None
-        old_end_byte = None
-        new_end_byte = None
-        old_end_point = None
-        new_end_point = None
-
-        if start == end:
-            # added
-            start_byte = chain.elements[start] if start else 0
-            start_point = (start, 0)
-            old_end_byte = start_byte
-            new_end_byte = start_byte + len(bytes("\n".join(replacement), "utf-8")) + 1
-            old_end_point = start_point
-            new_end_point = (start + len(replacement), 0)
-            #TODO: insert all replacement lines into chain
-
-        elif replacement:
-            # replaced
-
-            pass
-        else:
-            # deleted
-            pass
-
-
-        first_line = chain.elements[start]
-        last_line = chain.elements[end]
-
-
-        start_byte = first_line.offset + 1
-        start_point = (start, 0)
-        old_end_byte = last_line.offset + last_line.length + 1
-        new_end_byte = start_byte + len(bytes("\n".join(replacement), "utf-8"))
-        old_end_point = (end, last_line.length)
-        new_end_point = (start - 1 + len(replacement), len(replacement[-1]) + 1) if replacement else start_point
-
-        print("start_byte:", start_byte, "start_point:", start_point, "old_end_byte:", old_end_byte, "new_end_byte:", new_end_byte, "old_end_point:", old_end_point, "new_end_point:", new_end_point)
+        if end < 0:
+            end = len(document)
 
+        start_byte = document.line_offset(start)
+        old_end_byte = document.line_offset(end)
+        document.replace_lines(start, end, replacement)
         tree.edit(
             start_byte = start_byte,
             old_end_byte = old_end_byte,
-            new_end_byte = new_end_byte,
-            start_point = start_point,
-            old_end_point = old_end_point,
-            new_end_point = new_end_point
+            new_end_byte = document.line_offset(start + len(replacement)),
+            start_point = (start, 0),
+            old_end_point = (end, 0),
+            new_end_point = (start + len(replacement), 0)
         )
 
-        for i in range(end, start, -1):
-            del lines[i - 1]
-        for i, line in enumerate(replacement):
-            lines.insert(start + i, line)
-
-        self.buffers[bufnr]['tree'] = parser.parse(bytes("\n".join(lines), "utf-8"))
+        self.buffers[bufnr]['tree'] = self.parser().parse(document.read, tree)
         self.buffers[bufnr]['action'].reset()
 
-        if replacement:
-            chain.mass_update(ReplaceRangeOffsetChainUpdate(start, end, list(map(lambda l: len(l) + 1, replacement))))
-        else:
-            chain.mass_update(DeleteOffsetChainUpdate(list(range(start, end))))
-
     def handle_event(self, buffer, changedtick, firstline, lastline, linedata, is_multipart):
         if buffer not in self.buffers:
             self.parse_buffer(buffer)
@@ -1,125 +1,317 @@
-from queue import Queue
-from subprocess import run
+""" Runs jobs either visible in a terminal buffer, in the foreground or
+    concurrently in the background on an asyncio event loop """
+from asyncio import (new_event_loop, create_subprocess_exec, wait_for, gather,
+                     CancelledError, TimeoutError as AsyncTimeoutError)
+from asyncio.subprocess import PIPE
+from heapq import heappush, heappop
+from itertools import count
+from os import cpu_count, killpg
+from signal import SIGKILL
 from threading import Thread
+import time
+from .output import output_pipeline
+from .instrument import timed
+from .rpc import RpcBatch
 
 
 class JobHandler:
+    """ Runs jobs for neovim. Visible and foreground jobs run one at a time
+        in the order of their priority, background jobs run concurrently up
+        to max_background on an event loop in a separate thread. Results are
+        always handed back on the main thread """
 
     INSTANCES = []
+    LINE_LIMIT = 1024 * 1024
 
-    def __init__(self, vim):
+    def __init__(self, vim, max_background=None, history=None):
         self.vim = vim
+        self.history = history
         self.jobs = {}
-        self.processses = {}
         self.visible_running = False
         self.foreground_running = False
-        self.waiting_jobs = Queue()
+        self.waiting_jobs = []
+        self.max_background = max_background or cpu_count() or 1
+        self.background_waiting = []
+        self.background_running = {}
+        self.sequence = count()
+        self.loop = new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
         JobHandler.INSTANCES.append(self)
-        self.tid = 0
 
     def __check_queue(self, job_done):
         if job_done.fail_clear and job_done.failed:
             self.vim.command('echom "Job failed clearing queue..."')
-            while not self.waiting_jobs.empty():
-                self.waiting_jobs.get()
+            for _, _, job in self.waiting_jobs:
+                job.cancelled = True
+            self.waiting_jobs = []
             return
 
-        if not self.waiting_jobs.empty() and not self.visible_running or self.foreground_running:
+        if self.waiting_jobs and not (self.visible_running or self.foreground_running):
             self.vim.command('echom "Job successfully, running next job..."')
-            job = self.waiting_jobs.get()
+            _, _, job = heappop(self.waiting_jobs)
             self.__start_job(job)
         else:
             self.vim.command('echom "No more jobs found!"')
 
     def __start_job(self, job):
-        if job.options['visible']:
-            buf_nr = int(self.vim.eval('bufnr("Console")'))
-            if buf_nr != -1:
-                self.vim.command("b %i | bw!" % buf_nr)
-            self.vim.command("bot 10sp | enew")
+        if job.options['visible'] or job.options['foreground']:
+            job.times['started'] = time.time()
 
-            job_id = int(self.vim.eval(job.get_vim_command()))
+        if job.options['visible']:
+            job_id = int(RpcBatch(self.vim).command(RpcBatch.CLOSE_CONSOLE)
+                                           .command("bot 10sp | enew")
+                                           .eval(job.get_vim_command())
+                                           .command("file Console")
+                                           .command("normal G")
+                                           .send()[2])
             if job_id > 0:
-                self.vim.command("file Console")
                 self.visible_running = True
+                job.options['job_id'] = job_id
                 self.jobs[job_id] = job
-                self.vim.command("normal G")
             else:
                 self.vim.command("bd!")
         elif job.options['foreground']:
             self.foreground_running = True
             self.vim.command("!%s" % job.cmd)
+            job.times['finished'] = time.time()
             self.foreground_running = False
-            self.__check_queue()
-        else:
-            def run_thread(tid):
-                self.subpress_exit(run(job.cmd,
-                                       capture_output=True,
-                                       encoding="utf-8",
-                                       cwd=job.cwd))
-            t = Thread(target=run_thread, args=self.tid)
-            self.processses[self.tid] = job
-            self.tid += 1
-            t.start()
-
-    def subpress_exit(self, process):
-        args = process.args
-        tid = None
-        if type(args) == list:
-            tid = args[0]
+            self.__job_exit(job, JobResult(int(self.vim.eval("v:shell_error")), None, None))
+            self.__check_queue(job)
         else:
-            tid = int(args)
+            self.loop.call_soon_threadsafe(self.__enqueue_background, job)
 
-        job = self.processses[tid]
-        del self.processses[tid]
-        self.foreground_running = False
-        self.visible_running = False
-        if process.return_code != 0:
+    def __enqueue_background(self, job):
+        heappush(self.background_waiting, (job.priority, next(self.sequence), job))
+        self.__dispatch_background()
+
+    def __dispatch_background(self):
+        while self.background_waiting and len(self.background_running) < self.max_background:
+            _, _, job = heappop(self.background_waiting)
+            if job.cancelled:
+                result = JobResult(-1, "", "", True)
+                self.vim.async_call((lambda j, r: lambda: self.background_exit(j, r))(job, result))
+                continue
+            self.background_running[job] = self.loop.create_task(self.__run_background(job))
+
+    async def __run_background(self, job):
+        process = None
+        job.times['started'] = time.time()
+        stdout, stdout_lines = output_pipeline(self.vim, job.max_output_lines, job.parse_errors)
+        stderr, stderr_lines = output_pipeline(self.vim, job.max_output_lines, job.parse_errors)
+        try:
+            process = await create_subprocess_exec(*job.args(),
+                                                   cwd=job.cwd,
+                                                   stdout=PIPE,
+                                                   stderr=PIPE,
+                                                   limit=JobHandler.LINE_LIMIT,
+                                                   start_new_session=True)
+            await wait_for(gather(JobHandler.__stream(process.stdout, stdout),
+                                  JobHandler.__stream(process.stderr, stderr),
+                                  process.wait()),
+                           job.timeout)
+            return_code = process.returncode
+        except AsyncTimeoutError:
+            await self.__kill(process)
+            return_code = -1
+            stderr_lines.append("Job timed out after %ss" % job.timeout)
+        except CancelledError:
+            await self.__kill(process)
+            return_code = -1
+            job.cancelled = True
+        except OSError as e:
+            return_code = -1
+            stderr_lines.append(str(e))
+        finally:
+            job.times['finished'] = time.time()
+            del self.background_running[job]
+            self.__dispatch_background()
+
+        result = JobResult(return_code,
+                           "\n".join(stdout_lines),
+                           "\n".join(stderr_lines),
+                           job.cancelled)
+        self.vim.async_call(lambda: self.background_exit(job, result))
+
+    @staticmethod
+    async def __stream(reader, pipeline):
+        """ Sends the lines of a stream through the pipeline as they arrive """
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                line = await reader.read(JobHandler.LINE_LIMIT)
+            if not line:
+                break
+            pipeline.send(line.decode("utf-8", "replace").rstrip("\n"))
+        pipeline.send(None)
+
+    @staticmethod
+    async def __kill(process):
+        if process and process.returncode is None:
+            try:
+                killpg(process.pid, SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    @timed("jobs.background_exit")
+    def background_exit(self, job, result):
+        """ Called on the main thread when a background job finished """
+        self.__job_exit(job, result)
+
+    def __job_exit(self, job, result):
+        job.return_code = result.return_code
+        if result.return_code != 0:
             job.failed = True
-        self.__check_queue(job)
         if job.on_exit:
-            job.on_exit(JobResult(process.return_code,
-                                  process.stdout,
-                                  process.stderr))
+            job.on_exit(result)
+
+        job.times['handled'] = time.time()
+        if self.history and not result.cancelled:
+            self.history.record_job(job)
+
+    def cancel(self, job):
+        """ Cancels a waiting or running job """
+        job.cancelled = True
+        if 'job_id' in job.options and job.options['job_id'] in self.jobs:
+            self.vim.eval("jobstop(%i)" % job.options['job_id'])
+            return
+
+        def cancel_background():
+            if job in self.background_running:
+                self.background_running[job].cancel()
+        self.loop.call_soon_threadsafe(cancel_background)
 
+    def shutdown(self):
+        """ Cancels all background jobs and stops the event loop """
+        def stop():
+            for task in self.background_running.values():
+                task.cancel()
+            self.background_waiting = []
+            self.loop.call_soon(self.loop.stop)
+        self.loop.call_soon_threadsafe(stop)
 
+    @timed("jobs.handle_termclose")
     def handle_termclose(self, job_id, data):
         if job_id not in self.jobs:
             self.vim.command('echom "Job id %i unkown!"' % job_id)
             return
         job = self.jobs[job_id]
         del self.jobs[job_id]
+        job.times['finished'] = time.time()
         self.foreground_running = False
         self.visible_running = False
-        if int(data) != 0:
-            job.failed =True
-        if job.on_exit:
-            job.on_exit(JobResult(int(data), None, None))
+        self.__job_exit(job, JobResult(int(data), None, None))
 
         self.__check_queue(job)
 
 
     def start(self, job, visible=True, foreground=False):
+        job.times['queued'] = time.time()
         job.options['visible'] = visible
         job.options['foreground'] = foreground
 
-        if visible:
-            if self.visible_running or self.foreground_running:
-                self.waiting_jobs.put(job)
-            else:
-                self.__start_job(job)
-        elif foreground:
+        if visible or foreground:
             if self.visible_running or self.foreground_running:
-                self.waiting_jobs.put(job)
+                heappush(self.waiting_jobs, (job.priority, next(self.sequence), job))
             else:
                 self.__start_job(job)
         else:
             self.__start_job(job)
 
 
+class JobGraph:
+    """ A set of jobs with dependencies between them. Independent jobs run
+        concurrently in the background, a job starts as soon as all of its
+        prerequisites finished. A failing fail_clear job only drops the jobs
+        depending on it, other branches keep running """
+
+    def __init__(self, on_done=None):
+        self.jobs = {}
+        self.requires = {}
+        self.dependents = {}
+        self.on_done = on_done
+        self.waiting = set()
+        self.running = set()
+        self.failed = set()
+        self.dropped = set()
+        self.handler = None
+        self.max_workers = 1
+
+    def add(self, name, job, requires=()):
+        """ Adds a job that must not start before the named jobs finished """
+        self.jobs[name] = job
+        self.requires[name] = set(requires)
+        for req in requires:
+            self.dependents.setdefault(req, set()).add(name)
+
+    def start(self, handler, max_workers):
+        """ Starts the graph on the provided job handler """
+        self.handler = handler
+        self.max_workers = max(1, max_workers)
+        self.waiting = set(self.jobs)
+
+        for name, job in self.jobs.items():
+            job.on_exit = (lambda n, f: lambda r: self.__job_done(n, r, f))(name, job.on_exit)
+
+        self.__schedule()
+
+    def __schedule(self):
+        blocked = self.waiting | self.running
+        ready = [name for name in sorted(self.waiting)
+                 if not self.requires[name] & blocked]
+
+        for name in ready[:self.max_workers - len(self.running)]:
+            self.waiting.remove(name)
+            self.running.add(name)
+            self.handler.start(self.jobs[name], visible=False)
+
+        if not self.running and not self.waiting and self.on_done:
+            on_done = self.on_done
+            self.on_done = None
+            on_done(not self.failed and not self.dropped)
+
+    def __job_done(self, name, result, on_exit):
+        job = self.jobs[name]
+        job.on_complete = None
+        try:
+            if on_exit:
+                on_exit(result)
+        except Exception:
+            # the job's results weren't applied, its dependents can't run
+            job.deferred = False
+            self.__finish(name, result, True)
+            raise
+
+        if job.deferred:
+            job.on_complete = lambda: self.__finish(name, result)
+        else:
+            self.__finish(name, result)
+
+    def __finish(self, name, result, error=False):
+        self.running.remove(name)
+        if error or result.return_code != 0:
+            self.failed.add(name)
+            if error or self.jobs[name].fail_clear:
+                self.__drop_dependents(name)
+        self.__schedule()
+
+    def __drop_dependents(self, name):
+        names = list(self.dependents.get(name, []))
+        while names:
+            dependent = names.pop()
+            if dependent in self.waiting:
+                self.waiting.remove(dependent)
+                self.dropped.add(dependent)
+                names += self.dependents.get(dependent, [])
+
+
 class Job:
 
-    def __init__(self, job_type, cwd, cmd, on_exit=None, fail_clear=False):
+    def __init__(self, job_type, cwd, cmd, on_exit=None, fail_clear=False,
+                 priority=0, timeout=None, parse_errors=False,
+                 max_output_lines=2000):
         self.type = job_type
         self.cmd = cmd
         self.cwd = cwd
@@ -127,6 +319,34 @@ class Job:
         self.options = {}
         self.fail_clear = fail_clear
         self.failed = False
+        self.cancelled = False
+        self.priority = priority
+        self.timeout = timeout
+        self.parse_errors = parse_errors
+        self.max_output_lines = max_output_lines
+        self.goal = None
+        self.times = {}
+        self.return_code = None
+        self.deferred = False
+        self.on_complete = None
+
+    def defer(self):
+        """ Called by on_exit if the results of the job are applied
+            asynchronously. In a job graph the job only counts as finished,
+            and its dependents only start, once complete was called """
+        self.deferred = True
+
+    def complete(self):
+        self.deferred = False
+        if self.on_complete:
+            on_complete, self.on_complete = self.on_complete, None
+            on_complete()
+
+    def args(self):
+        """ Returns the command as argument list, strings run in a shell """
+        if isinstance(self.cmd, list):
+            return self.cmd
+        return ["/bin/sh", "-c", self.cmd]
 
     def get_vim_command(self):
         return "termopen('" + self.cmd.replace("'", "''") + "', {'on_exit': 'javim#handleTermClose'})"
@@ -134,7 +354,8 @@ class Job:
 
 class JobResult:
 
-    def __init__(self, return_code, stdout, stderr):
+    def __init__(self, return_code, stdout, stderr, cancelled=False):
         self.return_code = return_code
         self.stdout = stdout
         self.stderr = stderr
+        self.cancelled = cancelled
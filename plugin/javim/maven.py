@@ -1,13 +1,36 @@
 """ This module provides the means to compile, run and manage workspace
     projects with maven"""
-from os import mkdir, remove
-from os.path import exists, join, basename, normpath, expanduser
+from hashlib import sha1
+from json import dumps
+from os import makedirs, remove, cpu_count
+from os.path import exists, join, normpath, expanduser, relpath, realpath, abspath
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor, wait,
+                                FIRST_COMPLETED)
+from multiprocessing import get_context
+from shlex import quote
 from subprocess import run
 from tempfile import NamedTemporaryFile
+from threading import Thread, current_thread, main_thread
+from xml.sax.saxutils import escape
+import re
 import time
 from lxml import etree
-from .settings import Workspace, GlobalSetting
-from .jobs import Job, JobHandler
+from .settings import Workspace, GlobalSetting, ProjectSetting
+from .jobs import Job, JobHandler, JobGraph
+from .pom import (EffectivePomCache, PomResolver, PomResolutionError,
+                  resolve_project_pom, module_dirs, init_worker)
+from .repository import LocalRepository
+from .changes import SourceManifest
+from .compiler import IncrementalCompiler
+from .daemon import MavenDaemon
+from .history import JobHistory
+from .instrument import Instrumentation, timed
+from .rpc import RpcBatch
+from .graph import DependencyGraph, DependencyCycleError
+
+
+class ProjectImportError(Exception):
+    """ Raised if a project can't be imported """
 
 
 class Maven():
@@ -27,6 +50,18 @@ class Maven():
                            "settings.localRepository -Doutput=%s")
     JARFILE_TEMPLATE = ("%(groupId)s/%(artifactId)s/%(version)s/"
                         "%(artifactId)s-%(version)s.jar")
+    REACTOR_POM_TEMPLATE = ("<project xmlns=\"http://maven.apache.org/POM/4.0.0\">"
+                            "<modelVersion>4.0.0</modelVersion>"
+                            "<groupId>javim</groupId>"
+                            "<artifactId>javim-reactor</artifactId>"
+                            "<version>1</version>"
+                            "<packaging>pom</packaging>"
+                            "<modules>%s</modules>"
+                            "</project>")
+    REACTOR_MODULE_TEMPLATE = "<module>%s</module>"
+    REACTOR_BUILD_TEMPLATE = ("(%s -B --fail-at-end -f %s %s %s %s; echo $? > %s) 2>&1 "
+                              "| tee %s; exit $(cat %s)")
+    REACTOR_SUMMARY_REGEX = re.compile(r"^\[INFO\] (.+?) \.+ (SUCCESS|FAILURE|SKIPPED)")
 
     GROUPID_XPATH = "//ns:project/ns:groupId/text()"
     ARTIFACTID_XPATH = "//ns:project/ns:artifactId/text()"
@@ -56,24 +91,75 @@ class Maven():
                              {'executable': 'mvn',
                               'repo_path': expanduser('~/.m2/repository'),
                               'default_java_source': '1.8',
-                              'default_java_target': '1.8'})
+                              'default_java_target': '1.8',
+                              'native_pom_resolver': True,
+                              'offline_classpath': True,
+                              'build_workers': 0,
+                              'reactor_build': False,
+                              'daemon': False,
+                              'daemon_executable': 'mvnd',
+                              'incremental_compile': True,
+                              'javac_executable': 'javac',
+                              'instrumentation': False,
+                              'profile_dir': ''})
 
     INSTANCE = None
 
-    def __init__(self, vim, workspace=Workspace()):
-        self.workspace = workspace
+    def __init__(self, vim, workspace=None):
+        self.workspace = workspace if workspace is not None else Workspace()
         self.vim = vim
         self.project_config = dict()
-        self.executable = Maven.SETTINGS.executable()
-        vim.command("cd " + self.workspace.dir())
+        self.daemon = None
+        if Maven.SETTINGS.daemon():
+            self.daemon = MavenDaemon(Maven.SETTINGS.daemon_executable(),
+                                      Maven.SETTINGS.executable())
+            self.daemon.check_later()
         Maven.INSTANCE = self
-        self.job_handler = JobHandler(vim)
+        self.history = JobHistory(self.workspace.settings_dir())
+        self.graph = DependencyGraph(self.workspace)
+        self.workspace.listeners['project_remove'].append(self.project_removed)
+        self.job_handler = JobHandler(vim, self.build_workers(), self.history)
+        self.pom_cache = EffectivePomCache(join(self.workspace.settings_dir(),
+                                                "effective-poms"),
+                                           Maven.SETTINGS.repo_path())
+        self.pom_resolver = PomResolver(Maven.SETTINGS.repo_path())
+        self.repository = LocalRepository(Maven.SETTINGS.repo_path(),
+                                          self.pom_resolver)
+        self.classpath_caches = {}
+        self.source_manifests = {}
+        self.pom_updates = {}
+        self.classpath_pool = ThreadPoolExecutor(max_workers=self.build_workers())
+        self.compiler = IncrementalCompiler(Maven.SETTINGS.javac_executable())
+
+    @property
+    def executable(self):
+        """ Returns the maven client used for builds. With the daemon setting
+            enabled the maven daemon client is used while the daemon is
+            healthy, it submits the goals to a warm build JVM over a local
+            socket instead of starting a new one """
+        if self.daemon:
+            return self.daemon.executable()
+        return Maven.SETTINGS.executable()
+
+    def build_failed(self):
+        """ Checks whether the daemon is still alive after a failed build and
+            restarts it if not """
+        if self.daemon:
+            self.daemon.check_later()
+
+    def __command(self, cmd):
+        """ Runs the command, from other threads it is scheduled on the main
+            thread """
+        if current_thread() is main_thread():
+            self.vim.command(cmd)
+        else:
+            self.vim.async_call(self.vim.command, cmd)
 
     def __print_error(self, msg):
-        self.vim.command("echoerr \"%s\"" % msg)
+        self.__command("echoerr \"%s\"" % msg)
 
     def __print(self, msg):
-        self.vim.command("echo \"%s\"" % (msg.replace("\n", "\\n")))
+        self.__command("echo \"%s\"" % (msg.replace("\n", "\\n")))
 
 
     def chain_visible_backgroud_jobs(self, cmds):
@@ -85,8 +171,9 @@ class Maven():
         self.vim.command("bot 10sp | call termopen('bash " + script_file.name + "')")
 
     def execute_visible_backgroud_command(self, cmd):
-        self.vim.command("bot 10sp | call termopen('" + cmd.replace("'", "''") + "')")
-        self.vim.command("file Console")
+        RpcBatch(self.vim).command("bot 10sp | call termopen('" + cmd.replace("'", "''") + "')") \
+                          .command("file Console") \
+                          .send()
 
     def init_project_config(self, project):
         """ Creates the initial project configuration with default values """
@@ -104,6 +191,7 @@ class Maven():
                                    'dep_classpath': [],
                                    'dep_projects': [],
                                    'rebuild': True,
+                                   'install_stale': False,
                                    'last_built': None}
 
         project['maven_info'] = {'groupId': '',
@@ -126,81 +214,219 @@ class Maven():
     # pylint: disable=R0913
     def create_project(self, group_id, artifact_id, name=None,
                        archetype="maven-archetype-simple", version="1.4",
-                       target_dir=None):
-        """ Creates a new maven project, default archetype is the most simple.
-            A target directory can be supplied, that directory shouldn't be in
-            the workspace.
-            The supplied name will determine the name of the link """
-
-        if not target_dir:
-            proj_name = name if name else artifact_id
-            proj_path = join(self.workspace.dir(), proj_name)
-            if not exists(proj_path):
-                mkdir(proj_path)
-        else:
-            proj_name = basename(normpath(target_dir))
-            proj_path = normpath(target_dir)
+                       target_dir=None, on_done=None):
+        """ Creates a new maven project in the background, default archetype
+            is the most simple. The project is generated in the target
+            directory, the workspace directory by default. The supplied name
+            will determine the name of the project. on_done is called like
+            for import_projects_async """
+        parent = normpath(target_dir) if target_dir else self.workspace.dir()
+        directory = join(parent, artifact_id)
+        if exists(directory):
+            self.__print_error("Directory '%s' already exists!" % directory)
+            return
+
+        args = [self.executable] + (Maven.CREATION_TEMPLATE % (group_id, artifact_id,
+                                                                archetype, version)).split()
+
+        def generate():
+            res = run(args, capture_output=True, encoding="utf-8", cwd=parent)
+            if res.returncode:
+                raise ProjectImportError("Error creating project:\n" + res.stdout)
+
+        self.import_projects_async([directory], on_done, names={directory: name},
+                                   prepare=generate)
+
+    def analyze_project(self, directory, name=None):
+        """ Reads and resolves the pom of a project directory without adding
+            it to the workspace. The name defaults to the name or artifact id
+            of the pom. Does not touch the editor or the workspace and may
+            be called off the main thread. Raises a ProjectImportError """
+        pom_path = join(directory, "pom.xml")
+        if not exists(pom_path):
+            raise ProjectImportError("Couldn't find pom.xml in '" + pom_path + "'!")
 
-        if proj_name in self.workspace.projects():
-            self.__print_error(("There is already a project with name '%s' in "
-                                "the current workspace") % proj_name)
-            return None
+        try:
+            pom = etree.parse(pom_path)
+        except Exception as e:
+            raise ProjectImportError("Cannot read '" + pom_path + "': " + str(e))
+        root = pom.getroot()
+        namespace = root.nsmap[root.prefix]
 
-        mvn_command = Maven.CREATION_TEMPLATE % (group_id, artifact_id,
-                                                 archetype, version)
+        named = bool(name)
+        if not named:
+            name = self.pom_name(pom, namespace)
 
-        self.vim.command(Maven.COMMAND_CHDIR_TEMPLATE % (proj_path,
-                                                         self.executable,
-                                                         mvn_command))
-        project = self.workspace.add_project(proj_name)
+        project = {'name': name, 'path': directory}
         self.init_project_config(project)
-        eff_pom = self.create_effective_pom(project)
-
+        eff_pom = self.resolve_effective_pom(project)
         if not eff_pom:
-            self.__print_error("Error importing project!")
-            self.workspace.remove_project(project['name'])
-            return None
+            raise ProjectImportError("Couldn't resolve the effective pom of '%s'!" % name)
 
+        if not named:
+            # the raw name may still contain ${...} expressions
+            eff_root = eff_pom.getroot()
+            project['name'] = self.pom_name(eff_pom, eff_root.nsmap[eff_root.prefix])
         self.process_pom(project, eff_pom)
-        self.process_added_project(project)
+        return project
 
+    def pom_name(self, pom, namespace):
+        """ The name of a pom, its artifact id if it has none """
+        pom_name = self.xpath(pom, Maven.NAME_XPATH, namespace)
+        if pom_name:
+            return pom_name[0]
+        return self.xpath(pom, Maven.ARTIFACTID_XPATH, namespace)[0]
+
+    def project_draft(self, directory, name, eff_pom):
+        """ Creates a project not yet added to the workspace from its
+            effective pom """
+        project = {'name': name, 'path': directory}
+        self.init_project_config(project)
+        self.process_pom(project, eff_pom)
         return project
 
+    def module_dirs(self, directory):
+        """ Directories of the modules aggregated by the pom in directory """
+        try:
+            return module_dirs(self.pom_resolver.read_model(join(directory, "pom.xml")))
+        except PomResolutionError:
+            return []
+
+    def add_analyzed_projects(self, analyzed):
+        """ Adds analyzed projects to the workspace at once and links them
+            with the projects they depend on. Returns the added projects and
+            the errors of the rejected ones """
+        added = []
+        errors = []
+        for draft in analyzed:
+            existing = self.workspace.find_project(draft['path'])
+            if existing and realpath(existing['path']) == realpath(draft['path']):
+                errors.append("'%s' is already imported as '%s'!" % (draft['path'],
+                                                                   existing['name']))
+                continue
+            if draft['name'] in self.workspace.projects():
+                errors.append(("There is already a project with name '%s' in "
+                               "the current workspace!") % draft['name'])
+                continue
+
+            project = self.workspace.import_project(draft['name'], draft['path'])
+            for key in ['maven_config', 'maven_info', 'java_config']:
+                project[key] = draft[key]
+            added.append(project)
+
+        if added:
+            self.graph.update_projects(added)
+            self.workspace.save_later()
+            self.graph.save_later()
+        return added, errors
+
+    @timed("maven.import_project")
     def import_project(self, directory, name=None):
         """ Import an existing maven project into the workspace, the name
             must be unique. If none is provided, one must be set in the
             imported projects pom.xml """
-        pom_path = join(directory, "pom.xml")
-        if not exists(pom_path):
-            self.__print_error("Couldn't find pom.xml in '" + pom_path + "'!")
-
-        pom, namespace = self.read_pom(None, pom_path)
-        if not pom:
-            return None
-
-        if not name:
-            pom_name = self.xpath(pom, Maven.NAME_XPATH, namespace)
-            if pom_name:
-                name = pom_name[0]
-            else:
-                name = self.xpath(pom, Maven.ARTIFACTID_XPATH, namespace)[0]
-
-        if name in self.workspace.projects():
-            self.__print_error(("There is already a project with name '%s' in "
-                                "the current workspace!") % name)
-            return None
-
-        project = self.workspace.import_project(name, directory)
-        self.init_project_config(project)
-        eff_pom = self.create_effective_pom(project)
-        if not eff_pom:
-            self.workspace.remove_project(project['name'])
+        try:
+            draft = self.analyze_project(abspath(directory), name)
+        except ProjectImportError as e:
+            self.__print_error(str(e))
             return None
 
-        self.process_pom(project, eff_pom)
-        self.process_added_project(project)
-        
-        return project
+        added, errors = self.add_analyzed_projects([draft])
+        for error in errors:
+            self.__print_error(error)
+        return added[0] if added else None
+
+    def import_projects_async(self, directories, on_done, on_progress=None,
+                              names=None, prepare=None, modules=False):
+        """ Analyzes the project directories concurrently and adds them to
+            the workspace at once when all are done. With modules the
+            modules aggregated by the poms are imported as well,
+            recursively. Poms are resolved in a pool of spawned processes,
+            forking the multi-threaded host isn't safe. Projects the
+            native resolver can't handle are analyzed with maven on a thread
+            pool. Both callbacks are called on the main thread, on_progress
+            with the number of finished and known projects and the last
+            directory, on_done with the added projects and the error
+            messages. prepare runs on the background thread before the
+            analysis """
+        directories = [abspath(directory) for directory in directories]
+        names = names or {}
+        native = Maven.SETTINGS.native_pom_resolver()
+        repo_path = Maven.SETTINGS.repo_path()
+        workers = self.build_workers()
+
+        def analyze():
+            analyzed = []
+            errors = []
+            order = {directory: index for index, directory in enumerate(directories)}
+            pending = {}
+            try:
+                if prepare:
+                    prepare()
+                with ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=get_context("spawn"),
+                                         initializer=init_worker) as processes, \
+                     ThreadPoolExecutor(max_workers=workers) as threads:
+
+                    def submit(directory, fallback=False):
+                        if native and not fallback:
+                            future = processes.submit(resolve_project_pom, directory, repo_path)
+                        else:
+                            future = threads.submit(self.analyze_project, directory,
+                                                    names.get(directory))
+                        pending[future] = directory
+
+                    for directory in directories:
+                        submit(directory)
+
+                    finished = 0
+                    while pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            directory = pending.pop(future)
+                            children = None
+                            try:
+                                result = future.result()
+                                if isinstance(result, dict):
+                                    analyzed.append(result)
+                                else:
+                                    name, xml, children = result
+                                    analyzed.append(self.project_draft(
+                                        directory,
+                                        names.get(directory) or name,
+                                        etree.ElementTree(etree.fromstring(xml))))
+                            except PomResolutionError:
+                                submit(directory, True)
+                                continue
+                            except ProjectImportError as e:
+                                errors.append(str(e))
+                            except Exception as e:
+                                errors.append("Couldn't import '%s': %s" % (directory, str(e)))
+
+                            if modules:
+                                if children is None:
+                                    children = self.module_dirs(directory)
+                                for child in children:
+                                    if child not in order:
+                                        order[child] = len(order)
+                                        submit(child)
+                            finished += 1
+                            if on_progress:
+                                self.vim.async_call(on_progress, finished, len(order), directory)
+            except ProjectImportError as e:
+                errors.append(str(e))
+            except Exception as e:
+                errors.append("Import failed: " + str(e))
+
+            analyzed.sort(key=lambda draft: order[draft['path']])
+
+            def apply():
+                added, rejected = self.add_analyzed_projects(analyzed)
+                if on_done:
+                    on_done(added, errors + rejected)
+            self.vim.async_call(apply)
+
+        Thread(target=analyze, daemon=True).start()
 
     def build_project(self, goals, project, profiles=None, properties=None):
         """ Builds the projects using the provided goals """
@@ -212,7 +438,7 @@ class Maven():
         props = " ".join(map(lambda k: Maven.PROPERTIES_TEMPLATE
                              % (k, properties[k]), properties or []))
 
-        self.vim.command(Maven.BUILD_TEMPLATE % (self.executable(),
+        self.vim.command(Maven.BUILD_TEMPLATE % (self.executable,
                                                  project['path'],
                                                  goals_,
                                                  profiles_,
@@ -243,30 +469,57 @@ class Maven():
         """" Evaluates an xpath expression using the provided namespace """
         return node.xpath(path, namespaces={'ns': namespace})
 
+    @timed("maven.resolve_effective_pom")
+    def resolve_effective_pom(self, project):
+        """ Resolves the effective pom in process and falls back to maven
+            if the pom can't be resolved natively """
+        if Maven.SETTINGS.native_pom_resolver():
+            try:
+                return self.pom_resolver.effective_pom(join(project['path'], 'pom.xml'),
+                                                       project['maven_config']['selected_profiles'])
+            except PomResolutionError as e:
+                self.__print("Falling back to maven: " + str(e))
+
+        return self.create_effective_pom(project)
+
+    @timed("maven.create_effective_pom")
     def create_effective_pom(self, project):
-        """ Create the effective pom and parse as xml tree """
-        profiles = project['maven_config']['profiles']
+        """ Create the effective pom and parse as xml tree. The result is
+            cached until one of the contributing poms changes. Only the
+            selected profiles are activated, the profiles key lists every
+            profile of the pom """
+        profiles = project['maven_config']['selected_profiles']
         prof_str = ",".join(profiles)
         if prof_str:
             prof_str = Maven.PROFILES_TEMPLATE % prof_str
 
+        cache_key = self.pom_cache.key(project['path'], profiles)
+        tree = self.pom_cache.get(project['name'], cache_key)
+        if tree is not None:
+            Instrumentation.count("maven.effective_pom_cache.hit")
+            return tree
+        Instrumentation.count("maven.effective_pom_cache.miss")
+
         tmp_pom_path = join(self.workspace.dir(), "." + project['name'] +
                             ".pom.xml")
         args = [self.executable, "-Doutput=" + tmp_pom_path, "help:effective-pom"]
         if prof_str:
             args.append(prof_str)
 
+        start = time.time()
         res = run(args,
                   capture_output=True,
                   encoding="utf-8",
                   cwd=project['path'])
+        self.history.record(project['name'], "help:effective-pom", " ".join(args),
+                            time.time() - start, res.returncode)
         if res.returncode:
             self.__print_error("Error generating effective pom.xml\n" + res.stdout)
             return None
 
         try:
             tree = etree.parse(open(tmp_pom_path, 'r'))
-            remove(tmp_pom_path)
+            self.pom_cache.put(project['name'], cache_key, tmp_pom_path)
             return tree
         except Exception as e:
             self.__print_error("Error parsing effective pom:\n" + str(e))
@@ -326,36 +579,39 @@ class Maven():
                                       dep['version'])] = dep
 
     def generate_classpath_entries(self, project):
-        """ Generates a list of entries to add to the classpath in order to """
-        """ run the provided project """
-        #TODO: fixme (add transitive dependencies)
-        self.__print_error("Not implemented!")
-        return None
-
+        """ Generates a list of entries to add to the classpath in order to
+            run the provided project. Transitive dependencies are resolved
+            from the local repository, open workspace projects are replaced
+            by their output directories. Raises a PomResolutionError if the
+            local repository lacks an artifact """
         config = project['maven_config']
-        entries = []
-        base = Maven.SETTINGS.repo_path()
-
-        skipdeps = []
-        
-        for proj in map(self.workspace.get_project, config['dep_projects']):
-            if proj['open']:
-                entries.append(proj['maven_config']['output_dir'])
+        workspace_projects = {}
+        local_poms = {}
+        for proj in list(self.workspace.projects().values()):
+            if proj['open'] and 'maven_info' in proj:
                 info = proj['maven_info']
-                depkey = Maven.DEP_KEY_TEMPLATE % (info['groupId'],
-                                                   info['artifact'],
+                coords = Maven.DEP_KEY_TEMPLATE % (info['groupId'],
+                                                   info['artifactId'],
                                                    info['version'])
-                skipdeps.append(depkey)
+                workspace_projects[coords] = proj
+                local_poms[coords] = join(proj['path'], 'pom.xml')
 
-        for depkey, dep in config['dependencies'].items():
-            if depkey in skipdeps:
+        model = self.pom_resolver.resolve(join(project['path'], 'pom.xml'),
+                                          config['selected_profiles'])
+        entries = []
+        for dep in self.repository.dependencies(model, local_poms):
+            coords = Maven.DEP_KEY_TEMPLATE % (dep['groupId'],
+                                               dep['artifactId'],
+                                               dep['version'])
+            if coords in workspace_projects:
+                entries.append(workspace_projects[coords]['maven_config']['output_dir'])
                 continue
 
-            path = join(base,
-                        dep['groupId'].replace(".", "/"),
-                        dep['artifactId'],
-                        dep['version'],
-                        dep['artifactId'] + "-" + dep['version'] + '.jar')
+            path = self.repository.artifact_path(dep)
+            if not path:
+                continue
+            if not exists(path):
+                raise PomResolutionError("Missing artifact '%s'" % path)
             entries.append(path)
 
         entries.append(config['output_dir'])
@@ -370,18 +626,94 @@ class Maven():
                                                   'version': info['version']}
         return join(Maven.SETTINGS.repo_path(), jar_file_path)
 
+    def classpath_cache(self, project):
+        """ Returns the persistent classpath cache of a project """
+        name = project['name']
+        if name not in self.classpath_caches:
+            self.classpath_caches[name] = ProjectSetting("classpath_cache",
+                                                         project,
+                                                         {'key': None,
+                                                          'classpath': None})
+        return self.classpath_caches[name]
+
+    def classpath_key(self, project):
+        """ Computes the key of a project's classpath. It changes whenever
+            the dependencies, the selected profiles, one of the contributing
+            poms or the coordinates of an open workspace project change """
+        config = project['maven_config']
+        workspace_projects = sorted([self.generate_jarfile_path(proj),
+                                     proj['maven_config']['output_dir']]
+                                    for proj in list(self.workspace.projects().values())
+                                    if proj['open'] and 'maven_info' in proj)
+        pom_key = self.pom_cache.key(project['path'], config['selected_profiles'])
+        key = dumps([config['dependencies'], config['selected_profiles'],
+                     pom_key, workspace_projects], sort_keys=True)
+        return sha1(key.encode("utf-8")).hexdigest()
+
+    @timed("maven.generate_classpath")
     def generate_classpath(self, project):
-        """ Generates a string with all classpath entries needed to run the provided project """
+        """ Generates a string with all classpath entries needed to run the
+            provided project. The result is cached across sessions until the
+            classpath key of the project changes """
+        cache = self.classpath_cache(project)
+        key = self.classpath_key(project)
+        if cache.key() == key and cache.classpath():
+            Instrumentation.count("maven.classpath_cache.hit")
+            return cache.classpath()
+        Instrumentation.count("maven.classpath_cache.miss")
+
+        start = time.time()
+        classpath = None
+        if Maven.SETTINGS.offline_classpath():
+            try:
+                classpath = ":".join(self.generate_classpath_entries(project))
+            except PomResolutionError as e:
+                self.__print("Falling back to maven: " + str(e))
+
+        if not classpath:
+            classpath = self.build_classpath(project)
+        self.history.record(project['name'], "classpath", "generate_classpath",
+                            time.time() - start, 0 if classpath else 1)
+        if not classpath:
+            return None
+
+        cache.set_key(key)
+        cache.set_classpath(classpath)
+        cache.save_later()
+        return classpath
+
+    def generate_classpath_async(self, project, on_done):
+        """ Generates the classpath of a project on the classpath pool, so
+            the classpaths of concurrently built projects are generated in
+            parallel. on_done is called with the classpath on the main
+            thread """
+        self.classpath_cache(project)
+
+        def generate():
+            classpath = None
+            try:
+                classpath = self.generate_classpath(project)
+            finally:
+                self.vim.async_call(on_done, classpath)
+
+        self.classpath_pool.submit(generate)
+
+    @timed("maven.build_classpath")
+    def build_classpath(self, project):
+        """ Lets maven build the classpath of the provided project """
         config = project['maven_config']
         tmp_cp_path = join(self.workspace.dir(), "." + project['name'] + "-cp.txt")
         args = [self.executable, "-Dmdep.outputFile=" + tmp_cp_path, "dependency:build-classpath"]
+        if config['selected_profiles']:
+            args.append(Maven.PROFILES_TEMPLATE % ",".join(config['selected_profiles']))
         res = run(args,
                   capture_output=True,
                   encoding="utf-8",
                   cwd=project['path'])
         if res.returncode:
             self.__print_error("Error generating classpath for project '" + project['name'] + "'\n" + res.stdout)
-            remove(tmp_cp_path)
+            if exists(tmp_cp_path):
+                remove(tmp_cp_path)
             return None
         cp = None
 
@@ -402,31 +734,10 @@ class Maven():
         entries.append(config['test_output_dir'])
         return ":".join(entries)
 
-    def process_added_project(self, project):
-        """ Should be called when a new maven project was added to update """
-        """ workspace dependencies """
-        info = project['maven_info']
-        config = project['maven_config']
-        name = project['name']
-        project_dep_key = Maven.DEP_KEY_TEMPLATE % (info['groupId'],
-                                                    info['artifactId'],
-                                                    info['version'])
-        for proj in self.workspace.projects().values():
-            if proj is not project and 'maven_info' in proj:
-                info_ = proj['maven_info']
-                config_ = proj['maven_config']
-                name_ = proj['name']
-                proj_dep_key = Maven.DEP_KEY_TEMPLATE % (info_['groupId'],
-                                                         info_['artifactId'],
-                                                         info_['version'])
-
-                if (project_dep_key in config_['dependencies'] and
-                   name not in config_['dep_projects']):
-                    config_['dep_projects'].append(name)
-
-                if (proj_dep_key in config['dependencies']
-                   and name_ not in config['dep_projects']):
-                    config['dep_projects'].append(name_)
+    def project_removed(self, project):
+        """ Drops a removed project from the dependency graph """
+        self.graph.remove_project(project['name'])
+        self.graph.save_later()
 
     def build_workspace(self):
         """ Build every maven project in the workspace """
@@ -438,59 +749,235 @@ class Maven():
                                    config['selected_profiles'],
                                    config['set_properties'])
 
-    def build_project_and_dependencies(self, project, callback=None):
-        projects = [project['name']]
-        for project_name in projects:
-            proj = self.workspace.projects()[project_name]
-            for _project_name in proj['maven_config']['dep_projects']:
-                if _project_name not in projects:
-                    projects.append(_project_name)
-        
-        projects = list(map(self.workspace.projects().__getitem__, projects))
-        build_order = []
-        while projects:
-            found = False
-            for i, project in enumerate(projects):
-                config = project['maven_config']
-                if not config['dep_projects']:
-                    build_order.append(project['name'])
-                    del projects[i]
-                    found = True
-                    break
-                else:
-                    all_met = True
-                    for name in config['dep_projects']:
-                        if name not in build_order:
-                            all_met = False
-                            break
-                    if all_met:
-                        build_order.append(project['name'])
-                        del projects[i]
-                        found = True
-                        break
-            if not found:
-                self.__print_error("Build dependency cycle detected!")
-                return
-
-        build_order = list(map(self.workspace.projects().__getitem__, build_order))
-        for i in reversed(range(len(build_order))):
-            project = build_order[i]
-            if not project['maven_config']['rebuild']:
-                del build_order[i]
+    def build_workers(self):
+        """ Number of projects built concurrently, defaults to the core count """
+        return Maven.SETTINGS.build_workers() or cpu_count() or 1
 
-        for i, project in enumerate(build_order):
+    @timed("maven.build_project_and_dependencies")
+    def build_project_and_dependencies(self, project, callback=None):
+        """ Builds every project the provided one depends on that needs to be
+            rebuilt. Independent projects are built concurrently, the
+            callback is called once all builds succeeded """
+        projects = self.workspace.projects()
+        try:
+            order = self.graph.build_order(project['name'])
+        except DependencyCycleError as e:
+            self.__print_error("Build dependency cycle detected: " + " -> ".join(e.cycle))
+            return
+
+        rebuild = [name for name in order
+                   if projects[name]['maven_config']['rebuild']]
+        if not rebuild:
+            if callback:
+                callback()
+            return
+
+        deleted = False
+        for name in rebuild:
+            deleted = self.prune_outputs(projects[name]) or deleted
+
+        incremental = False
+        if Maven.SETTINGS.incremental_compile() and not deleted:
+            dirty = {name: self.source_manifest(projects[name]).dirty() for name in rebuild}
+            # projects only marked because a dependency changed recompile the
+            # sources referencing the changed types
+            upstream = {name: sorted(path for dep in self.graph.closure(name)
+                                     if dep != name and dep in dirty
+                                     for path in dirty[dep])
+                        for name in rebuild}
+            incremental = all(self.compiler.can_compile(projects[name], dirty[name],
+                                                        upstream[name])
+                              for name in rebuild)
+
+        if not incremental:
+            # maven builds against the installed artifacts, the ones of
+            # projects compiled by javac are outdated
+            required = set()
+            for name in rebuild:
+                required |= self.graph.closure(name)
+            rebuild = [name for name in order
+                       if name in rebuild or (name in required and
+                                              projects[name]['maven_config'].get('install_stale'))]
+
+        # projects setting a property to different values are built separately
+        reactor = list(map(projects.__getitem__, rebuild))
+        if (not incremental and Maven.SETTINGS.reactor_build()
+                and ReactorBuildJob.merged_properties(reactor) is not None):
+            self.job_handler.start(ReactorBuildJob(reactor, ["compile", "install"], callback))
+            return
+
+        self.vim.call("setqflist", [], "r")
+
+        def on_done(success):
+            if success and callback:
+                callback()
+            elif not success:
+                RpcBatch(self.vim).command("echo \"Build failed!\"") \
+                                  .command("if len(getqflist()) | copen | endif") \
+                                  .send()
+
+        graph = JobGraph(on_done)
+        rebuilt = set(rebuild)
+        for name in rebuild:
+            cfg = projects[name]['maven_config']
+            if incremental:
+                job = JavacJob(projects[name],
+                               self.compiler.commands(projects[name], dirty[name],
+                                                      upstream[name]))
+            else:
+                job = BuildProjectJob(projects[name],
+                                      ["compile", "install"],
+                                      cfg['selected_profiles'],
+                                      cfg['set_properties'],
+                                      None,
+                                      True)
+            graph.add(name, job, self.rebuild_prerequisites(name, rebuilt))
+        graph.start(self.job_handler, self.build_workers())
+
+    def rebuild_prerequisites(self, name, rebuild):
+        """ Finds the nearest projects below the named one in the dependency
+            graph that are rebuilt """
+        prerequisites = set()
+        visited = set()
+        names = list(self.graph.dependencies(name))
+        while names:
+            dep_name = names.pop()
+            if dep_name in visited:
+                continue
+            visited.add(dep_name)
+            if dep_name in rebuild:
+                prerequisites.add(dep_name)
+            else:
+                names += self.graph.dependencies(dep_name)
+        return prerequisites
+
+    def prune_outputs(self, project):
+        """ Deletes the classes compiled from sources deleted or renamed since
+            the last build. Returns whether sources were deleted """
+        manifest = self.source_manifest(project)
+        for path in manifest.orphans():
+            try:
+                remove(path)
+            except OSError:
+                pass
+        return bool(manifest.deleted())
+
+    def source_manifest(self, project):
+        """ Returns the manifest of the compiled inputs of a project """
+        name = project['name']
+        if name not in self.source_manifests:
+            self.source_manifests[name] = SourceManifest(project)
+        return self.source_manifests[name]
+
+    def file_saved(self, project, path):
+        """ Marks the project for a rebuild if the saved file is one of its
+            compiled inputs and its content changed since the last build. The
+            projects depending on it are marked as well """
+        manifest = self.source_manifest(project)
+        if not manifest.update(path):
+            return
+
+        project['maven_config']['rebuild'] = True
+        if realpath(path) == manifest.pom_path():
+            self.update_dependencies(project)
+        self.mark_dependents(project)
+
+    def mark_dependents(self, project):
+        """ Marks every project depending on the provided one, directly or
+            transitively, for a rebuild """
+        projects = self.workspace.projects()
+        names = list(self.graph.dependents(project['name']))
+        visited = set()
+        while names:
+            name = names.pop()
+            if name in visited:
+                continue
+            visited.add(name)
+            projects[name]['maven_config']['rebuild'] = True
+            names += self.graph.dependents(name)
+
+    def update_dependencies(self, project):
+        """ Reads the dependencies of a project from its changed pom and
+            updates the dependency graph. The pom is resolved on a
+            background thread, maven may have to run for it, the result is
+            applied on the main thread unless the pom was saved again in the
+            meantime """
+        name = project['name']
+        self.pom_updates[name] = self.pom_updates.get(name, 0) + 1
+        update = self.pom_updates[name]
 
-            _callback = callback if i == len(build_order) - 1 else None
-            cfg = project['maven_config']
-            job = BuildProjectJob(project,
-                                  ["compile", "install"],
-                                  cfg['selected_profiles'],
-                                  cfg['set_properties'],
-                                  _callback,
-                                  True)
-            self.job_handler.start(job)
-        if not build_order and callback:
-            callback()
+        def apply(pom):
+            if self.pom_updates.get(name) != update:
+                return
+            del self.pom_updates[name]
+            if pom is None or self.workspace.projects().get(name) is not project:
+                return
+            self.process_pom(project, pom)
+            self.graph.update_projects([project])
+            self.graph.save_later()
+
+        def resolve():
+            pom = None
+            try:
+                pom = self.resolve_effective_pom(project)
+            finally:
+                self.vim.async_call(apply, pom)
+
+        Thread(target=resolve, daemon=True).start()
+
+    def project_built(self, project, on_ready=None):
+        """ Updates the configuration of a successfully built project. The
+            classpath is generated in the background, on_ready is called on
+            the main thread once it and the run configurations are updated """
+        config = project['maven_config']
+        config['last_built'] = time.time()
+        manifest = self.source_manifest(project)
+        manifest.record()
+        # files saved while building weren't compiled
+        config['rebuild'] = bool(manifest.dirty())
+        config['install_stale'] = False
+
+        def classpath_generated(classpath):
+            config['classpath'] = classpath
+            for run_config in project['run_configs'].values():
+                run_config.update()
+            if on_ready:
+                on_ready()
+        self.generate_classpath_async(project, classpath_generated)
+
+    def project_compiled(self, project):
+        """ Updates the configuration of a project compiled by javac. Its
+            artifact in the local repository is outdated until maven
+            installs it again """
+        config = project['maven_config']
+        config['last_built'] = time.time()
+        manifest = self.source_manifest(project)
+        manifest.record()
+        config['rebuild'] = bool(manifest.dirty())
+        config['install_stale'] = True
+
+    def create_reactor_pom(self, projects):
+        """ Writes an aggregator pom listing the provided projects as modules
+            and returns its path """
+        reactor_dir = join(self.workspace.settings_dir(), "reactor")
+        if not exists(reactor_dir):
+            makedirs(reactor_dir)
+
+        modules = "".join(Maven.REACTOR_MODULE_TEMPLATE % escape(relpath(proj['path'], reactor_dir))
+                          for proj in projects)
+        pom_path = join(reactor_dir, "pom.xml")
+        with open(pom_path, 'w') as f:
+            f.write(Maven.REACTOR_POM_TEMPLATE % modules)
+        return pom_path
+
+    def show_build_log(self, project, output):
+        """ Shows the output of a failed background build in the console """
+        RpcBatch(self.vim).command(RpcBatch.CLOSE_CONSOLE) \
+                          .command("bot 10sp | enew | setlocal buftype=nofile | file Console") \
+                          .call("setline", 1, output.split("\n")) \
+                          .command("normal G") \
+                          .send()
+        self.__print_error("Build of project '%s' failed!" % project['name'])
 
 
 class BuildProjectJob(Job):
@@ -500,30 +987,160 @@ class BuildProjectJob(Job):
         goals_ = " ".join(goals)
         profiles_ = ",".join(profiles or [])
         if profiles:
-            profiles_ = Maven.PROFILES_TEMPLATE % profiles_
-        props = " ".join(map(lambda k: Maven.PROPERTIES_TEMPLATE
-                             % (k, properties[k]), properties or []))
+            profiles_ = quote(Maven.PROFILES_TEMPLATE % profiles_)
+        props = " ".join(map(lambda k: quote(Maven.PROPERTIES_TEMPLATE
+                                             % (k, properties[k])), properties or []))
 
-        cmd = Maven.BUILD_TEMPLATE % (Maven.SETTINGS.executable(),
-                                     project['path'],
-                                     goals_,
+        cmd = Maven.BUILD_TEMPLATE % (quote(Maven.INSTANCE.executable),
+                                     quote(project['path']),
+                                     " ".join(map(quote, goals)),
                                      profiles_,
                                      props)
 
         def on_exit(result):
             if result.return_code == 0:
-                config = project['maven_config']
-                config['last_built'] = time.time()
-                config['classpath'] = Maven.INSTANCE.generate_classpath(project)
-                config['rebuild'] = False
-
-                for config in project['run_configs'].values():
-                    config.update()
-                if callback:
-                    callback()
+                def built():
+                    self.complete()
+                    if callback:
+                        callback()
+                self.defer()
+                Maven.INSTANCE.project_built(project, built)
+            else:
+                Maven.INSTANCE.build_failed()
+                if result.stdout:
+                    Maven.INSTANCE.show_build_log(project, result.stdout)
 
         super(BuildProjectJob, self).__init__("maven_build",
                                               project['path'],
                                               cmd,
                                               on_exit,
-                                              fail_clear)
+                                              fail_clear,
+                                              parse_errors=True)
+        self.goal = goals_
+
+
+class JavacJob(Job):
+    """ Compiles sources of a project directly with javac """
+
+    def __init__(self, project, commands, fail_clear=True):
+        self.project = project
+
+        def on_exit(result):
+            if result.return_code == 0:
+                Maven.INSTANCE.project_compiled(project)
+            else:
+                Maven.INSTANCE.show_build_log(project, (result.stdout or "") +
+                                              (result.stderr or ""))
+
+        super(JavacJob, self).__init__("javac",
+                                       project['path'],
+                                       " && ".join(commands) or "true",
+                                       on_exit,
+                                       fail_clear,
+                                       parse_errors=True)
+
+
+class ReactorBuildJob(Job):
+    """ Builds several projects with a single maven invocation through a
+        temporary aggregator pom. The reactor summary of the build log is
+        mapped back onto the state of each project """
+
+    def __init__(self, projects, goals, callback=None):
+        self.projects = projects
+        maven = Maven.INSTANCE
+        pom_path = maven.create_reactor_pom(projects)
+        reactor_dir = maven.workspace.settings_dir()
+        log_path = join(reactor_dir, "reactor", "build.log")
+        status_path = join(reactor_dir, "reactor", "status")
+
+        profiles = []
+        properties = ReactorBuildJob.merged_properties(projects)
+        if properties is None:
+            raise ValueError("The projects set conflicting properties")
+        for proj in projects:
+            config = proj['maven_config']
+            profiles += [p for p in config['selected_profiles'] if p not in profiles]
+
+        profiles_ = ""
+        if profiles:
+            profiles_ = quote(Maven.PROFILES_TEMPLATE % ",".join(profiles))
+        props = " ".join(map(lambda k: quote(Maven.PROPERTIES_TEMPLATE
+                                             % (k, properties[k])), properties))
+
+        cmd = Maven.REACTOR_BUILD_TEMPLATE % (quote(maven.executable),
+                                              quote(pom_path),
+                                              " ".join(map(quote, goals)),
+                                              profiles_,
+                                              props,
+                                              quote(status_path),
+                                              quote(log_path),
+                                              quote(status_path))
+
+        def on_exit(result):
+            results = ReactorBuildJob.parse_summary(log_path)
+            built = []
+            for proj in projects:
+                info = proj['maven_info']
+                status = results.get(info['name'] or info['artifactId'])
+                if status is None:
+                    status = results.get(info['artifactId'])
+                if status == "SUCCESS" or (status is None and result.return_code == 0):
+                    built.append(proj)
+            if result.return_code != 0:
+                maven.build_failed()
+
+            def finished():
+                self.complete()
+                if callback and not any(proj['maven_config']['rebuild'] for proj in projects):
+                    callback()
+
+            # the callback waits for the classpaths of the built projects
+            pending = [len(built)]
+
+            def ready():
+                pending[0] -= 1
+                if not pending[0]:
+                    finished()
+
+            if not built:
+                finished()
+                return
+            self.defer()
+            for proj in built:
+                maven.project_built(proj, ready)
+
+        super(ReactorBuildJob, self).__init__("maven_build",
+                                              reactor_dir,
+                                              cmd,
+                                              on_exit,
+                                              True)
+        self.goal = "reactor " + " ".join(goals)
+
+    @staticmethod
+    def merged_properties(projects):
+        """ The properties set for the projects, a reactor build passes them
+            to every module. None if two projects set a property to
+            different values """
+        properties = {}
+        for proj in projects:
+            for key, value in proj['maven_config']['set_properties'].items():
+                if properties.setdefault(key, value) != value:
+                    return None
+        return properties
+
+    @staticmethod
+    def parse_summary(log_path):
+        """ Reads the module results of the reactor summary in a build log """
+        results = {}
+        if not exists(log_path):
+            return results
+
+        with open(log_path, 'r', errors="replace") as f:
+            for line in f:
+                match = Maven.REACTOR_SUMMARY_REGEX.match(line)
+                if match:
+                    name, status = match.groups()
+                    results[name] = status
+                    # multi-version reactors print the version after the name
+                    results[name.rsplit(" ", 1)[0]] = status
+        return results
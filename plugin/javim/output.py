@@ -0,0 +1,95 @@
+""" Generator pipelines processing the output of jobs line by line """
+from collections import deque
+import re
+
+
+MAVEN_MESSAGE_REGEX = re.compile(r"^\[(ERROR|WARNING)\] (/[^:\[]+\.java):\[(\d+),(\d+)\] (.*)$")
+JAVAC_MESSAGE_REGEX = re.compile(r"^(/[^:]+\.java):(\d+): (error|warning): (.*)$")
+DETAIL_REGEX = re.compile(r"^(\[ERROR\])?\s+(symbol|location|required|found|reason):\s*(.*)$")
+
+
+def coroutine(func):
+    """ Primes a generator based coroutine """
+    def start(*args, **kwargs):
+        gen = func(*args, **kwargs)
+        next(gen)
+        return gen
+    return start
+
+
+@coroutine
+def broadcast(*targets):
+    """ Sends every received item to all targets """
+    while True:
+        item = yield
+        for target in targets:
+            target.send(item)
+
+
+@coroutine
+def tail(lines):
+    """ Keeps the received lines in the provided bounded deque """
+    while True:
+        line = yield
+        if line is not None:
+            lines.append(line)
+
+
+@coroutine
+def compiler_messages(target):
+    """ Parses maven and javac compiler messages from the received lines and
+        sends them as quickfix entries to target. Detail lines like
+        'symbol: ...' are appended to the message before it is sent """
+    entry = None
+    while True:
+        line = yield
+        if line is None:
+            if entry:
+                target.send(entry)
+            entry = None
+            continue
+
+        detail = DETAIL_REGEX.match(line)
+        if entry and detail:
+            entry['text'] += " (%s: %s)" % (detail.group(2), detail.group(3))
+            continue
+
+        if entry:
+            target.send(entry)
+            entry = None
+
+        match = MAVEN_MESSAGE_REGEX.match(line)
+        if match:
+            kind, filename, lnum, col, text = match.groups()
+            entry = {'filename': filename, 'lnum': int(lnum), 'col': int(col),
+                     'type': kind[0], 'text': text}
+            continue
+
+        match = JAVAC_MESSAGE_REGEX.match(line)
+        if match:
+            filename, lnum, kind, text = match.groups()
+            entry = {'filename': filename, 'lnum': int(lnum), 'col': 0,
+                     'type': kind[0].upper(), 'text': text}
+
+
+@coroutine
+def quickfix(vim):
+    """ Appends the received entries to the quickfix list on the main thread.
+        Duplicates (maven repeats errors in its summary) are skipped """
+    seen = set()
+    while True:
+        entry = yield
+        key = (entry['filename'], entry['lnum'], entry['col'], entry['text'])
+        if key in seen:
+            continue
+        seen.add(key)
+        vim.async_call((lambda e: lambda: vim.call("setqflist", [e], "a"))(entry))
+
+
+def output_pipeline(vim, max_lines, parse_errors):
+    """ Creates the pipeline for one output stream of a job. Returns the
+        pipeline and the deque holding the last max_lines lines """
+    lines = deque(maxlen=max_lines)
+    if parse_errors:
+        return (broadcast(tail(lines), compiler_messages(quickfix(vim))), lines)
+    return (tail(lines), lines)
@@ -0,0 +1,857 @@
+""" This module provides helpers to work with pom.xml files without
+    spawning maven """
+from functools import lru_cache
+from hashlib import sha1
+from os import environ, listdir, makedirs, remove, replace, stat, dup2
+from os import devnull as devnull_path
+from os.path import join, exists, isdir, dirname, normpath, expanduser, realpath
+from shutil import which
+import platform
+import re
+import sys
+from lxml import etree
+
+
+PARENT_XPATH = "/ns:project/ns:parent"
+PARENT_GROUPID_XPATH = "ns:groupId/text()"
+PARENT_ARTIFACTID_XPATH = "ns:artifactId/text()"
+PARENT_VERSION_XPATH = "ns:version/text()"
+PARENT_RELATIVE_PATH_XPATH = "ns:relativePath"
+ARTIFACTID_XPATH = "/ns:project/ns:artifactId/text()"
+
+REPO_POM_TEMPLATE = "%(groupId)s/%(artifactId)s/%(version)s/%(artifactId)s-%(version)s.pom"
+
+USER_SETTINGS_PATH = expanduser("~/.m2/settings.xml")
+
+POM_NAMESPACE = "http://maven.apache.org/POM/4.0.0"
+PROPERTY_REGEX = re.compile(r"\$\{([^}]+)\}")
+JAVA_VERSION_REGEX = re.compile(r'JAVA_VERSION="([^"]+)"')
+VERSION_RANGE_REGEX = re.compile(r"([\[\(])\s*([^,\]\)]*?)\s*(?:,\s*([^\]\)]*?)\s*)?([\]\)])")
+
+
+def pom_namespace(tree):
+    """ Returns the namespace of the pom's root element """
+    root = tree.getroot()
+    return root.nsmap.get(root.prefix, "")
+
+
+def xpath(node, path, namespace):
+    """ Evaluates an xpath expression using the provided namespace """
+    return node.xpath(path, namespaces={'ns': namespace})
+
+
+def first(node, path, namespace, default=None):
+    """ Evaluates an xpath expression and returns the first result """
+    res = xpath(node, path, namespace)
+    return res[0].strip() if res else default
+
+
+def repo_pom_path(repo_path, group_id, artifact_id, version):
+    """ Builds the path of an artifact's pom inside the local repository """
+    return join(repo_path, REPO_POM_TEMPLATE % {'groupId': group_id.replace(".", "/"),
+                                                'artifactId': artifact_id,
+                                                'version': version})
+
+
+def locate_parent(pom_path, group_id, artifact_id, version, relative_path,
+                  repo_path):
+    """ Locates a parent pom, either via its relativePath or in the local
+        repository. Returns None if it can't be found """
+    if relative_path:
+        candidate = normpath(join(dirname(pom_path), relative_path))
+        if isdir(candidate):
+            candidate = join(candidate, "pom.xml")
+        if exists(candidate):
+            try:
+                candidate_tree = etree.parse(candidate)
+                candidate_ns = pom_namespace(candidate_tree)
+                if first(candidate_tree, ARTIFACTID_XPATH, candidate_ns) == artifact_id:
+                    return candidate
+            except etree.XMLSyntaxError:
+                pass
+
+    repo_pom = repo_pom_path(repo_path, group_id, artifact_id, version)
+    if exists(repo_pom):
+        return repo_pom
+
+    return None
+
+
+def parent_pom_path(pom_path, tree, repo_path):
+    """ Locates the parent pom of the pom at pom_path. Returns a tuple of the
+        parent's path (None if it can't be found) and its coordinates (None
+        if the pom has no parent) """
+    namespace = pom_namespace(tree)
+    parents = xpath(tree, PARENT_XPATH, namespace)
+    if not parents:
+        return (None, None)
+
+    parent = parents[0]
+    group_id = first(parent, PARENT_GROUPID_XPATH, namespace, "")
+    artifact_id = first(parent, PARENT_ARTIFACTID_XPATH, namespace, "")
+    version = first(parent, PARENT_VERSION_XPATH, namespace, "")
+    coords = "%s:%s:%s" % (group_id, artifact_id, version)
+
+    relative = xpath(parent, PARENT_RELATIVE_PATH_XPATH, namespace)
+    relative_path = "../pom.xml"
+    if relative:
+        relative_path = (relative[0].text or "").strip()
+
+    return (locate_parent(pom_path, group_id, artifact_id, version,
+                          relative_path, repo_path), coords)
+
+
+def pom_chain(pom_path, repo_path):
+    """ Collects the pom at pom_path and all of its parents. Returns a list
+        of paths and a list of parent coordinates that couldn't be found """
+    chain = []
+    missing = []
+    path = pom_path
+
+    while path and path not in chain:
+        chain.append(path)
+        try:
+            tree = etree.parse(path)
+        except (OSError, etree.XMLSyntaxError):
+            break
+        path, coords = parent_pom_path(path, tree, repo_path)
+        if coords and not path:
+            missing.append(coords)
+
+    return (chain, missing)
+
+
+class EffectivePomCache():
+    """ Disk-backed cache of effective poms. An entry is keyed by the content
+        of every pom that contributes to it and the selected profiles, so it
+        is invalidated as soon as one of them changes """
+
+    def __init__(self, directory, repo_path):
+        self.directory = directory
+        self.repo_path = repo_path
+
+        if not exists(self.directory):
+            makedirs(self.directory)
+
+    def key(self, project_path, profiles):
+        """ Computes the cache key of the project at project_path """
+        chain, missing = pom_chain(join(project_path, "pom.xml"), self.repo_path)
+        digest = sha1()
+
+        for path in chain:
+            digest.update(path.encode("utf-8"))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+
+        if exists(USER_SETTINGS_PATH):
+            with open(USER_SETTINGS_PATH, 'rb') as f:
+                digest.update(f.read())
+
+        for coords in missing:
+            digest.update(coords.encode("utf-8"))
+        digest.update(",".join(profiles).encode("utf-8"))
+
+        return digest.hexdigest()
+
+    def __path(self, project_name, key):
+        return join(self.directory, "%s.%s.xml" % (project_name.replace("/", "_"), key))
+
+    def get(self, project_name, key):
+        """ Returns the cached effective pom as xml tree or None """
+        path = self.__path(project_name, key)
+        if not exists(path):
+            return None
+
+        try:
+            return etree.parse(path)
+        except etree.XMLSyntaxError:
+            remove(path)
+            return None
+
+    def put(self, project_name, key, pom_path):
+        """ Moves the effective pom at pom_path into the cache, replacing
+            stale entries of the same project """
+        self.invalidate(project_name)
+        replace(pom_path, self.__path(project_name, key))
+
+    def invalidate(self, project_name):
+        """ Removes all cached effective poms of a project """
+        prefix = project_name.replace("/", "_") + "."
+        for file_name in listdir(self.directory):
+            if (file_name.startswith(prefix) and file_name.endswith(".xml")
+               and len(file_name) == len(prefix) + 40 + len(".xml")):
+                remove(join(self.directory, file_name))
+
+
+class PomResolutionError(Exception):
+    """ Raised when a pom can't be resolved without maven """
+
+
+def parse_activation(node, namespace):
+    """ Parses the activation of a pom or settings profile element """
+    def tag(name):
+        return "{%s}%s" % (namespace, name) if namespace else name
+
+    def text(node, name):
+        child = node.find(tag(name))
+        if child is None or child.text is None:
+            return None
+        return child.text.strip()
+
+    act = node.find(tag("activation"))
+    if act is None:
+        return None
+    os_node = act.find(tag("os"))
+    prop_node = act.find(tag("property"))
+    file_node = act.find(tag("file"))
+    return {'activeByDefault': text(act, "activeByDefault") == "true",
+            'jdk': text(act, "jdk"),
+            'os': None if os_node is None else
+            {etree.QName(n).localname: (n.text or "").strip() for n in os_node
+             if isinstance(n.tag, str)},
+            'property': None if prop_node is None else
+            {'name': text(prop_node, "name"),
+             'value': text(prop_node, "value")},
+            'file': None if file_node is None else
+            {'exists': text(file_node, "exists"),
+             'missing': text(file_node, "missing")}}
+
+
+def read_settings(path, mtime=None, size=None):
+    """ Reads the profiles of a maven settings.xml and the ids listed in
+        its activeProfiles. A missing file declares none """
+    if not exists(path):
+        return {'profiles': [], 'activeProfiles': []}
+    try:
+        root = etree.parse(path).getroot()
+    except etree.XMLSyntaxError as e:
+        raise PomResolutionError("Can't parse '%s': %s" % (path, str(e)))
+
+    namespace = root.nsmap.get(root.prefix, "")
+
+    def tag(name):
+        return "{%s}%s" % (namespace, name) if namespace else name
+
+    def children(node, name):
+        node = node.find(tag(name))
+        return [n for n in node if isinstance(n.tag, str)] if node is not None else []
+
+    profiles = []
+    for profile_node in children(root, "profiles"):
+        id_node = profile_node.find(tag("id"))
+        profiles.append({'id': (id_node.text or "").strip() if id_node is not None
+                               else "default",
+                         'activation': parse_activation(profile_node, namespace),
+                         'properties': {etree.QName(p).localname: (p.text or "").strip()
+                                        for p in children(profile_node, "properties")}})
+    return {'profiles': profiles,
+            'activeProfiles': [(n.text or "").strip()
+                               for n in children(root, "activeProfiles")]}
+
+
+def dependency_key(dep):
+    """ Builds the management key of a dependency """
+    return "%s:%s:%s:%s" % (dep['groupId'], dep['artifactId'],
+                            dep.get('type') or "jar",
+                            dep.get('classifier') or "")
+
+
+def merge_dependencies(target, source, source_dominant):
+    """ Merges two dependency lists the way maven's model merger does """
+    merged = {}
+    for dep in target:
+        merged[dependency_key(dep)] = dep
+    for dep in source:
+        key = dependency_key(dep)
+        if source_dominant or key not in merged:
+            merged[key] = dep
+    return list(merged.values())
+
+
+@lru_cache(maxsize=1)
+def java_version():
+    """ Detects the version of the default jdk from its release file """
+    homes = [environ.get('JAVA_HOME')]
+    java = which("java")
+    if java:
+        homes.append(dirname(dirname(realpath(java))))
+
+    for home in filter(None, homes):
+        release = join(home, "release")
+        if not exists(release):
+            continue
+        with open(release, 'r') as f:
+            match = JAVA_VERSION_REGEX.search(f.read())
+        if match:
+            return match.group(1)
+    return None
+
+
+def version_tuple(version):
+    """ Converts a version string into a comparable tuple """
+    return tuple(int(part) for part in re.findall(r"\d+", version))
+
+
+def matches_jdk(spec, version):
+    """ Evaluates a jdk profile activation against the provided version """
+    spec = spec.strip()
+    if spec.startswith("!"):
+        return not matches_jdk(spec[1:], version)
+
+    if not spec.startswith(("[", "(")):
+        return version.startswith(spec)
+
+    current = version_tuple(version)
+    for match in VERSION_RANGE_REGEX.finditer(spec):
+        lower_bound, lower, upper, upper_bound = match.groups()
+        if upper is None:
+            if current == version_tuple(lower):
+                return True
+            continue
+        if lower and (current < version_tuple(lower) or
+                      (lower_bound == "(" and current == version_tuple(lower))):
+            continue
+        if upper and (current > version_tuple(upper) or
+                      (upper_bound == ")" and current == version_tuple(upper))):
+            continue
+        return True
+    return False
+
+
+def os_family():
+    """ Returns the maven os family of the running system """
+    if sys.platform.startswith("win"):
+        return "windows"
+    if sys.platform == "darwin":
+        return "mac"
+    return "unix"
+
+
+class PomResolver():
+    """ Resolves poms in process: parent inheritance, profile activation,
+        ${property} interpolation and dependency management are applied like
+        maven does for an effective pom. Anything that can't be resolved
+        raises a PomResolutionError, so the caller can fall back to maven """
+
+    SUPER_BUILD = {'directory': "${project.basedir}/target",
+                   'sourceDirectory': "${project.basedir}/src/main/java",
+                   'testSourceDirectory': "${project.basedir}/src/test/java",
+                   'outputDirectory': "${project.build.directory}/classes",
+                   'testOutputDirectory': "${project.build.directory}/test-classes",
+                   'resources': ["${project.basedir}/src/main/resources"],
+                   'testResources': ["${project.basedir}/src/test/resources"]}
+
+    BUILD_DIRS = ['directory', 'sourceDirectory', 'testSourceDirectory',
+                  'outputDirectory', 'testOutputDirectory']
+
+    def __init__(self, repo_path, user_properties=None, cache_size=1024,
+                 settings_path=USER_SETTINGS_PATH):
+        self.repo_path = repo_path
+        self.user_properties = user_properties or {}
+        self.settings_path = settings_path
+        self.__cached_model = lru_cache(maxsize=cache_size)(self.__parse_model)
+        self.__cached_settings = lru_cache(maxsize=1)(read_settings)
+
+    def read_model(self, path):
+        """ Reads the raw model of the pom at path, parsed models are kept
+            in an lru cache until the file changes """
+        try:
+            stat_ = stat(path)
+        except OSError:
+            raise PomResolutionError("Can't read '%s'" % path)
+
+        return self.__cached_model(path, stat_.st_mtime_ns, stat_.st_size)
+
+    def settings(self):
+        """ Reads the user settings, kept until the file changes """
+        try:
+            stat_ = stat(self.settings_path)
+            return self.__cached_settings(self.settings_path, stat_.st_mtime_ns, stat_.st_size)
+        except OSError:
+            return read_settings(self.settings_path)
+
+    def __parse_model(self, path, mtime=None, size=None):
+        try:
+            root = etree.parse(path).getroot()
+        except etree.XMLSyntaxError as e:
+            raise PomResolutionError("Can't parse '%s': %s" % (path, str(e)))
+
+        namespace = root.nsmap.get(root.prefix, "")
+
+        def tag(name):
+            return "{%s}%s" % (namespace, name) if namespace else name
+
+        def text(node, name, default=None):
+            child = node.find(tag(name)) if node is not None else None
+            if child is None or child.text is None:
+                return default
+            return child.text.strip()
+
+        def children(node, *names):
+            for name in names:
+                node = node.find(tag(name)) if node is not None else None
+            return list(node) if node is not None else []
+
+        def local_name(node):
+            return etree.QName(node).localname
+
+        def dependencies(node):
+            deps = []
+            for dep_node in children(node, "dependencies"):
+                if not isinstance(dep_node.tag, str):
+                    continue
+                deps.append({'groupId': text(dep_node, "groupId"),
+                             'artifactId': text(dep_node, "artifactId"),
+                             'version': text(dep_node, "version"),
+                             'type': text(dep_node, "type"),
+                             'classifier': text(dep_node, "classifier"),
+                             'scope': text(dep_node, "scope"),
+                             'optional': text(dep_node, "optional"),
+                             'systemPath': text(dep_node, "systemPath"),
+                             'exclusions': [(text(e, "groupId"), text(e, "artifactId"))
+                                            for e in children(dep_node, "exclusions")
+                                            if isinstance(e.tag, str)]})
+            return deps
+
+        def model_base(node):
+            build = node.find(tag("build"))
+            base = {'properties': {local_name(p): (p.text or "").strip()
+                                   for p in children(node, "properties")
+                                   if isinstance(p.tag, str)},
+                    'dependencies': dependencies(node),
+                    'dependencyManagement': dependencies(node.find(tag("dependencyManagement"))),
+                    'modules': [m.text.strip() for m in children(node, "modules")
+                                if isinstance(m.tag, str) and m.text],
+                    'build': {}}
+
+            for name in PomResolver.BUILD_DIRS:
+                value = text(build, name)
+                if value:
+                    base['build'][name] = value
+            for name in ["resources", "testResources"]:
+                dirs = [text(r, "directory") for r in children(build, name)
+                        if isinstance(r.tag, str)]
+                if build is not None and build.find(tag(name)) is not None:
+                    base['build'][name] = list(filter(None, dirs))
+            return base
+
+        model = model_base(root)
+        parent = root.find(tag("parent"))
+        model.update({'path': path,
+                      'basedir': dirname(path),
+                      'namespace': namespace or POM_NAMESPACE,
+                      'parent': None,
+                      'groupId': text(root, "groupId"),
+                      'artifactId': text(root, "artifactId"),
+                      'version': text(root, "version"),
+                      'packaging': text(root, "packaging", "jar"),
+                      'name': text(root, "name"),
+                      'description': text(root, "description"),
+                      'url': text(root, "url"),
+                      'profiles': []})
+
+        if parent is not None:
+            relative = parent.find(tag("relativePath"))
+            model['parent'] = {'groupId': text(parent, "groupId"),
+                               'artifactId': text(parent, "artifactId"),
+                               'version': text(parent, "version"),
+                               'relativePath': "../pom.xml" if relative is None
+                                               else (relative.text or "").strip()}
+
+        for profile_node in children(root, "profiles"):
+            if not isinstance(profile_node.tag, str):
+                continue
+            profile = model_base(profile_node)
+            profile['id'] = text(profile_node, "id", "default")
+            profile['activation'] = parse_activation(profile_node, namespace)
+            model['profiles'].append(profile)
+
+        return model
+
+    def lineage(self, pom_path):
+        """ Returns the raw models of the pom and all of its parents, starting
+            with the pom itself """
+        models = [self.read_model(pom_path)]
+        while models[-1]['parent']:
+            model = models[-1]
+            parent = model['parent']
+            if any("${" in (parent[k] or "") for k in ["groupId", "artifactId", "version"]):
+                raise PomResolutionError("Parent of '%s' uses properties" % model['path'])
+
+            path = locate_parent(model['path'], parent['groupId'],
+                                 parent['artifactId'], parent['version'],
+                                 parent['relativePath'], self.repo_path)
+            if not path:
+                raise PomResolutionError("Can't find parent %s:%s:%s" % (parent['groupId'],
+                                                                         parent['artifactId'],
+                                                                         parent['version']))
+            if any(m['path'] == path for m in models):
+                raise PomResolutionError("Parent cycle at '%s'" % path)
+            models.append(self.read_model(path))
+        return models
+
+    def is_active(self, profile, basedir, properties=None):
+        """ Evaluates the activation of a profile, all conditions must match.
+            Property conditions are checked against properties, the user
+            properties by default """
+        act = profile['activation']
+        properties = self.user_properties if properties is None else properties
+        if not act:
+            return False
+
+        conditions = []
+        if act['jdk']:
+            version = java_version()
+            if not version:
+                raise PomResolutionError("Can't detect jdk version for profile '%s'" % profile['id'])
+            conditions.append(matches_jdk(act['jdk'], version))
+
+        if act['os']:
+            if 'version' in act['os']:
+                raise PomResolutionError("Can't evaluate os version of profile '%s'" % profile['id'])
+            actual = {'family': os_family(),
+                      'name': platform.system().lower(),
+                      'arch': {'x86_64': 'amd64'}.get(platform.machine(), platform.machine())}
+            for key, expected in act['os'].items():
+                negate = expected.startswith("!")
+                expected = expected.lstrip("!").lower()
+                matches = (actual.get(key) == expected or
+                           (key == 'family' and expected == 'unix' and actual['family'] == 'mac'))
+                conditions.append(matches != negate)
+
+        if act['property'] and act['property']['name']:
+            name = act['property']['name']
+            negate = name.startswith("!")
+            value = properties.get(name.lstrip("!"))
+            expected = act['property']['value']
+            if expected is None:
+                conditions.append((value is not None) != negate)
+            elif expected.startswith("!"):
+                conditions.append(value != expected[1:])
+            else:
+                conditions.append(value == expected)
+
+        if act['file']:
+            for key, should_exist in [('exists', True), ('missing', False)]:
+                path_ = act['file'][key]
+                if path_:
+                    path_ = path_.replace("${project.basedir}", basedir)
+                    path_ = path_.replace("${basedir}", basedir)
+                    if "${" in path_:
+                        raise PomResolutionError("Can't evaluate file activation '%s'" % path_)
+                    conditions.append(exists(join(basedir, path_)) == should_exist)
+
+        if not conditions:
+            return False
+        return all(conditions)
+
+    def active_profiles(self, model, profiles, properties=None):
+        """ Determines the active profiles of a raw model """
+        selected = [p for p in profiles if not p.startswith(("!", "-"))]
+        deactivated = [p[1:] for p in profiles if p.startswith(("!", "-"))]
+        basedir = model['basedir']
+
+        active = [p for p in model['profiles'] if p['id'] not in deactivated
+                  and (p['id'] in selected or self.is_active(p, basedir, properties))]
+        if not active:
+            active = [p for p in model['profiles'] if p['id'] not in deactivated
+                      and p['activation'] and p['activation']['activeByDefault']]
+        return active
+
+    @staticmethod
+    def inject_profile(model, profile):
+        """ Injects an active profile into a model, the profile dominates """
+        model['properties'] = dict(model['properties'], **profile['properties'])
+        model['dependencies'] = merge_dependencies(model['dependencies'],
+                                                   profile['dependencies'], True)
+        model['dependencyManagement'] = merge_dependencies(model['dependencyManagement'],
+                                                           profile['dependencyManagement'],
+                                                           True)
+        model['modules'] = model['modules'] + [m for m in profile['modules']
+                                               if m not in model['modules']]
+        model['build'] = dict(model['build'], **profile['build'])
+
+    @staticmethod
+    def inherit(parent, child):
+        """ Assembles the child model with its parent, the child dominates """
+        model = dict(child)
+        for key in ['groupId', 'version', 'description']:
+            model[key] = child[key] or parent[key]
+        if not child['url'] and parent['url']:
+            model['url'] = parent['url'].rstrip("/") + "/" + child['artifactId']
+        model['properties'] = dict(parent['properties'], **child['properties'])
+        model['dependencies'] = merge_dependencies(child['dependencies'],
+                                                   parent['dependencies'], False)
+        model['dependencyManagement'] = merge_dependencies(child['dependencyManagement'],
+                                                           parent['dependencyManagement'],
+                                                           False)
+        model['build'] = dict(parent['build'], **child['build'])
+        return model
+
+    def settings_profiles(self, basedir, profiles):
+        """ Applies the user settings to the selected profiles. Returns the
+            selection extended by the activeProfiles of the settings and the
+            properties of the active settings profiles """
+        settings = self.settings()
+        selected = list(profiles) + settings['activeProfiles']
+        properties = {}
+        for profile in self.active_profiles({'profiles': settings['profiles'],
+                                             'basedir': basedir}, selected):
+            properties.update(profile['properties'])
+        return selected, properties
+
+    def resolve(self, pom_path, profiles=(), _importing=()):
+        """ Resolves the model of the pom at pom_path with the provided
+            profiles selected. Profiles the user settings activate apply as
+            they do for maven """
+        profiles, settings_properties = self.settings_profiles(dirname(pom_path), profiles)
+        properties = dict(settings_properties, **self.user_properties)
+        models = []
+        profile_ids = []
+        for raw in self.lineage(pom_path):
+            model = dict(raw, build=dict(raw['build']))
+            for profile in self.active_profiles(raw, profiles, properties):
+                PomResolver.inject_profile(model, profile)
+            model['profiles'] = [p['id'] for p in raw['profiles']]
+            profile_ids += [p for p in model['profiles'] if p not in profile_ids]
+            models.append(model)
+
+        model = models.pop()
+        model['build'] = dict(PomResolver.SUPER_BUILD, **model['build'])
+        while models:
+            model = PomResolver.inherit(model, models.pop())
+        model['profiles'] = profile_ids
+        model['properties'] = dict(model['properties'], **settings_properties)
+
+        self.interpolate(model)
+        self.import_management(model, _importing)
+        self.inject_management(model)
+        return model
+
+    def interpolate(self, model):
+        """ Replaces ${...} expressions of a model in place """
+        basedir = model['basedir']
+        parent = model['parent'] or {}
+        system = {'user.home': expanduser("~"),
+                  'user.dir': basedir,
+                  'user.name': environ.get('USER', ""),
+                  'file.separator': "/",
+                  'path.separator': ":",
+                  'line.separator': "\n",
+                  'maven.repo.local': self.repo_path}
+
+        def lookup(expr, stack):
+            if expr in stack:
+                raise PomResolutionError("Recursive expression '${%s}'" % expr)
+            value = None
+            field = expr
+            for prefix in ["project.", "pom."]:
+                if expr.startswith(prefix):
+                    field = expr[len(prefix):]
+            if field in ['basedir', 'baseUri']:
+                value = basedir
+            elif expr != field and field in ['groupId', 'artifactId', 'version',
+                                             'name', 'packaging', 'description',
+                                             'url']:
+                value = model[field]
+            elif expr != field and field.startswith("build."):
+                value = model['build'].get(field[len("build."):])
+            elif expr != field and field.startswith("parent."):
+                value = parent.get(field[len("parent."):])
+            elif expr in self.user_properties:
+                value = self.user_properties[expr]
+            elif expr in model['properties']:
+                value = model['properties'][expr]
+            elif expr.startswith("env."):
+                value = environ.get(expr[len("env."):])
+            else:
+                value = system.get(expr)
+
+            if value is None or not isinstance(value, str):
+                raise PomResolutionError("Can't resolve '${%s}' in '%s'" % (expr, model['path']))
+            return substitute(value, stack + [expr])
+
+        def substitute(value, stack=[]):
+            if value is None or "${" not in value:
+                return value
+            return PROPERTY_REGEX.sub(lambda m: lookup(m.group(1), stack), value)
+
+        def lenient(value):
+            try:
+                return substitute(value)
+            except PomResolutionError:
+                return value
+
+        for key in ['groupId', 'artifactId', 'version']:
+            model[key] = substitute(model[key])
+        for key in ['name', 'description', 'url']:
+            model[key] = lenient(model[key])
+        model['properties'] = {k: lenient(v) for k, v in model['properties'].items()}
+
+        build = {}
+        for key in PomResolver.BUILD_DIRS:
+            build[key] = substitute(model['build'][key])
+        for key in ['resources', 'testResources']:
+            build[key] = [substitute(d) for d in model['build'][key]]
+        model['build'] = build
+        for key in PomResolver.BUILD_DIRS:
+            build[key] = normpath(join(basedir, build[key]))
+        for key in ['resources', 'testResources']:
+            build[key] = [normpath(join(basedir, d)) for d in build[key]]
+
+        for key in ['dependencies', 'dependencyManagement']:
+            model[key] = [dict(dep,
+                               **{k: substitute(dep[k]) for k in
+                                  ['groupId', 'artifactId', 'version', 'type',
+                                   'classifier', 'scope', 'optional',
+                                   'systemPath']},
+                               exclusions=[(substitute(g), substitute(a))
+                                           for g, a in dep['exclusions']])
+                          for dep in model[key]]
+
+    def import_management(self, model, importing):
+        """ Replaces imported boms in the dependency management with their
+            managed dependencies """
+        managed = []
+        imported = []
+        for dep in model['dependencyManagement']:
+            if dep['scope'] == "import" and (dep['type'] or "jar") == "pom":
+                coords = "%s:%s:%s" % (dep['groupId'], dep['artifactId'], dep['version'])
+                if coords in importing:
+                    raise PomResolutionError("Import cycle at '%s'" % coords)
+                path = repo_pom_path(self.repo_path, dep['groupId'],
+                                     dep['artifactId'], dep['version'])
+                if not exists(path):
+                    raise PomResolutionError("Can't find imported pom %s" % coords)
+                bom = self.resolve(path, (), tuple(importing) + (coords,))
+                imported += bom['dependencyManagement']
+            else:
+                managed.append(dep)
+        model['dependencyManagement'] = merge_dependencies(managed, imported, False)
+
+    def inject_management(self, model):
+        """ Applies the dependency management to the dependencies """
+        managed = {dependency_key(dep): dep for dep in model['dependencyManagement']}
+        dependencies = []
+        for dep in model['dependencies']:
+            dep = dict(dep)
+            mdep = managed.get(dependency_key(dep))
+            if mdep:
+                for key in ['version', 'scope', 'optional', 'systemPath']:
+                    if not dep[key]:
+                        dep[key] = mdep[key]
+                if not dep['exclusions']:
+                    dep['exclusions'] = mdep['exclusions']
+            if not dep['version']:
+                raise PomResolutionError("No version for dependency %s:%s in '%s'"
+                                         % (dep['groupId'], dep['artifactId'], model['path']))
+            dep['type'] = dep['type'] or "jar"
+            dep['scope'] = dep['scope'] or "compile"
+            dep['optional'] = dep['optional'] == "true"
+            dependencies.append(dep)
+        model['dependencies'] = dependencies
+
+    def effective_pom(self, pom_path, profiles=()):
+        """ Resolves the pom at pom_path and creates an xml tree shaped like
+            maven's effective pom """
+        model = self.resolve(pom_path, profiles)
+        namespace = model['namespace']
+
+        def element(parent, name, value=None):
+            elem = etree.SubElement(parent, "{%s}%s" % (namespace, name))
+            if value is not None:
+                elem.text = str(value)
+            return elem
+
+        def dependencies(parent, deps):
+            deps_elem = element(parent, "dependencies")
+            for dep in deps:
+                dep_elem = element(deps_elem, "dependency")
+                for key in ['groupId', 'artifactId', 'version', 'type',
+                            'classifier', 'scope', 'systemPath']:
+                    if dep[key]:
+                        element(dep_elem, key, dep[key])
+                if dep['optional'] in [True, "true"]:
+                    element(dep_elem, "optional", "true")
+                if dep['exclusions']:
+                    excl_elem = element(dep_elem, "exclusions")
+                    for group_id, artifact_id in dep['exclusions']:
+                        exclusion = element(excl_elem, "exclusion")
+                        element(exclusion, "groupId", group_id)
+                        element(exclusion, "artifactId", artifact_id)
+
+        root = etree.Element("{%s}project" % namespace, nsmap={None: namespace})
+        element(root, "modelVersion", "4.0.0")
+        for key in ['groupId', 'artifactId', 'version', 'packaging', 'name',
+                    'description', 'url']:
+            if model[key]:
+                element(root, key, model[key])
+
+        if model['modules']:
+            modules = element(root, "modules")
+            for module in model['modules']:
+                element(modules, "module", module)
+
+        properties = element(root, "properties")
+        for key, value in model['properties'].items():
+            element(properties, key, value)
+
+        dependencies(element(root, "dependencyManagement"), model['dependencyManagement'])
+        dependencies(root, model['dependencies'])
+
+        build = element(root, "build")
+        for key in PomResolver.BUILD_DIRS:
+            element(build, key, model['build'][key])
+        resources = element(build, "resources")
+        for directory in model['build']['resources']:
+            element(element(resources, "resource"), "directory", directory)
+        resources = element(build, "testResources")
+        for directory in model['build']['testResources']:
+            element(element(resources, "testResource"), "directory", directory)
+
+        profiles_elem = element(root, "profiles")
+        for profile_id in model['profiles']:
+            element(element(profiles_elem, "profile"), "id", profile_id)
+
+        return etree.ElementTree(root)
+
+
+@lru_cache(maxsize=None)
+def shared_resolver(repo_path):
+    """ The resolver reused by the calls within one worker process """
+    return PomResolver(repo_path)
+
+
+def init_worker():
+    """ Initializer of the process pool workers. Detaches them from the
+        standard streams they inherit, which carry the rpc channel of the
+        nvim host """
+    devnull = open(devnull_path, 'r+b')
+    for fd in [0, 1]:
+        dup2(devnull.fileno(), fd)
+
+
+def resolve_project_pom(directory, repo_path, profiles=()):
+    """ Entry point for process pool workers. Resolves the pom in the
+        directory and returns the name of the project, its effective pom
+        serialized as xml and the directories of the modules it
+        aggregates. The name is taken from the interpolated effective
+        pom """
+    resolver = shared_resolver(repo_path)
+    pom_path = join(directory, "pom.xml")
+    model = resolver.read_model(pom_path)
+    tree = resolver.effective_pom(pom_path, profiles)
+    namespace = pom_namespace(tree)
+    name = (first(tree, "/ns:project/ns:name/text()", namespace)
+            or first(tree, "/ns:project/ns:artifactId/text()", namespace))
+    return (name, etree.tostring(tree), module_dirs(model))
+
+
+def module_dirs(model):
+    """ Directories of the modules of a raw model, modules may name the
+        module directory or its pom file """
+    dirs = []
+    for module in model['modules']:
+        path = normpath(join(model['basedir'], module))
+        dirs.append(dirname(path) if path.endswith(".xml") else path)
+    return dirs
@@ -0,0 +1,107 @@
+""" This module resolves transitive dependencies from the local maven
+    repository without spawning maven """
+from collections import deque
+from functools import lru_cache
+from os.path import join, exists
+from .pom import PomResolver, PomResolutionError, dependency_key, repo_pom_path
+
+
+class LocalRepository():
+    """ Resolves dependency trees by walking the .pom files of the local
+        repository. Conflicts are mediated the maven way: the nearest
+        declaration wins, on equal depth the first one """
+
+    # effective scope of a transitive dependency, indexed by the scope of
+    # the dependency that pulled it in and its own scope
+    SCOPES = {'compile': {'compile': 'compile', 'runtime': 'runtime'},
+              'provided': {'compile': 'provided', 'runtime': 'provided'},
+              'runtime': {'compile': 'runtime', 'runtime': 'runtime'},
+              'test': {'compile': 'test', 'runtime': 'test'},
+              'system': {}}
+
+    EXTENSIONS = {'jar': 'jar', 'test-jar': 'jar', 'bundle': 'jar',
+                  'maven-plugin': 'jar', 'ejb': 'jar', 'war': 'war',
+                  'ear': 'ear', 'rar': 'rar'}
+
+    def __init__(self, repo_path, resolver=None, cache_size=1024):
+        self.repo_path = repo_path
+        self.resolver = resolver if resolver else PomResolver(repo_path)
+        self.artifact_model = lru_cache(maxsize=cache_size)(self.__artifact_model)
+
+    def __artifact_model(self, group_id, artifact_id, version):
+        path = repo_pom_path(self.repo_path, group_id, artifact_id, version)
+        if not exists(path):
+            raise PomResolutionError("Can't find pom of %s:%s:%s"
+                                     % (group_id, artifact_id, version))
+        return self.resolver.resolve(path)
+
+    def artifact_path(self, dep):
+        """ Returns the path of a dependency's file inside the local
+            repository, None for dependencies without a file """
+        if dep['scope'] == "system":
+            return dep.get('systemPath')
+
+        dep_type = dep.get('type') or "jar"
+        if dep_type == "pom":
+            return None
+
+        classifier = dep.get('classifier')
+        if dep_type == "test-jar" and not classifier:
+            classifier = "tests"
+        file_name = "%s-%s%s.%s" % (dep['artifactId'], dep['version'],
+                                    "-" + classifier if classifier else "",
+                                    LocalRepository.EXTENSIONS.get(dep_type, dep_type))
+        return join(self.repo_path, dep['groupId'].replace(".", "/"),
+                    dep['artifactId'], dep['version'], file_name)
+
+    @staticmethod
+    def is_excluded(dep, exclusions):
+        """ Checks the dependency against (groupId, artifactId) exclusions """
+        for group_id, artifact_id in exclusions:
+            if (group_id in ["*", dep['groupId']] and
+               artifact_id in ["*", dep['artifactId']]):
+                return True
+        return False
+
+    def dependencies(self, model, local_poms=None):
+        """ Resolves the transitive dependencies of a resolved model. Poms of
+            artifacts that aren't installed yet (e.g. workspace projects) can
+            be supplied by coordinates in local_poms """
+        local_poms = local_poms or {}
+        managed = {dependency_key(dep): dep for dep in model['dependencyManagement']}
+        resolved = {}
+        queue = deque((dep, dep['scope'], frozenset(dep['exclusions']))
+                      for dep in model['dependencies'])
+
+        while queue:
+            dep, scope, exclusions = queue.popleft()
+            key = dependency_key(dep)
+            if key in resolved:
+                continue
+            resolved[key] = dict(dep, scope=scope)
+
+            if scope == "system":
+                continue
+
+            coords = "%s:%s:%s" % (dep['groupId'], dep['artifactId'], dep['version'])
+            if coords in local_poms:
+                dep_model = self.resolver.resolve(local_poms[coords])
+            else:
+                dep_model = self.artifact_model(dep['groupId'], dep['artifactId'],
+                                                dep['version'])
+            for child in dep_model['dependencies']:
+                if child['optional'] or LocalRepository.is_excluded(child, exclusions):
+                    continue
+
+                mdep = managed.get(dependency_key(child))
+                if mdep:
+                    child = dict(child,
+                                 version=mdep['version'] or child['version'],
+                                 scope=mdep['scope'] or child['scope'])
+
+                child_scope = LocalRepository.SCOPES[scope].get(child['scope'])
+                if child_scope:
+                    queue.append((child, child_scope,
+                                  exclusions.union(child['exclusions'])))
+
+        return list(resolved.values())
@@ -0,0 +1,53 @@
+""" Batches requests to neovim into a single round trip """
+from pynvim.api import NvimError
+
+from .instrument import timed
+
+
+class RpcBatch():
+    """ Queues api requests and sends them at once with nvim_call_atomic.
+        The results are returned in the order the requests were queued. As
+        context manager the batch is sent when the block is left without an
+        exception """
+
+    CLOSE_CONSOLE = ('if bufnr("Console") != -1 | '
+                     'execute "bwipeout! " . bufnr("Console") | endif')
+
+    def __init__(self, vim):
+        self.vim = vim
+        self.requests = []
+
+    def request(self, method, *args):
+        self.requests.append([method, list(args)])
+        return self
+
+    def command(self, cmd):
+        return self.request("nvim_command", cmd)
+
+    def eval(self, expr):
+        return self.request("nvim_eval", expr)
+
+    def call(self, name, *args):
+        return self.request("nvim_call_function", name, list(args))
+
+    @timed("rpc.call_atomic")
+    def send(self):
+        """ Sends the queued requests and returns their results, raises a
+            NvimError if one of them failed. Requests after the failed one
+            are not executed """
+        if not self.requests:
+            return []
+        requests, self.requests = self.requests, []
+        results, error = self.vim.api.call_atomic(requests)
+        if error:
+            index, _, message = error
+            raise NvimError("Request %i of batch (%s) failed: %s"
+                            % (index, requests[index][0], message))
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
@@ -1,25 +1,43 @@
 """ Provides configuration objects persistent in the workspace """
 
 from enum import Enum
-from os import path, environ, mkdir, symlink, unlink
-from os.path import join, exists, normpath, basename, expanduser
+from os import path, environ, mkdir, symlink, unlink, replace, fsync, sep
+from os.path import join, exists, normpath, basename, dirname, expanduser, realpath, islink
 from shutil import rmtree
 from subprocess import Popen
 from json import dumps, loads
+from hashlib import sha1
+from threading import Lock
 import atexit
 import re
 
+from .instrument import Instrumentation, timed
+from .util_classes import PathTrie, DelayedAction
+
 class PersistentSetting():
-    """ Represents an object that is persistent across sessions """
+    """ Represents an object that is persistent across sessions. A setting is
+        only written if its serialized content differs from what was last
+        read or written, the file is replaced atomically so a crash never
+        leaves a truncated setting behind """
 
     SETTINGS = []
+    SAVE_DELAY = 2
+    INDENT = None
 
     def __init__(self, directory, name, defaults, cleanup_func=None, on_load=None):
         self.path = path.join(directory, name) + ".json"
         self.__cleanup = cleanup_func
+        self.lock = Lock()
+        self.delayed_save = DelayedAction(PersistentSetting.SAVE_DELAY, self.__save_delayed)
+        self.digest = None
+        self.pending = None
         if exists(self.path):
             with open(self.path, 'r') as f:
                 self.data = loads(f.read())
+            for key in defaults:
+                if key not in self.data:
+                    self.data[key] = defaults[key]
+            self.digest = PersistentSetting.__digest(self.__serialize())
         else:
             self.data = defaults
 
@@ -32,17 +50,58 @@ class PersistentSetting():
         PersistentSetting.SETTINGS.append(self)
         self.on_load = on_load
 
+    @staticmethod
+    def __digest(content):
+        return sha1(content.encode("utf-8")).hexdigest()
+
+    def __serialize(self):
+        data = self.__cleanup(self.data) if self.__cleanup else self.data
+        if self.INDENT:
+            return dumps(data, indent=self.INDENT)
+        return dumps(data, separators=(',', ':'))
 
+    @timed("settings.save")
     def _save(self):
-        if self.__cleanup:
-            self.__cleanup(self.data)
-
-        with open(self.path, 'w') as f:
-            f.write(dumps(self.data, indent=4))
+        """ Writes the setting if it changed, returns whether it was written """
+        self.delayed_save.cancel()
+        with self.lock:
+            self.pending = None
+            return self.__write(self.__serialize())
+
+    def __write(self, content):
+        digest = PersistentSetting.__digest(content)
+        if digest == self.digest and exists(self.path):
+            Instrumentation.count("settings.save.clean")
+            return False
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+            f.flush()
+            fsync(f.fileno())
+        replace(tmp_path, self.path)
+        self.digest = digest
+        return True
+
+    def save_later(self):
+        """ Saves the setting in the background once it wasn't saved again
+            for SAVE_DELAY seconds. The content is serialized right away by
+            the thread changing the setting, the timer only writes it """
+        content = self.__serialize()
+        with self.lock:
+            self.pending = content
+        self.delayed_save.reset()
+
+    def __save_delayed(self):
+        with self.lock:
+            content, self.pending = self.pending, None
+            if content is not None:
+                self.__write(content)
 
     def _load(self):
         with open(self.path, 'r') as f:
             self.data = loads(f.read())
+        self.digest = PersistentSetting.__digest(self.__serialize())
 
         for key in self.data:
             setattr(self,
@@ -56,6 +115,7 @@ class PersistentSetting():
 
     @staticmethod
     def save_all():
+        """ Writes every changed setting """
         for setting in PersistentSetting.SETTINGS:
             setting._save()
 
@@ -81,9 +141,124 @@ class GlobalSetting(PersistentSetting):
                                             cleanup_func)
 
 
+class ProjectShard(PersistentSetting):
+    """ The configuration of a workspace project that isn't part of the
+        workspace index """
+
+    def __init__(self, workspace, project):
+        directory = join(workspace.settings_dir(), "projects")
+        if not exists(directory):
+            mkdir(directory)
+        self.project = project
+        super(ProjectShard, self).__init__(directory,
+                                           project['name'].replace(sep, "_"),
+                                           {},
+                                           self.__cleanup__)
+
+    def __cleanup__(self, data):
+        # the project takes the data over once the shard is loaded
+        if self.project.shard is not self:
+            return data
+        return self.project.shard_data()
+
+
+class LazyProject(dict):
+    """ A project of the workspace. Only the keys of the workspace index are
+        read at startup, the rest of the configuration is loaded from the
+        project's shard when one of its keys is accessed first """
+
+    INDEX_KEYS = ('name', 'path', 'settings_dir', 'dir_name', 'open', 'built',
+                  'run_config_names', 'run_configs')
+
+    def __init__(self, workspace, data):
+        data = dict(data)
+        shard_keys = data.pop('shard_keys', None)
+        super(LazyProject, self).__init__(data)
+        self.workspace = workspace
+        self.shard_keys = set(shard_keys or ())
+        self.shard = None
+        if shard_keys is None:
+            # new project or one of a workspace stored in a single file
+            self.load()
+
+    def load(self):
+        """ Loads the configuration from the shard, returns the shard """
+        if self.shard is None:
+            Instrumentation.count("workspace.shard.load")
+            self.shard = ProjectShard(self.workspace, self)
+            for key, value in self.shard.data.items():
+                dict.setdefault(self, key, value)
+        return self.shard
+
+    def loaded(self):
+        return self.shard is not None
+
+    def shard_data(self):
+        return {key: value for key, value in dict.items(self)
+                if key not in LazyProject.INDEX_KEYS}
+
+    def index_data(self):
+        data = {key: dict.__getitem__(self, key) for key in LazyProject.INDEX_KEYS
+                if dict.__contains__(self, key)}
+        data['run_configs'] = {}
+        data['shard_keys'] = sorted(self.shard_data() if self.loaded() else self.shard_keys)
+        return data
+
+    def __missing__(self, key):
+        if self.loaded() or key not in self.shard_keys:
+            raise KeyError(key)
+        self.load()
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return (dict.__contains__(self, key)
+                or (not self.loaded() and key in self.shard_keys))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def __delitem__(self, key):
+        self.load()
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self.load()
+        return dict.pop(self, key, *default)
+
+    def keys(self):
+        self.load()
+        return dict.keys(self)
+
+    def values(self):
+        self.load()
+        return dict.values(self)
+
+    def items(self):
+        self.load()
+        return dict.items(self)
+
+    def __iter__(self):
+        self.load()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self.load()
+        return dict.__len__(self)
+
+    def copy(self):
+        return dict(self.items())
+
+
 # pylint: disable=no-member
 class Workspace(GlobalSetting):
-    """ A workspace is a collection of projects """
+    """ A workspace is a collection of projects. The workspace file only
+        holds an index of the projects, their configuration is stored in a
+        shard per project and loaded on first access """
 
     INSTANCE = None
 
@@ -99,17 +274,21 @@ class Workspace(GlobalSetting):
 
         Workspace.INSTANCE = self
 
-        self.listeners = {
-            'project_open': list(),
-            'project_close': list()
-        }
-
         if not path.exists(self.dir()):
             mkdir(self.dir())
 
         if not path.exists(self.settings_dir()):
             mkdir(self.settings_dir())
 
+        self.set_projects({name: LazyProject(self, project)
+                           for name, project in self.projects().items()})
+
+        self.listeners = {
+            'project_open': list(),
+            'project_close': list(),
+            'project_remove': list()
+        }
+
         def load_configs(provider):
             for project_name in self.projects():
                 project = self.projects()[project_name]
@@ -119,23 +298,57 @@ class Workspace(GlobalSetting):
 
         RunConfiguration.PROVIDER_REGISTER_HOOKS.append(load_configs)
 
+        self.project_paths = PathTrie()
         for project_name in self.projects():
             project = self.projects()[project_name]
             project['run_configs'] = {}
+            if project['open']:
+                self.project_paths.insert(realpath(project['path']), project_name)
             for config in project['run_config_names'].values():
                 if config['provider_name'] in RunConfiguration.PROVIDER:
                     RunConfiguration.PROVIDER[config['provider_name']].load_config_func(config['config_name'], project)
 
 
     def __cleanup__(self, data):
-        for project_name in data['projects']:
-            data['projects'][project_name]['run_configs'] = {}
+        """ The index of the projects without the run configuration objects,
+            the rest of their configuration is saved to their shards """
+        projects = {name: project.index_data() if isinstance(project, LazyProject) else project
+                    for name, project in data['projects'].items()}
+        return dict(data, projects=projects)
+
+    def _save(self):
+        """ Saves the changed project shards before the index referring to
+            them """
+        for project in self.projects().values():
+            if project.loaded():
+                project.shard._save()
+        return super(Workspace, self)._save()
+
+    def save_later(self):
+        """ Takes the snapshots of the loaded project shards before the
+            index referring to them """
+        for project in self.projects().values():
+            if project.loaded():
+                project.shard.save_later()
+        super(Workspace, self).save_later()
+
+    def replace_project(self, name, data):
+        """ Replaces the configuration of a project keeping its run
+            configurations """
+        project = self.projects()[name]
+        project.load()
+        data['run_configs'] = project['run_configs']
+        dict.clear(project)
+        dict.update(project, data)
+        return project
 
     def import_project(self, name, directory):
-        """ Adds a project to the workspace by creating a dynamic link """
+        """ Adds a project to the workspace by creating a dynamic link,
+            projects already located in the workspace directory aren't
+            linked """
         if name not in self.projects():
             dir_name = basename(normpath(directory))
-            self.projects()[name] = {
+            self.projects()[name] = LazyProject(self, {
                 'name': name,
                 'path': directory,
                 'settings_dir': join(directory, ".settings"),
@@ -143,9 +356,11 @@ class Workspace(GlobalSetting):
                 'open': True,
                 'built': False,
                 'run_config_names': {},
-                'run_configs': {}}
-            symlink(directory, join(self.dir(), dir_name))
+                'run_configs': {}})
+            if realpath(dirname(normpath(directory))) != realpath(self.dir()):
+                symlink(directory, join(self.dir(), dir_name))
             project = self.projects()[name]
+            self.project_paths.insert(realpath(directory), name)
             if not exists(project['settings_dir']):
                 mkdir(project['settings_dir'])
                 
@@ -156,15 +371,16 @@ class Workspace(GlobalSetting):
         """ Adds a project to the workspace. The directory must already
             exist """
         if name not in self.projects():
-            self.projects()[name] = {'name': name,
-                                     'path': join(self.dir(), name),
-                                     'dir_name': name,
-                                     'open': True,
-                                     'built': False,
-                                     'run_config_names': {},
-                                     'run_configs': {}}
+            self.projects()[name] = LazyProject(self, {'name': name,
+                                                       'path': join(self.dir(), name),
+                                                       'dir_name': name,
+                                                       'open': True,
+                                                       'built': False,
+                                                       'run_config_names': {},
+                                                       'run_configs': {}})
             project = self.projects()[name]
             project['settings_dir'] = join(project['path'], ".settings")
+            self.project_paths.insert(realpath(project['path']), name)
 
             if not exists(project['settings_dir']):
                 mkdir(project['settings_dir'])
@@ -176,9 +392,15 @@ class Workspace(GlobalSetting):
         """ Remove a project from the workspace """
         if name in self.projects():
             project = self.projects()[name]
-            self.close_project(name)
+            self.close_project(project)
             rmtree(project['settings_dir'])
-            del self.projects[name]
+            shard = project.load()
+            PersistentSetting.SETTINGS.remove(shard)
+            if exists(shard.path):
+                unlink(shard.path)
+            del self.projects()[name]
+            for listener in self.listeners['project_remove']:
+                listener(project)
 
     def get_project(self, name):
         """ Retrieves the project by name """
@@ -186,11 +408,22 @@ class Workspace(GlobalSetting):
             return self.projects()[name]
         return None
 
+    def find_project(self, file_path):
+        """ Finds the open project containing the file, symlinks are
+            resolved so files opened through the workspace directory are
+            found as well. Nested modules take precedence over their
+            parents """
+        name = self.project_paths.find(realpath(file_path))
+        return self.projects()[name] if name else None
+
     def close_project(self, project):
         """ Close the project """
         if project['open']:
             project['open'] = False
-            unlink(join(self.dir(), project['dir_name']))
+            self.project_paths.remove(realpath(project['path']))
+            link = join(self.dir(), project['dir_name'])
+            if islink(link):
+                unlink(link)
             for listener in self.listeners['project_close']:
                 listener(project)
 
@@ -198,7 +431,10 @@ class Workspace(GlobalSetting):
         """ Open the project """
         if not project['open']:
             project['open'] = True
-            symlink(self.dir(), project['dir_name'])
+            self.project_paths.insert(realpath(project['path']), project['name'])
+            link = join(self.dir(), project['dir_name'])
+            if not exists(link):
+                symlink(project['path'], link)
             for listener in self.listeners['project_open']:
                 listener(project)
 
@@ -227,6 +463,8 @@ class RunConfigurationProvider():
 
 class RunConfiguration(ProjectSetting):
 
+    # run configurations are edited by hand
+    INDENT = 4
     PROVIDER = {}
     PROVIDER_REGISTER_HOOKS = []
 
@@ -27,14 +27,14 @@ class DeleteOffsetChainUpdate(OffsetChainUpdate):
         self.del_indexes = del_indexes
 
     def perform_update(self, chain):
-        min_index = None
-        for index in self.del_indexes:
+        # descending, removing an element shifts the ones after it
+        for index in sorted(set(self.del_indexes), reverse=True):
             chain.remove(index, False)
-            if min_index is None or index < min_index:
-                min_index = index
-        return min_index
+        return min(self.del_indexes) if self.del_indexes else None
 
 class ReplaceRangeOffsetChainUpdate(OffsetChainUpdate):
+    """ Replaces the elements from start to end (exclusive) by elements with
+        the provided lengths. start == end inserts, no lengths delete """
 
     def __init__(self, start, end, lengths):
         self.start = start
@@ -42,25 +42,22 @@ class ReplaceRangeOffsetChainUpdate(OffsetChainUpdate):
         self.lengths = lengths
 
     def perform_update(self, chain):
-        first = chain.elements[self.start]
-        last = chain.elements[self.end - 1]
+        prev_elem = chain.elements[self.start - 1] if self.start else None
+        next_elem = chain.elements[self.end] if self.end < len(chain.elements) else None
 
-        for index in range(self.end, self.start, -1):
-            del chain.elements[index - 1]
+        elements = [OffsetChainElement(chain, length) for length in self.lengths]
+        chain.elements[self.start:self.end] = elements
 
-        prev_elem = first.prev_elem
-        index = self.start
-        for length in self.lengths:
-            elem = OffsetChainElement(chain, length, prev_elem)
+        for elem in elements:
+            elem.prev_elem = prev_elem
             if prev_elem:
                 prev_elem.next_elem = elem
-            chain.elements.insert(index, elem)
-            index += 1
             prev_elem = elem
 
-        if last.next_elem:
-            prev_elem.next_elem = last.next_elem
-            last.next_elem.prev_elem = prev_elem
+        if prev_elem:
+            prev_elem.next_elem = next_elem
+        if next_elem:
+            next_elem.prev_elem = prev_elem
 
         return self.start
 
@@ -86,7 +83,18 @@ class OffsetChain:
 
     def mass_update(self, update: OffsetChainUpdate):
         index = update.perform_update(self)
-        self.update(self.elements[index])
+        if index is not None and index < len(self.elements):
+            self.update(self.elements[index])
+
+    def offset(self, index):
+        """ Offset of the element at index, the total length for the index
+            after the last element """
+        if index < len(self.elements):
+            return self.elements[index].offset
+        if not self.elements:
+            return 0
+        last = self.elements[-1]
+        return last.offset + last.length
 
     def append(self, length):
         elem = OffsetChainElement(self, length)
@@ -107,6 +115,7 @@ class OffsetChain:
             if next_elem.prev_elem:
                 next_elem.prev_elem.next_elem = elem
             next_elem.prev_elem = elem
+            self.elements.insert(index, elem)
             if update: self.update(elem)
 
     def remove(self, index, update=True):
@@ -166,9 +175,12 @@ class DelayedAction:
     def reset(self):
         self.switch.set_off()
         self.switch = Switch(True)
-        self.thread = Thread(target=self.__run__, args=(self.switch,))
+        self.thread = Thread(target=self.__run__, args=(self.switch,), daemon=True)
         self.thread.start()
 
+    def cancel(self):
+        self.switch.set_off()
+
     def __run__(self, switch):
         sleep(self.delay)
         if switch.on: self.action()
@@ -177,3 +189,45 @@ class DelayedAction:
 
 
 
+
+
+class PathTrie:
+    """ Maps directories to values, a lookup finds the value of the deepest
+        directory containing a path in O(path depth) """
+
+    def __init__(self):
+        self.root = {}
+
+    @staticmethod
+    def __parts(path):
+        return [part for part in path.split("/") if part]
+
+    def insert(self, path, value):
+        node = self.root
+        for part in PathTrie.__parts(path):
+            node = node.setdefault(part, {})
+        node[None] = value
+
+    def remove(self, path):
+        nodes = [self.root]
+        parts = PathTrie.__parts(path)
+        for part in parts:
+            if part not in nodes[-1]:
+                return
+            nodes.append(nodes[-1][part])
+        nodes[-1].pop(None, None)
+
+        for part, node in zip(reversed(parts), reversed(nodes[:-1])):
+            if node[part]:
+                break
+            del node[part]
+
+    def find(self, path):
+        node = self.root
+        value = node.get(None)
+        for part in PathTrie.__parts(path):
+            node = node.get(part)
+            if node is None:
+                break
+            value = node.get(None, value)
+        return value